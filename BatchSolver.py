@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import time
+from array import array
+import numpy as np
+from GridWorld import GridWorld
+from NumpyBackend import shiftedPlanes, blockedMasks, actionWeights, maxExpectedUtility, expectedUtility
+from Policy import Policy
+
+#===============================================================================
+# BatchSolver - the value iteration of many worlds of the same size at once:
+#		they are stacked in arrays of shape (B, rows, columns) and every
+#		sweep updates all of them with the stencil of NumpyBackend
+#===============================================================================
+
+class BatchSolver:
+
+	'''the worlds can differ in everything but the size: cells, rewards, probabilities, discount factor
+		and limits (see GridWorld.setAlgorithmRestrictions). Each one stops with the auto rule of
+		Policy.setStoppingRule (bound when its discount factor is less than 1, span when it is 1),
+		the ones that stop leave the stack, so they don't cost the sweeps of the others
+	'''
+	__slots__ = ("worlds",
+				 "valueIterationEpsilon",	#of the bound stopping rule, see Policy
+				 "stopTolerance",			#of the span stopping rule
+				 "values",					#(B, rows, columns) utilities, 0 for the walls
+				 "iterations",				#sweeps of each world
+				 "converged",
+				 "stopReasons",				#one of the Policy.REASON_ constants for each world
+				 "elapsed",
+				 "__cells",
+				 "__live",
+				 "__blocked",
+				 "__reward",
+				 "__weights",
+				 "__discount")
+
+	def __init__(self, worlds):
+		self.worlds = list(worlds)
+		if not self.worlds: raise Exception("no worlds to solve")
+		c, r = self.worlds[0].size
+		for w in self.worlds:
+			if w.size != (c, r): raise Exception("all the worlds must have the same size")
+		self.valueIterationEpsilon = Policy.VALUE_ITERATION_EPSILON
+		self.stopTolerance = 1e-6
+		self.values = self.iterations = self.converged = self.stopReasons = None
+		self.elapsed = 0
+
+		B = len(self.worlds)
+		self.__cells = np.stack([ np.frombuffer(w.cellCodes(), dtype = np.uint8).reshape(r, c) for w in self.worlds ])
+		self.__blocked = blockedMasks(self.__cells == GridWorld.CELL_WALL)
+		#the void cells that can reach an exit or a pit, see TransitionModel
+		reach = np.zeros((B, r * c), dtype = bool)
+		for b, w in enumerate(self.worlds):
+			reach[b, np.frombuffer(w.cellOfState, dtype = np.int32)] = np.frombuffer(w.terminalReachability(), dtype = np.uint8).astype(bool)
+		self.__live = reach.reshape(B, r, c) & (self.__cells == GridWorld.CELL_VOID)
+		rewards = np.array([ [ w.rew[t] for t in range(4) ] for w in self.worlds ], dtype = float)
+		self.__reward = rewards[np.arange(B)[:, None, None], self.__cells]
+		self.__weights = np.array([ actionWeights(w) for w in self.worlds ], dtype = float)
+		self.__discount = np.array([ w.discFactor for w in self.worlds ], dtype = float)
+
+	@staticmethod
+	def parameterVariants(world, params):
+		'''the copies of world with the parameters of each dictionary of params, its keys are the ones of
+			Sweep.parameterGrid ("stepReward", "discount", "forward", "left", "right", "backward") and
+			"pitReward", "exitReward": the missing ones keep the values of world
+		'''
+		res = []
+		cells, columns = world.cellCodes(), world.size[0]
+		for p in params:
+			w = GridWorld(cells, p.get("discount", world.discFactor), columns)
+			w.setRewards(p.get("stepReward", world.rew[GridWorld.CELL_VOID]), p.get("pitReward", world.rew[GridWorld.CELL_PIT]),
+						 p.get("exitReward", world.rew[GridWorld.CELL_EXIT]))
+			w.setProbabilities(p.get("forward", world.prob[GridWorld.PROB_FORWARD]), p.get("left", world.prob[GridWorld.PROB_LEFT]),
+							   p.get("right", world.prob[GridWorld.PROB_RIGHT]), p.get("backward", world.prob[GridWorld.PROB_BACKWARD]))
+			w.setAlgorithmRestrictions(world.numberOfIterations, world.timeToLive)
+			res.append(w)
+		return res
+
+	def __initialValues(self):
+		'''the exits and the pits have their reward, the void cells that can't reach them the step
+			reward forever (see TransitionModel.fixedUtilities), the others 0
+		'''
+		values = np.where(self.__cells == GridWorld.CELL_WALL, 0, self.__reward)
+		closed = (self.__cells == GridWorld.CELL_VOID) & ~self.__live
+		dfact = self.__discount[:, None, None]
+		with np.errstate(divide = 'ignore', invalid = 'ignore'):
+			forever = np.where(dfact < 1, self.__reward / (1 - dfact), np.sign(self.__reward) * np.inf)
+		values[closed] = np.nan_to_num(forever, nan = 0.0, posinf = np.inf, neginf = -np.inf)[closed]
+		values[self.__live] = 0
+		return values
+
+	def solve(self):
+		'''runs the value iteration of all the worlds, returns the array of their iterations'''
+		B = len(self.worlds)
+		start = time.perf_counter()
+		self.values = self.__initialValues()
+		self.iterations = np.zeros(B, dtype = int)
+		self.converged = np.zeros(B, dtype = bool)
+		self.stopReasons = [ None ] * B
+
+		dfact = self.__discount
+		span = dfact == 1
+		with np.errstate(divide = 'ignore'):
+			thresholds = np.where(span, self.stopTolerance, self.valueIterationEpsilon * (1 - dfact) / dfact)
+		maxIterations = np.array([ w.numberOfIterations for w in self.worlds ])
+		timeToLive = np.array([ w.timeToLive for w in self.worlds ], dtype = float)
+
+		#the arrays of the worlds still in the stack
+		active = np.arange(B)
+		grid, live, reward = self.values.copy(), self.__live, self.__reward
+		blocked, weights = self.__blocked, self.__weights
+		iteration = 0
+		while len(active):
+			iteration += 1
+			dfactA = dfact[active][:, None, None]
+			table = [ [ weights[:, a, d, None, None] for d in range(4) ] for a in range(4) ]
+			#the cells that aren't live can have infinite utilities, their nan updates are thrown away
+			with np.errstate(invalid = 'ignore'):
+				new = np.where(live, reward + dfactA * maxExpectedUtility(grid, blocked, table), grid)
+			change = np.where(live, new - grid, 0)
+			grid = new
+
+			maxNorm = np.abs(change).max(axis = (1, 2))
+			spread = change.max(axis = (1, 2)) - change.min(axis = (1, 2))
+			done = np.where(span[active], spread, maxNorm) <= thresholds[active]
+			elapsed = time.perf_counter() - start
+			limit = (iteration >= maxIterations[active]) | (elapsed > timeToLive[active])
+			ended = done | limit
+			if not ended.any(): continue
+
+			for i in np.flatnonzero(ended):
+				b = active[i]
+				self.values[b] = grid[i]
+				self.iterations[b] = iteration
+				self.converged[b] = done[i]
+				if done[i]: self.stopReasons[b] = Policy.REASON_CONVERGED
+				elif iteration >= maxIterations[b]: self.stopReasons[b] = Policy.REASON_ITERATIONS
+				else: self.stopReasons[b] = Policy.REASON_TIME
+			keep = ~ended
+			active, grid, live, reward, weights = active[keep], grid[keep], live[keep], reward[keep], weights[keep]
+			blocked = tuple(mask[keep] for mask in blocked)
+
+		self.elapsed = time.perf_counter() - start
+		return self.iterations
+
+	#===========================================================================
+	# Results
+	#===========================================================================
+
+	def utilities(self, b):
+		'''the utilities of the states of the world b, like Policy.values'''
+		w = self.worlds[b]
+		return array('d', self.values[b].ravel()[np.frombuffer(w.cellOfState, dtype = np.int32)].tobytes())
+
+	def policyCodes(self, b):
+		'''the greedy policy of the world b, like Policy.policyCodes (NO_ACTION for the exits and the pits)'''
+		w = self.worlds[b]
+		planes = shiftedPlanes(self.values[b], tuple(mask[b] for mask in self.__blocked))
+		weights = self.__weights[b]
+		with np.errstate(invalid = 'ignore'):
+			sums = np.stack([ expectedUtility(planes, weights[a]) for a in range(4) ])
+		#the first of the best actions, like Policy
+		codes = np.argmax(np.nan_to_num(sums, nan = -np.inf), axis = 0).astype(np.uint8)
+		codes[self.__cells[b] != GridWorld.CELL_VOID] = Policy.NO_ACTION
+		return array('B', codes.ravel()[np.frombuffer(w.cellOfState, dtype = np.int32)].tobytes())
+
+	def policy(self, b):
+		'''a Policy of the world b with its results, to draw them, query them or save them like the ones
+			of a Policy solve
+		'''
+		p = Policy(self.worlds[b])
+		p.loadResults(self.utilities(b), self.policyCodes(b))
+		p.numOfIterations = int(self.iterations[b])
+		p.converged = bool(self.converged[b])
+		p.stopReason = self.stopReasons[b]
+		p.elapsed = self.elapsed
+		return p
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	import random
+
+	#the same map with many parameters, and many maps with the same parameters
+	w = GridWorld([[GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_EXIT],
+				   [GridWorld.CELL_VOID, GridWorld.CELL_WALL, GridWorld.CELL_VOID, GridWorld.CELL_PIT],
+				   [GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID]], discountFactor = 1)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 10)
+	params = [ {"stepReward": s, "discount": d, "forward": f, "left": (1 - f) / 2, "right": (1 - f) / 2}
+			   for s in (-0.04, -0.4, -2) for d in (0.5, 0.9, 1) for f in (0.8, 1) ]
+
+	random.seed(1)
+	maps = []
+	for _ in range(200):
+		cells = [ [ (GridWorld.CELL_WALL if random.random() < 0.2 else GridWorld.CELL_VOID) for _ in range(20) ] for _ in range(20) ]
+		cells[random.randrange(20)][random.randrange(20)] = GridWorld.CELL_EXIT
+		cells[random.randrange(20)][random.randrange(20)] = GridWorld.CELL_PIT
+		m = GridWorld(cells, discountFactor = 0.95)
+		m.setRewards(-0.04, -1, 1)
+		m.setProbabilities(0.8, 0.1, 0.1, 0)
+		m.setAlgorithmRestrictions(1000, 60)
+		maps.append(m)
+
+	batches = {}
+	for name, worlds in (("parameters", BatchSolver.parameterVariants(w, params)), ("maps", maps)):
+		batch = batches[name] = BatchSolver(worlds)
+		batch.solve()
+		start = time.perf_counter()
+		diff, same, iterations = 0, 0, 0
+		for b, world in enumerate(worlds):
+			p = Policy(world, backend = Policy.BACKEND_NUMPY)
+			p.valueIteration()
+			iterations += p.numOfIterations == batch.iterations[b]
+			diff = max(diff, max(abs(u - v) for u, v in zip(p.values, batch.utilities(b))))
+			same += p.policyCodes() == batch.policyCodes(b)
+		print("%s: %d worlds in %.3f secs (one at a time %.3f secs), same iterations %d, same policy %d, max difference %g" %
+			  (name, len(worlds), batch.elapsed, time.perf_counter() - start, iterations, same, diff))
+	p = batches["parameters"].policy(0)
+	print("%s, iterations %d (%s)" % (params[0], p.numOfIterations, p.stopReason))
+	print(p.policyToString())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+from GridWorld import GridWorld
+from Policy import Policy
+from Reporter import Reporter
+import Headless
+
+#===============================================================================
+# World generators - reproducible worlds of any size, the same kind, size and
+#		     seed always give the same cells
+#===============================================================================
+
+def openWorld(size, rnd):
+	'''an open field like the one of the book: a wall near the top left corner, the exit in the
+		top right corner and a pit below it
+	'''
+	cells = [ [ GridWorld.CELL_VOID ] * size for _ in range(size) ]
+	if size > 2: cells[1][1] = GridWorld.CELL_WALL
+	cells[0][size - 1] = GridWorld.CELL_EXIT
+	if size > 1: cells[1][size - 1] = GridWorld.CELL_PIT
+	return cells
+
+def mazeWorld(size, rnd):
+	'''a perfect maze (a single path between any two cells) dug with a depth first visit, the
+		exit is in the farthest corner from the start and a few pits are in the corridors
+	'''
+	cells = [ [ GridWorld.CELL_WALL ] * size for _ in range(size) ]
+	n = (size + 1) // 2	#the rooms are the cells with even coordinates
+	visited = bytearray(n * n)
+	stack = [ (0, 0) ]
+	visited[0] = 1
+	cells[0][0] = GridWorld.CELL_VOID
+	while stack:
+		x, y = stack[-1]
+		moves = [ (x + dx, y + dy) for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0))
+				  if 0 <= x + dx < n and 0 <= y + dy < n and not visited[(y + dy) * n + x + dx] ]
+		if not moves:
+			stack.pop()
+			continue
+		nx, ny = rnd.choice(moves)
+		visited[ny * n + nx] = 1
+		cells[y + ny][x + nx] = GridWorld.CELL_VOID	#the wall between the two rooms
+		cells[2 * ny][2 * nx] = GridWorld.CELL_VOID
+		stack.append((nx, ny))
+	for _ in range(size * size // 200):
+		x, y = rnd.randrange(size), rnd.randrange(size)
+		if cells[y][x] == GridWorld.CELL_VOID and (x, y) != (0, 0): cells[y][x] = GridWorld.CELL_PIT
+	cells[2 * (n - 1)][2 * (n - 1)] = GridWorld.CELL_EXIT
+	return cells
+
+def pitsWorld(size, rnd):
+	'''an open field where 20% of the cells are pits, the exit is in the top right corner'''
+	cells = [ [ (GridWorld.CELL_PIT if rnd.random() < 0.2 else GridWorld.CELL_VOID) for _ in range(size) ] for _ in range(size) ]
+	cells[0][size - 1] = GridWorld.CELL_EXIT
+	return cells
+
+def exitsWorld(size, rnd):
+	'''an open field with 10% of walls, 3% of exits and 3% of pits (at least one exit)'''
+	cells = []
+	for _ in range(size):
+		row = []
+		for _ in range(size):
+			r = rnd.random()
+			if r < 0.03: row.append(GridWorld.CELL_EXIT)
+			elif r < 0.06: row.append(GridWorld.CELL_PIT)
+			elif r < 0.16: row.append(GridWorld.CELL_WALL)
+			else: row.append(GridWorld.CELL_VOID)
+		cells.append(row)
+	cells[0][size - 1] = GridWorld.CELL_EXIT
+	return cells
+
+WORLD_KINDS = {"open": openWorld, "maze": mazeWorld, "pits": pitsWorld, "exits": exitsWorld}
+
+def generateWorld(kind, size, seed = 0):
+	'''the cells of a size x size world of the given kind (see WORLD_KINDS)'''
+	if kind not in WORLD_KINDS: raise Exception("unknown world kind: %s" % kind)
+	return WORLD_KINDS[kind](size, random.Random("%s-%d-%d" % (kind, size, seed)))
+
+#===============================================================================
+# Solver modes - the algorithm options of the solve command for each mode
+#===============================================================================
+
+SOLVER_MODES = {
+	"vi":             {"algorithm": "vi", "turbo": False, "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE},
+	"vi-turbo":       {"algorithm": "vi", "turbo": True,  "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE},
+	"vi-numpy":       {"algorithm": "vi", "turbo": False, "backend": Policy.BACKEND_NUMPY,  "evaluation": Policy.EVALUATION_ITERATIVE},
+	"vi-numpy-turbo": {"algorithm": "vi", "turbo": True,  "backend": Policy.BACKEND_NUMPY,  "evaluation": Policy.EVALUATION_ITERATIVE},
+	"vi-parallel":    {"algorithm": "vi", "turbo": False, "backend": Policy.BACKEND_PARALLEL, "evaluation": Policy.EVALUATION_ITERATIVE},
+	"ps":             {"algorithm": "ps", "turbo": False, "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE},
+	"tvi":            {"algorithm": "tvi", "turbo": False, "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE},
+	"mrvi":           {"algorithm": "mrvi", "turbo": False, "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE},
+	"pi":             {"algorithm": "pi", "turbo": False, "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE},
+	"pi-exact":       {"algorithm": "pi", "turbo": False, "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_EXACT},
+	"mpi":            {"algorithm": "pi", "turbo": False, "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE, "depth": Policy.DEPTH_ADAPTIVE},
+	"mpi-turbo":      {"algorithm": "pi", "turbo": True,  "backend": Policy.BACKEND_PYTHON, "evaluation": Policy.EVALUATION_ITERATIVE, "depth": Policy.DEPTH_ADAPTIVE},
+}
+
+#===============================================================================
+# Benchmark - every case runs in a new process, so that its peak memory is
+#	      not hidden by the ones before it
+#===============================================================================
+
+def _peakMemory():
+	'''the peak resident memory of this process in MB (ru_maxrss is in KB on Linux, in bytes on macOS)'''
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def runCase(case):
+	'''generates the world of the case and solves it, returns the measures as a dictionary'''
+	args = argparse.Namespace(**case["options"])
+	args.__dict__.update(SOLVER_MODES[case["mode"]])
+	#the optional modules are loaded before the clock starts
+	if args.backend == Policy.BACKEND_NUMPY: import NumpyBackend
+	if args.backend == Policy.BACKEND_PARALLEL: import ParallelBackend
+	if args.evaluation == Policy.EVALUATION_EXACT: import ExactEvaluation
+
+	t0 = time.perf_counter()
+	w = GridWorld(generateWorld(case["kind"], case["size"], case["seed"]), discountFactor = args.discount)
+	Headless.configureWorld(w, args)
+	p = Headless.newPolicy(w, args, Reporter())
+	setup = time.perf_counter() - t0
+	worldMemory = _peakMemory()
+
+	Headless.runSolver(p, args)
+	res = dict(kind = case["kind"], size = case["size"], mode = case["mode"], seed = case["seed"],
+			   states = w.numStates, sweeps = p.numOfIterations, backups = p.numOfBackups,
+			   converged = p.converged, stopReason = p.stopReason, wall = p.elapsed, cpu = p.cpuElapsed, setup = setup)
+	res["residual"] = p.residual()
+	res["worldMemory"] = worldMemory
+	res["peakMemory"] = _peakMemory()
+	return res
+
+def benchmarkCases(kinds, sizes, modes, options, seed = 0):
+	return [ {"kind": kind, "size": size, "mode": mode, "seed": seed, "options": options}
+			 for size in sizes for kind in kinds for mode in modes ]
+
+def runBenchmark(cases, progress = None):
+	'''runs the cases one at a time, each one in a new process, returns the list of the results.
+		The processes of the executors are not daemons, so the parallel backend can start its workers
+	'''
+	results = []
+	ctx = multiprocessing.get_context("spawn")
+	for case in cases:
+		with concurrent.futures.ProcessPoolExecutor(1, mp_context = ctx) as pool:
+			res = pool.submit(runCase, case).result()
+		results.append(res)
+		if progress: progress(res)
+	return results
+
+def caseKey(res):
+	return (res["kind"], res["size"], res["mode"])
+
+def compareResults(results, baseline, tolerance = 0.25, minTime = 0.05):
+	'''compares the results with the ones of a baseline (a previous output of the benchmark),
+		returns the list of the regressions as strings. A case regresses when it doesn't converge
+		anymore, when it needs more sweeps, or when its time (above minTime seconds), its peak memory
+		or its residual grow by more than tolerance
+	'''
+	base = { caseKey(res): res for res in baseline["results"] }
+	regressions = []
+	for res in results:
+		old = base.get(caseKey(res))
+		if old is None: continue
+		name = "%s %dx%d %s" % (res["kind"], res["size"], res["size"], res["mode"])
+		if old["converged"] and not res["converged"]:
+			regressions.append("%s: doesn't converge anymore" % name)
+		if res["sweeps"] > old["sweeps"]:
+			regressions.append("%s: sweeps %d -> %d" % (name, old["sweeps"], res["sweeps"]))
+		if res["wall"] > minTime and res["wall"] > old["wall"] * (1 + tolerance):
+			regressions.append("%s: wall time %.3f -> %.3f secs" % (name, old["wall"], res["wall"]))
+		if res["peakMemory"] > old["peakMemory"] * (1 + tolerance):
+			regressions.append("%s: peak memory %.1f -> %.1f MB" % (name, old["peakMemory"], res["peakMemory"]))
+		if res["residual"] > old["residual"] * (1 + tolerance) + 1e-12:
+			regressions.append("%s: residual %g -> %g" % (name, old["residual"], res["residual"]))
+	return regressions
+
+def _names(choices):
+	def parse(text):
+		res = text.split(',')
+		for name in res:
+			if name not in choices: raise argparse.ArgumentTypeError("unknown name %s (choose from %s)" % (name, ", ".join(choices)))
+		return res
+	return parse
+
+def benchmarkMain(argv):
+	'''the "benchmark" command, returns the exit status (1 if there are regressions)'''
+	parser = argparse.ArgumentParser(prog = "mdp_grid_world benchmark",
+									 description = "solve generated worlds with every solver mode and measure the wall and processor "
+												   "time, the sweeps, the peak memory and the final residual")
+	parser.add_argument("--kinds", type = _names(WORLD_KINDS), default = list(WORLD_KINDS), help = "comma separated world kinds")
+	parser.add_argument("--sizes", type = lambda text: [ int(v) for v in text.split(',') ], default = [4, 16, 64, 256, 1000],
+						help = "comma separated sizes, the worlds are size x size")
+	parser.add_argument("--modes", type = _names(SOLVER_MODES), default = list(SOLVER_MODES), help = "comma separated solver modes")
+	parser.add_argument("--seed", type = int, default = 0)
+	Headless.addWorldArguments(parser)
+	parser.set_defaults(discount = 0.99, iterations = 100000)
+	parser.add_argument("-o", "--output", help = "JSON output file (default: standard output)")
+	parser.add_argument("--baseline", help = "JSON file of a previous run to compare with")
+	parser.add_argument("--tolerance", type = float, default = 0.25, help = "relative growth that counts as a regression")
+	args = parser.parse_args(argv)
+
+	options = { name: getattr(args, name) for name in ("step_reward", "pit_reward", "exit_reward", "forward", "left",
+													   "right", "backward", "discount", "iterations", "time") }
+	cases = benchmarkCases(args.kinds, args.sizes, args.modes, options, args.seed)
+
+	def progress(res):
+		print("%-6s %5dx%-5d %-15s sweeps %6d  wall %8.3f  cpu %8.3f  peak %8.1f MB  residual %.3g%s" %
+			  (res["kind"], res["size"], res["size"], res["mode"], res["sweeps"], res["wall"], res["cpu"],
+			   res["peakMemory"], res["residual"], "" if res["converged"] else "  (not converged)"), file = sys.stderr)
+
+	report = {"python": platform.python_version(), "machine": platform.machine(), "options": options,
+			  "results": runBenchmark(cases, progress)}
+	if args.output:
+		with open(args.output, 'w') as out: json.dump(report, out, indent = 1)
+	else:
+		print(json.dumps(report, indent = 1))
+
+	if args.baseline:
+		with open(args.baseline) as f: baseline = json.load(f)
+		regressions = compareResults(report["results"], baseline, args.tolerance)
+		for line in regressions: print("regression: %s" % line, file = sys.stderr)
+		print("%d regressions" % len(regressions), file = sys.stderr)
+		if regressions: return 1
+	return 0
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	for kind in WORLD_KINDS:
+		print(kind)
+		for row in generateWorld(kind, 9):
+			print(" ".join("vpew"[c] for c in row))
+	benchmarkMain(["--sizes", "8,16", "--kinds", "open,maze", "--modes", "vi,vi-numpy-turbo,pi-exact", "-o", "/tmp/benchmark.json"])
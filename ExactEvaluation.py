@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import breadth_first_order
+
+maxDirectStates = 400000	#bigger systems are solved with GMRES instead of a sparse LU factorization
+iterativeTolerance = 1e-10
+maxGmresIterations = 1000	#the restarts of GMRES before the evaluation gives up
+
+def policyMatrix(model, policy):
+	'''builds the sparse matrix P of the transitions of the policy, P[s, s'] is the probability to go
+		from s to s' doing the action policy[s] (a vector of action codes, Policy.NO_ACTION or -1 where
+		there is no action)
+	'''
+	n = model.numStates
+	rowPtr = np.frombuffer(model.rowPtr, dtype = np.dtype('l'))
+	if isinstance(policy, np.ndarray): actions = policy.astype(np.dtype('l'))
+	else: actions = np.frombuffer(policy, dtype = np.uint8).astype(np.dtype('l'))
+	actions[actions > 3] = -1
+	states = np.flatnonzero(actions >= 0)
+	rows = 4 * states + actions[states]
+	starts, counts = rowPtr[rows], rowPtr[rows + 1] - rowPtr[rows]
+
+	offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+	k = np.repeat(starts, counts) + offsets
+	return sp.csr_matrix((np.frombuffer(model.prob)[k], (np.repeat(states, counts), np.frombuffer(model.next, dtype = np.dtype('l'))[k])),
+						 shape = (n, n))
+
+def actionMatrix(model, a):
+	'''the sparse matrix of the transitions of the action of index a, empty for the exits and the pits'''
+	isVoid = np.frombuffer(model.isVoid, dtype = np.uint8)
+	return policyMatrix(model, np.where(isVoid == 1, a, -1))
+
+def _canReach(P, targets):
+	'''the mask of the states that, following P, reach at least one of the targets with a positive probability'''
+	n = P.shape[0]
+	if not targets.any(): return targets.copy()
+	#a breadth first visit of the reversed graph, starting from a virtual node linked to all the targets
+	reverse = sp.bmat([[ P.T, None ], [ sp.csr_matrix(targets.astype(float)), sp.csr_matrix((1, 1)) ]], format = 'csr')
+	reached = np.zeros(n + 1, dtype = bool)
+	reached[breadth_first_order(reverse, n, directed = True, return_predecessors = False)] = True
+	return reached[:n]
+
+def improperStates(P, terminals):
+	'''the mask of the states that, following P, don't reach the terminal states with probability 1:
+		with a discount factor of 1 their utility is not defined (it grows forever)
+	'''
+	trapped = ~_canReach(P, terminals)
+	return _canReach(P, trapped)
+
+#===============================================================================
+# ExactSolver - the linear algebra used by the policy iteration with exact
+#		evaluation, built once for each TransitionModel
+#===============================================================================
+
+class ExactSolver:
+
+	model = None
+	actionMatrices = None	#P_a for each action, see actionMatrix
+
+	def __init__(self, model):
+		self.model = model
+		self.actionMatrices = [ actionMatrix(model, a) for a in range(4) ]
+		self.terminals = np.frombuffer(model.isVoid, dtype = np.uint8) == 0
+
+	def evaluate(self, policy, discFactor, values):
+		'''solves exactly U = R + discFactor * P U for the policy, writing the utilities in values.
+			The absorbing states (exits and pits) have U = R. When discFactor is 1 the states that don't
+			reach an absorbing state with probability 1 collect the step reward forever: their utility
+			is -inf (+inf for a positive step reward, 0 if it is 0) and the system is solved without them
+
+			returns the number of states that were solved exactly, or None (and values is not changed)
+			if GMRES didn't converge: an approximate solution is not an evaluation of the policy
+		'''
+		n = self.model.numStates
+		P = policyMatrix(self.model, policy)
+		R = np.frombuffer(self.model.reward)
+		U = np.frombuffer(values)
+
+		if discFactor < 1:
+			improper = np.zeros(n, dtype = bool)
+		else:
+			improper = improperStates(P, self.terminals)
+		proper = ~improper
+
+		#the proper states never lead to improper ones (the improper states can step into proper ones),
+		#so the system of the proper states doesn't need the improper ones
+		if proper.any():
+			A = (sp.identity(int(proper.sum()), format = 'csr') - discFactor * P[proper][:, proper]).tocsc()
+			b = R[proper]
+			x0 = U[proper]
+			x = None
+			if A.shape[0] <= maxDirectStates:
+				try:
+					x = spla.spsolve(A, b)
+				except (MemoryError, RuntimeError):
+					x = None
+			if x is None or not np.all(np.isfinite(x)):
+				x, info = spla.gmres(A, b, x0 = np.where(np.isfinite(x0), x0, 0), rtol = iterativeTolerance, restart = 50,
+									 maxiter = maxGmresIterations)
+				if info != 0: return None
+			U[proper] = x
+		U[improper] = np.where(R[improper] == 0, 0, R[improper] * np.inf)
+
+		return int(proper.sum())
+
+	def improve(self, policy, values, tolerance):
+		'''the policy improvement step, done for all the states at once: every state takes the action
+			with the best expected utility, if it is better than the one of its action by more than tolerance
+
+			returns the number of states whose action changed
+		'''
+		U = np.frombuffer(values)
+		sums = np.stack([ P @ U for P in self.actionMatrices ])
+		codes = np.frombuffer(policy, dtype = np.uint8)
+		current = np.where(self.terminals, 0, codes)
+		best = np.argmax(sums, axis = 0)
+		states = np.arange(len(current))
+		changed = np.flatnonzero(~self.terminals & (sums[best, states] > sums[current, states] + tolerance))
+		codes[changed] = best[changed]
+		return len(changed)
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	from GridWorld import GridWorld
+	from Policy import Policy
+	from Reporter import Reporter
+
+	w = GridWorld([[GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_EXIT],
+			   [GridWorld.CELL_VOID, GridWorld.CELL_WALL, GridWorld.CELL_VOID, GridWorld.CELL_PIT],
+			   [GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID]], discountFactor = 1 )
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 10)
+
+	for evaluation in (Policy.EVALUATION_ITERATIVE, Policy.EVALUATION_EXACT):
+		p = Policy(w, evaluation = evaluation)
+		print("%s evaluation, policy iterations: %d" % (evaluation, p.policyIteration()))
+		print(p.utilityVectorToString())
+		print(p.policyToString())
+
+	#world.txt with discount 1: the first policy of the exact policy iteration must be proper
+	import WorldIO
+	cells, columns = WorldIO.readWorld("world.txt")
+	w = GridWorld(cells, 1, columns)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 10)
+	pi, pe = Policy(w), Policy(w, evaluation = Policy.EVALUATION_EXACT)
+	pi.policyIteration()
+	pe.policyIteration()
+	print("world.txt, discount 1: iterative and exact policy iteration, max difference %.4f, same policy %s" %
+		  (max(abs(a - b) for a, b in zip(pi.values, pe.values)), pi.policyCodes() == pe.policyCodes()))
+
+	#GMRES stopped before the tolerance: the policy iteration evaluates the policies with the sweeps
+	class CountingReporter(Reporter):
+		warnings = 0
+		def warning(self, title, message):
+			self.warnings += 1
+	cells = [ [ GridWorld.CELL_VOID ] * 40 for _ in range(40) ]
+	cells[0][39], cells[20][20] = GridWorld.CELL_EXIT, GridWorld.CELL_PIT
+	w = GridWorld(cells, 0.99)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 60)
+	pi = Policy(w)
+	pi.policyIteration()
+	#Policy uses the module imported by name, not this script
+	import ExactEvaluation
+	ExactEvaluation.maxDirectStates, ExactEvaluation.maxGmresIterations = 0, 1
+	reporter = CountingReporter()
+	pg = Policy(w, evaluation = Policy.EVALUATION_EXACT, reporter = reporter)
+	pg.policyIteration()
+	print("40x40, GMRES with 1 restart: %d warnings in %d iterations, max difference from the iterative policy iteration %.4f, same policy %s" %
+		  (reporter.warnings, pg.numOfIterations, max(abs(a - b) for a, b in zip(pi.values, pg.values)), pi.policyCodes() == pg.policyCodes()))
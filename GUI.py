@@ -7,11 +7,179 @@
 ###########################################
 
 from tkinter import *
+from tkinter import messagebox
+import math
 import time
 from GridWorld import GridWorld
 from Policy import Policy
-from idlelib.textView import TextViewer
+from Reporter import ConsoleReporter
+from SolverWorker import SolverWorker
 
+#===============================================================================
+# MessageBoxReporter - shows the warnings of the solvers in a message box
+#===============================================================================
+
+class MessageBoxReporter(ConsoleReporter):
+	
+	def warning(self, title, message):
+		ConsoleReporter.warning(self, title, message)
+		messagebox.showwarning(title, message)
+
+#===============================================================================
+# CanvasRenderer - draws the views of a Policy on a canvas: every item is
+#		   created only once, then it is changed only if what it shows
+#		   changed
+#===============================================================================
+
+class CanvasRenderer:
+	
+	VIEW_MAP       = "map"
+	VIEW_UTILITIES = "utilities"
+	VIEW_QVALUES   = "qvalues"
+	VIEW_POLICY    = "policy"
+	#the layers of items drawn over the cells by each view, from the bottom to the top
+	LAYERS = ("utility", "qvalue", "qtext", "arrow")
+	VIEW_LAYERS = {VIEW_MAP: (), VIEW_UTILITIES: ("utility",), VIEW_QVALUES: ("utility", "qvalue", "qtext"),
+				   VIEW_POLICY: ("utility", "qvalue", "qtext", "arrow")}
+	minInterval = 0.1 #seconds between two refreshes that aren't forced
+	
+	canvas = None
+	policy = None
+	view = VIEW_MAP
+	items = None #(layer, x, y, action index) -> canvas item, the action index is None for the items of the whole cell
+	shown = None #canvas item -> the options it has now
+	created = None #the layers whose items exist
+	lastRefresh = 0
+	
+	def __init__(self, canvas, policy):
+		self.canvas = canvas
+		self.policy = policy
+		self.items = {}
+		self.shown = {}
+		self.created = set()
+		canvas.delete(ALL)
+		s = policy.world.drawing_BoxSide
+		for x, y, xp, yp in self.__cells():
+			self.items[("cell", x, y, None)] = canvas.create_rectangle(xp, yp, xp + s, yp + s)
+	
+	def __cells(self):
+		'''the cells with the coordinates of their top left corner'''
+		w = self.policy.world
+		m, s = w.drawing_BoxMargin, w.drawing_BoxSide
+		ox, oy = w.drawing_offset
+		c, r = w.size
+		for x in range(c):
+			for y in range(r):
+				yield x, y, x*(s+m) + ox, y*(s+m) + oy
+	
+	def __config(self, item, **options):
+		'''changes the options of an item, only if they are different from the ones it has'''
+		old = self.shown.get(item)
+		if old is not None and all(old.get(k) == v for k, v in options.items()): return
+		if "coords" in options: self.canvas.coords(item, *options["coords"])
+		self.canvas.itemconfigure(item, **{ k: v for k, v in options.items() if k != "coords" })
+		if old is None: self.shown[item] = dict(options)
+		else: old.update(options)
+	
+	def __create(self, layer):
+		'''creates the items of a layer, hidden, they are placed by refresh'''
+		w = self.policy.world
+		s = w.drawing_BoxSide
+		s2 = math.ceil(s/2)
+		tm = 4 #text margin from the border
+		for x, y, xp, yp in self.__cells():
+			cell = w.cellAt(x, y)
+			xc, yc = xp + s2, yp + s2
+			if layer == "utility" and cell != GridWorld.CELL_WALL:
+				self.items[(layer, x, y, None)] = self.canvas.create_text(xc, yc, anchor = CENTER, font = ("AgencyFB", "20", "bold"),
+																		   state = HIDDEN, tags = layer)
+			elif layer == "qvalue" and cell == GridWorld.CELL_VOID:
+				triangles = ([xp, yp, xp + s, yp, xc, yc], [xp, yp + s, xp + s, yp + s, xc, yc],
+							 [xp, yp, xp, yp + s, xc, yc], [xp + s, yp, xp + s, yp + s, xc, yc])
+				for a, points in enumerate(triangles):
+					self.items[(layer, x, y, a)] = self.canvas.create_polygon(points, width = 1, outline = "black", state = HIDDEN, tags = layer)
+			elif layer == "qtext" and cell == GridWorld.CELL_VOID:
+				places = ((xc, yp + tm, N), (xc, yp + s - tm, S), (xp + tm, yc, W), (xp + s - tm, yc, E))
+				for a, (xt, yt, anchor) in enumerate(places):
+					self.items[(layer, x, y, a)] = self.canvas.create_text(xt, yt, anchor = anchor, state = HIDDEN, tags = layer)
+			elif layer == "arrow" and cell == GridWorld.CELL_VOID:
+				self.items[(layer, x, y, None)] = self.canvas.create_polygon(xc, yc, xc, yc, xc, yc, fill = 'black', width = 1,
+																			 outline = "white", state = HIDDEN, tags = layer)
+		self.created.add(layer)
+		#the layers stay in their order, whenever they are created
+		for l in self.LAYERS:
+			if l in self.created: self.canvas.tag_raise(l)
+	
+	def __arrow(self, action, xc, yc):
+		'''the points of the arrow of an action, centered in (xc, yc)'''
+		arrs = int(self.policy.world.drawing_BoxSide/4) #arrow base size
+		arrh = int(self.policy.world.drawing_BoxSide/5) #arrow height
+		if action == GridWorld.ACTION_NORTH:
+			return [xc - arrs/2, yc + arrh/2, xc + arrs/2, yc + arrh/2, xc, yc - arrh/2]
+		elif action == GridWorld.ACTION_SOUTH:
+			return [xc - arrs/2, yc - arrh/2, xc + arrs/2, yc - arrh/2, xc, yc + arrh/2]
+		elif action == GridWorld.ACTION_WEST:
+			return [xc + arrh/2, yc - arrs/2, xc + arrh/2, yc + arrs/2, xc - arrh/2, yc]
+		return [xc - arrh/2, yc - arrs/2, xc - arrh/2, yc + arrs/2, xc + arrh/2, yc]
+	
+	def show(self, view):
+		'''changes the view, and refreshes it at once'''
+		self.view = view
+		for layer in self.VIEW_LAYERS[view]:
+			if layer not in self.created: self.__create(layer)
+		self.refresh(True)
+	
+	def refresh(self, force = False):
+		'''updates the items of the view with the results of the policy. Unless force is True, it does
+			nothing if the last refresh was less than minInterval seconds ago
+
+			returns True if it refreshed the view
+		'''
+		now = time.perf_counter()
+		if not force and now - self.lastRefresh < self.minInterval: return False
+		self.lastRefresh = now
+		
+		p, w = self.policy, self.policy.world
+		layers = self.VIEW_LAYERS[self.view]
+		s2 = math.ceil(self.policy.world.drawing_BoxSide/2)
+		normal_style = ("AgencyFB", "12")
+		bold_style = ("AgencyFB", "14", "bold")
+		for x, y, xp, yp in self.__cells():
+			cell = w.cellAt(x, y)
+			if cell == GridWorld.CELL_WALL: color = "#323232"
+			elif cell == GridWorld.CELL_EXIT: color = "#00ff64"
+			elif cell == GridWorld.CELL_PIT: color = "#ff0000"
+			elif layers and p.utilityAt(x, y): color = p.getColorFromValue(p.utilityAt(x, y))
+			else: color = "#ffffff"
+			self.__config(self.items[("cell", x, y, None)], fill = color)
+			
+			qvalues = None
+			for layer in self.LAYERS:
+				state = NORMAL if layer in layers else HIDDEN
+				if layer == "utility":
+					item = self.items.get((layer, x, y, None))
+					if item is None: continue
+					if state == NORMAL: self.__config(item, state = state, text = "%2.3f" % p.utilityAt(x, y))
+					else: self.__config(item, state = state)
+				elif layer in ("qvalue", "qtext"):
+					if (layer, x, y, 0) not in self.items: continue
+					if state == NORMAL and qvalues is None:
+						qvalues = p.getQValues((x, y))
+						best = max(range(4), key = lambda a: qvalues[GridWorld.actionSet[a]])
+					for a, action in enumerate(GridWorld.actionSet):
+						item = self.items[(layer, x, y, a)]
+						if state == HIDDEN: self.__config(item, state = state)
+						elif layer == "qvalue": self.__config(item, state = state, fill = p.getColorFromValue(qvalues[action]))
+						else: self.__config(item, state = state, text = "%2.2f" % qvalues[action],
+											font = bold_style if a == best else normal_style)
+				elif layer == "arrow":
+					item = self.items.get((layer, x, y, None))
+					if item is None: continue
+					action = p.getPolicyFromUtilityVector((x, y)) if state == NORMAL else None
+					if action is None: self.__config(item, state = HIDDEN)
+					else: self.__config(item, state = state, coords = tuple(self.__arrow(action, xp + s2, yp + s2)))
+		return True
+	
 #===============================================================================
 # MDPGUI - shows the map, q-values, utilities and 
 #	      the interface with which you can compute the policy
@@ -20,64 +188,73 @@ from idlelib.textView import TextViewer
 class MDPGUI:
 	
 	w = None #GridWorld
-	p = None #Policy
+	p = None #Policy, the worker thread solves it
+	view = None #Policy with the last snapshot of p, it is the one drawn on the canvas
+	reporter = None #shows the warnings of the solver
+	worker = None #SolverWorker of the computation in progress
+	pollInterval = 50 #ms between two reads of the queue of the worker
 	master = None #the form
 	c = None #canvas
-	whatToShow = None #callback function to call from the debug callback
+	renderer = None #CanvasRenderer of the canvas
+	whatToShow = None #callback function that shows the current view again
 	computationStarted = False
-	algorithm = None #algorihm to use, is a string "vi" for value iteration, "pi" for policy iteration
+	algorithm = None #algorihm to use, is a string "vi" for value iteration, "pi" for policy iteration, "ps" for prioritized sweeping, "tvi" for topological value iteration, "mrvi" for multiresolution value iteration
 	superMode = None
 	
 	def cbShowMap(self):
-		self.c.delete(ALL)
 		self.whatToShow = self.cbShowMap
-		self.p.world.draw(self.c)
+		self.renderer.show(CanvasRenderer.VIEW_MAP)
 		
 	def cbShowUtilities(self):
 		self.whatToShow = self.cbShowUtilities
-		self.c.delete(ALL)
-		self.p.world.draw(self.c)
-		self.p.drawUtilities(self.c)
+		self.renderer.show(CanvasRenderer.VIEW_UTILITIES)
 		
 	def cbShowQValues(self):
 		self.whatToShow = self.cbShowQValues
-		self.c.delete(ALL)
-		self.p.world.draw(self.c)
-		self.p.drawUtilities(self.c)
-		self.p.drawQValues(self.c)
+		self.renderer.show(CanvasRenderer.VIEW_QVALUES)
 	
 	def cbShowPolicy(self):
 		self.whatToShow = self.cbShowPolicy
-		self.p.draw(self.c)
+		self.renderer.show(CanvasRenderer.VIEW_POLICY)
 	
-	def debugCallBack(self, policy, isEnded):
-		try:
-			if isEnded and self.computationStarted: 
-				self.tDebugModeIterations.config(text="Iterations: %d (complete)" % policy.numOfIterations)
-				self.tDebugModeTimer.config(text="Elapsed: %.3f secs (complete)" % policy.elapsed)
-				self.bComputation.config(state=DISABLED)
-				self.bResetResults.config(state=NORMAL)
-				self.superModeCheck.config(state=NORMAL)
-				for b in self.radioBAlgorithms: b.config(state=NORMAL)
-				self.computationStarted = False
-				self.bComputation.config(text="Start Computation")
-				self.bComputation.config(state=NORMAL)
-
-				self.computationStarted = False
-				return False
-			
-			if self.computationStarted:
-				self.tDebugModeIterations.config(text="Iterations: %d" % policy.numOfIterations)
-				self.tDebugModeTimer.config(text="Elapsed: %.3f secs" % policy.elapsed)
-				if self.whatToShow: self.whatToShow()
-				self.c.update()
-
-				time.sleep(float(self.eSleep.get()))
-				return True
-				
-		except Exception as ex: #when the window is closed
-			print(ex)
-			return False
+	def showSnapshot(self, snapshot):
+		'''shows the progress of the solve: the view is redrawn at most every "Refresh" seconds, whatever the speed of the solver'''
+		self.view.loadResults(snapshot.values)
+		if not snapshot.ended:
+			self.tDebugModeIterations.config(text="Iterations: %d" % snapshot.iteration)
+			self.tDebugModeTimer.config(text="Elapsed: %.3f secs" % snapshot.elapsed)
+			try:
+				self.renderer.minInterval = max(0, float(self.eSleep.get()))
+			except ValueError:
+				pass
+			self.renderer.refresh()
+			return
+		
+		if snapshot.sweepsSaved:
+			self.tDebugModeIterations.config(text="Iterations: %d (%s, %d saved)" % (snapshot.iteration, snapshot.stopReason, snapshot.sweepsSaved))
+		else:
+			self.tDebugModeIterations.config(text="Iterations: %d (%s)" % (snapshot.iteration, snapshot.stopReason))
+		self.tDebugModeTimer.config(text="Elapsed: %.3f secs (complete)" % snapshot.elapsed)
+		self.renderer.refresh(True)
+	
+	def pollWorker(self):
+		'''called by the Tk loop every pollInterval ms while the worker runs, only the last snapshot in the queue is shown'''
+		last = None
+		for kind, payload in self.worker.pending():
+			if kind == "warning": self.reporter.warning(*payload)
+			else: last = payload
+		if last: self.showSnapshot(last)
+		
+		if last and last.ended:
+			self.worker = None
+			self.computationStarted = False
+			self.bComputation.config(text="Start Computation", state=NORMAL)
+			self.bResetResults.config(state=NORMAL)
+			self.superModeCheck.config(state=NORMAL)
+			self.warmStartCheck.config(state=NORMAL)
+			for b in self.radioBAlgorithms: b.config(state=NORMAL)
+		else:
+			self.master.after(self.pollInterval, self.pollWorker)
 	
 	def toggleComputation(self):
 		if not self.computationStarted:
@@ -86,21 +263,25 @@ class MDPGUI:
 			self.computationStarted = True
 			self.bResetResults.config(state=DISABLED)
 			self.superModeCheck.config(state=DISABLED)
+			self.warmStartCheck.config(state=DISABLED)
 			for b in self.radioBAlgorithms: b.config(state=DISABLED)
-			if self.algorithm.get() == "vi": 
-				self.p.valueIteration(self.debugCallBack, self.superMode.get())
-			else: 
-				self.p.policyIteration(self.debugCallBack, self.superMode.get())
+			#the model is compiled here, so the two threads never build it at the same time
+			self.w.transitionModel()
+			self.worker = SolverWorker(self.p, self.algorithm.get(), self.superMode.get())
+			self.worker.start()
+			self.master.after(self.pollInterval, self.pollWorker)
 		else:
-			self.bComputation.config(text="Start Computation")
-			self.bResetResults.config(state=NORMAL)
-			self.superModeCheck.config(state=NORMAL)
-			for b in self.radioBAlgorithms: b.config(state=NORMAL)
-			self.computationStarted = False
+			#the solver stops at the end of its iteration, pollWorker gets its last snapshot and enables the buttons
+			self.worker.stop()
+			self.bComputation.config(text="Stopping...", state=DISABLED)
 			
+	def toggleWarmStart(self):
+		self.p.warmStart = self.warmStart.get()
+	
 	def resetResults(self):
 		self.bComputation.config(state=NORMAL)
 		self.p.resetResults()
+		self.view.loadResults(self.p.values)
 		if self.whatToShow: self.whatToShow()
 		self.tDebugModeIterations.config(text="Iterations: 0")
 		self.tDebugModeTimer.config(text="Elapsed: 0 secs")
@@ -109,19 +290,23 @@ class MDPGUI:
 	
 	def __init__(self, world):
 		self.w = world
-		self.p = Policy(world)
+		self.reporter = MessageBoxReporter()
+		self.p = Policy(world, reporter = self.reporter)
+		self.view = Policy(world)
 		self.master = Tk()
 		self.master.title("MDP GridWorld")
 		self.master.resizable(0,0)
 		self.c = self.w.newCanvasToDraw(self.master)
 		self.c.pack(side=LEFT, padx=10, pady=10)
-		self.p.world.draw(self.c)
+		self.renderer = CanvasRenderer(self.c, self.view)
+		self.renderer.show(CanvasRenderer.VIEW_MAP)
 	
 		self.frame = Frame(self.master, relief=RAISED, borderwidth=1)
 		self.frame.pack(fill=BOTH, side=LEFT, expand=1)
 	
 		self.whatToShow = None
 		self.superMode = BooleanVar()
+		self.warmStart = BooleanVar()
 		self.algorithm = StringVar()
 		self.algorithm.set("vi")
 		
@@ -145,13 +330,14 @@ class MDPGUI:
 		self.bComputation.pack(side=TOP, padx=10, pady=5)
 	
 		self.radioBAlgorithms = []
-		for text, mode in (("Value iteration", "vi"), ("Policy iteration", "pi")):
+		for text, mode in (("Value iteration", "vi"), ("Policy iteration", "pi"), ("Prioritized sweeping", "ps"), ("Topological VI", "tvi"),
+						   ("Multiresolution VI", "mrvi")):
 			b = Radiobutton(self.frameComputation, text=text, variable=self.algorithm, value=mode, command=self.resetResults)
 			b.pack(anchor=W, padx=10, pady=5)
 			self.radioBAlgorithms.append(b)
 
 		self.frameSleep = Frame(self.frameComputation)
-		self.tSleep = Label(self.frameSleep, text="Sleep (sec): ")
+		self.tSleep = Label(self.frameSleep, text="Refresh (sec): ")
 		self.eSleep = Spinbox(self.frameSleep, from_=0, to=10, increment=0.1, width=5)
 		self.tSleep.pack(side=LEFT)
 		self.eSleep.pack(side=LEFT)
@@ -159,6 +345,9 @@ class MDPGUI:
 	
 		self.superModeCheck = Checkbutton(self.frameComputation, text="Super", variable=self.superMode)
 		self.superModeCheck.pack(side=TOP)
+		
+		self.warmStartCheck = Checkbutton(self.frameComputation, text="Warm start", variable=self.warmStart, command=self.toggleWarmStart)
+		self.warmStartCheck.pack(side=TOP)
 	
 		self.tDebugModeIterations = Label(self.frameComputation, text="Iterations: 0")
 		self.tDebugModeIterations.pack(side=TOP, padx=10, pady=5)
@@ -185,18 +374,18 @@ class MDPChooser:
 	rew = (("Step Reward", -0.04, "negative"), 
 				("Pit Reward", -1, "negative"),
 				("Exit Reward", 1, "positive"))
-	rewValue = []
+	rewValue = None #the StringVar of each reward, every chooser has its own lists
 	
 
 	algorithm_rest = (("Number of iterations", 1000),
 							("Max. calculation time (secs)", 3))
-	algorithm_restValue = []
+	algorithm_restValue = None
 
 	prob = (("Forward Probability", 0.8), 
 			("Left Probability", 0.1),
 			("Right Probability", 0.1),
 			("Backward Probability", 0))
-	probValue = []
+	probValue = None
 	
 	discFactor = None
 	
@@ -265,6 +454,7 @@ class MDPChooser:
 		
 	def __init__(self, world):
 		self.world = world
+		self.rewValue, self.probValue, self.algorithm_restValue = [], [], []
 		self.master = Tk()
 		self.master.title("MDP Settings")
 		self.master.resizable(0,0)
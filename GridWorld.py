@@ -8,8 +8,12 @@
 # @date:		Thu Dec 1 5:28:03 PM 			#
 ###########################################
 
-import tkinter.ttk
+import itertools
+import math
+import operator
 import random
+import sys
+from array import array
 
 class GridWorld:
 	
@@ -22,8 +26,6 @@ class GridWorld:
 	CELL_PIT  = 1
 	CELL_EXIT = 2
 	CELL_WALL = 3
-	__cells = None
-	size = (0, 0) #(columns, rows)
 	
 	ACTION_NORTH = 'N'
 	ACTION_SOUTH = 'S'
@@ -36,29 +38,87 @@ class GridWorld:
 	PROB_BACKWARD = 'B'
 	PROB_LEFT     = 'L'
 	PROB_RIGHT    = 'R'
-	prob = None
 	
-	rew = None
-	discFactor = 0
+	# Drawing parameters, every world has its own copy (see drawing_BoxSide)
+	DRAWING_BOX_SIDE = 120
+	DRAWING_BOX_MARGIN = 2
+	DRAWING_OFFSET = (5,5)
 	
-	# Drawing parameters
-	drawing_BoxSide = 120
-	drawing_BoxMargin = 2
-	drawing_offset = (5,5)
+	# Worlds with at least these cells are indexed with numpy (if it is installed), the smaller ones
+	# don't pay its import time unless it is already loaded
+	NUMPY_INDEX_CELLS = 1 << 20
 	
-	def __init__(self, cells, discountFactor = 1):
-		'''the __cells is a matrix memorized in this way 
+	__slots__ = ("__cells",		#the cell codes, one byte for each cell in row major order
+				 "size",		#(columns, rows)
+				 "prob",
+				 "rew",
+				 "discFactor",
+				 "version",		#incremented every time the rewards, the probabilities or the discount factor change
+				 # States: every non wall cell is a state, numbered in row major order
+				 "numStates",
+				 "stateOfCell",	#flat cell index (y * columns + x) -> state index, -1 for the walls
+				 "cellOfState",	#state index -> flat cell index
+				 "__model",		#the compiled TransitionModel, None when it must be (re)compiled
+				 "numberOfIterations",
+				 "timeToLive",
+				 # Drawing: side of a cell (smaller for the wide worlds), space between the cells, offset of the grid
+				 "drawing_BoxSide",
+				 "drawing_BoxMargin",
+				 "drawing_offset")
+	
+	def __init__(self, cells, discountFactor = 1, columns = None):
+		'''the cells are a matrix memorized in this way 
 			[[[cell 1 of first row, cell 2 of first row, ...]],[row2], ...]
+			or, if columns is given, a flat buffer of cell codes (bytes, bytearray, array('B')...)
+			with the rows one after the other
 		'''
+		if columns is None:
+			columns = len(cells[0])
+			for row in cells:
+				if len(row) != columns: raise Exception("all the rows must have the same number of cells")
+			self.__cells = bytearray(c for row in cells for c in row)
+		else:
+			self.__cells = bytearray(cells)
+			if columns <= 0 or len(self.__cells) % columns != 0:
+				raise Exception("the number of cells is not a multiple of the number of columns")
 
-
-		cells_width = len(cells[0])
-		inc = (cells_width * 120) / 480
-		if inc != 1: GridWorld.drawing_BoxSide /= inc * 0.5
+		inc = (columns * 120) / 480
+		self.drawing_BoxSide = self.DRAWING_BOX_SIDE / (inc * 0.5) if inc != 1 else self.DRAWING_BOX_SIDE
+		self.drawing_BoxMargin = self.DRAWING_BOX_MARGIN
+		self.drawing_offset = self.DRAWING_OFFSET
+		self.numberOfIterations = self.timeToLive = 0
 		
-		self.__cells = cells
-		self.size = (len(self.__cells[0]), len(self.__cells))
+		self.size = (columns, len(self.__cells) // columns)
 		self.discFactor = discountFactor
+		self.prob = None
+		self.rew = None
+		self.version = 0
+		self.__model = None
+		self.__buildStateIndex()
+	
+	def __buildStateIndex(self):
+		'''numbers the states of the world, the walls are not states'''
+		notWall = bytearray([1]) * 256
+		notWall[self.CELL_WALL] = 0
+		isState = self.__cells.translate(notWall)
+		np = sys.modules.get("numpy")
+		if np is None and len(isState) >= self.NUMPY_INDEX_CELLS:
+			try:
+				import numpy as np
+			except ImportError:
+				np = None
+		
+		self.cellOfState, self.stateOfCell = array('i'), array('i')
+		if np is not None:
+			#the same as below, a lot faster for the huge worlds
+			mask = np.frombuffer(isState, dtype = np.uint8).astype(bool)
+			self.cellOfState.frombytes(np.flatnonzero(mask).astype(np.int32).tobytes())
+			self.stateOfCell.frombytes(np.where(mask, np.cumsum(mask, dtype = np.int32) - 1, -1).astype(np.int32).tobytes())
+		else:
+			#the state of a cell is the number of states before it, so isState * runningCount - 1 (-1 for the walls)
+			self.cellOfState.extend(itertools.compress(range(len(isState)), isState))
+			self.stateOfCell.extend(map(operator.sub, map(operator.mul, itertools.accumulate(isState), isState), itertools.repeat(1)))
+		self.numStates = len(self.cellOfState)
 		
 	def transitionFunction(self, position, action):
 		''' this function describes the movements that we can do (deterministic)
@@ -69,40 +129,50 @@ class GridWorld:
 		'''
 		if action not in self.actionSet:
 			raise Exception("unknown action")
-		if self.__cells[position[1]][position[0]] != self.CELL_VOID: 
+		c, r = self.size
+		if self.__cells[position[1] * c + position[0]] != self.CELL_VOID: 
 			raise Exception("no action allowed")
 		
 		if action == self.ACTION_NORTH:
 			ris = (position[0], max(0, position[1] - 1))
 		elif action == self.ACTION_SOUTH:
-			ris = (position[0], min(len(self.__cells) - 1, position[1] + 1))
+			ris = (position[0], min(r - 1, position[1] + 1))
 		elif action == self.ACTION_WEST:
 			ris = (max(0, position[0] - 1), position[1])
 		else:
-			ris = (min(len(self.__cells[0]) - 1, position[0] + 1), position[1])
+			ris = (min(c - 1, position[0] + 1), position[1])
 			
-		if self.__cells[ris[1]][ris[0]] == self.CELL_WALL: return position
+		if self.__cells[ris[1] * c + ris[0]] == self.CELL_WALL: return position
 		return ris
 	
 	def cellTypeAt(self, x, y):
-		return self.__cells[y][x]
+		return self.__cells[y * self.size[0] + x]
 	
 	def cellAt(self, x, y): 
 		'''pos is a tuple (x,y)'''
-		return self.__cells[y][x]
+		return self.__cells[y * self.size[0] + x]
+	
+	def cellCodes(self):
+		'''returns all the cells as a read only buffer of bytes, in row major order'''
+		return memoryview(self.__cells).toreadonly()
 	
 	def setDiscountFactor(self, df):
+		self.version += 1
 		self.discFactor = df
 		
 	def setRewards(self, rewOfVoidCell, rewOfPitCell, rewOfExitCell):
+		self.__model = None
+		self.version += 1
 		self.rew = {self.CELL_VOID : rewOfVoidCell, 
 					self.CELL_EXIT : rewOfExitCell, 
 					self.CELL_PIT  : rewOfPitCell,
 					self.CELL_WALL : 0}
 	
 	def setProbabilities(self, probToGoForward, probToGoLeft, probToGoRight, probToGoBackward):
-		if probToGoForward + probToGoLeft + probToGoRight + probToGoBackward != 1:
+		if abs(probToGoForward + probToGoLeft + probToGoRight + probToGoBackward - 1) > 1e-9:
 			raise Exception('the prob must have 1 as sum')
+		self.__model = None
+		self.version += 1
 		self.prob = {self.PROB_FORWARD  : probToGoForward, 
 				     self.PROB_LEFT     : probToGoLeft, 
 				     self.PROB_RIGHT    : probToGoRight, 
@@ -112,64 +182,139 @@ class GridWorld:
 		self.numberOfIterations = numberOfIterations
 		self.timeToLive = ttl
 		
-	def possiblePositionsFromAction(self, position, worldAction):
+	def probabilitiesFromAction(self, worldAction):
 		'''
 			given an action worldAction, return a dictionary D, 
 			where for each action a, D[a] is the probability to do the action a
 		'''
-		
-		def getProbabilitiesFromAction(worldAction):
-			if worldAction == self.ACTION_NORTH:
-				return {self.ACTION_NORTH : self.prob[self.PROB_FORWARD], 
-						self.ACTION_SOUTH : self.prob[self.PROB_BACKWARD], 
-						self.ACTION_WEST  : self.prob[self.PROB_LEFT], 
-						self.ACTION_EAST  : self.prob[self.PROB_RIGHT]}
-			elif worldAction == self.ACTION_SOUTH:
-				return {self.ACTION_NORTH : self.prob[self.PROB_BACKWARD], 
-						self.ACTION_SOUTH : self.prob[self.PROB_FORWARD], 
-						self.ACTION_WEST  : self.prob[self.PROB_RIGHT], 
-						self.ACTION_EAST  : self.prob[self.PROB_LEFT]}
-			elif worldAction == self.ACTION_WEST:
-				return {self.ACTION_NORTH : self.prob[self.PROB_RIGHT], 
-						self.ACTION_SOUTH : self.prob[self.PROB_LEFT], 
-						self.ACTION_WEST  : self.prob[self.PROB_FORWARD], 
-						self.ACTION_EAST  : self.prob[self.PROB_BACKWARD]}
-			else:
-				return {self.ACTION_NORTH : self.prob[self.PROB_LEFT], 
-						self.ACTION_SOUTH : self.prob[self.PROB_RIGHT], 
-						self.ACTION_WEST  : self.prob[self.PROB_BACKWARD], 
-						self.ACTION_EAST  : self.prob[self.PROB_FORWARD]}
-			
-		if not (self.__cells[position[1]][position[0]] == self.CELL_VOID):
+		if worldAction == self.ACTION_NORTH:
+			return {self.ACTION_NORTH : self.prob[self.PROB_FORWARD], 
+					self.ACTION_SOUTH : self.prob[self.PROB_BACKWARD], 
+					self.ACTION_WEST  : self.prob[self.PROB_LEFT], 
+					self.ACTION_EAST  : self.prob[self.PROB_RIGHT]}
+		elif worldAction == self.ACTION_SOUTH:
+			return {self.ACTION_NORTH : self.prob[self.PROB_BACKWARD], 
+					self.ACTION_SOUTH : self.prob[self.PROB_FORWARD], 
+					self.ACTION_WEST  : self.prob[self.PROB_RIGHT], 
+					self.ACTION_EAST  : self.prob[self.PROB_LEFT]}
+		elif worldAction == self.ACTION_WEST:
+			return {self.ACTION_NORTH : self.prob[self.PROB_RIGHT], 
+					self.ACTION_SOUTH : self.prob[self.PROB_LEFT], 
+					self.ACTION_WEST  : self.prob[self.PROB_FORWARD], 
+					self.ACTION_EAST  : self.prob[self.PROB_BACKWARD]}
+		else:
+			return {self.ACTION_NORTH : self.prob[self.PROB_LEFT], 
+					self.ACTION_SOUTH : self.prob[self.PROB_RIGHT], 
+					self.ACTION_WEST  : self.prob[self.PROB_BACKWARD], 
+					self.ACTION_EAST  : self.prob[self.PROB_FORWARD]}
+	
+	def possiblePositionsFromAction(self, position, worldAction):
+		'''
+			given an action worldAction, return a list of tuples (a, nextPosition, p)
+			where p is the probability to do the action a and to end in nextPosition
+		'''
+		if not (self.cellAt(position[0], position[1]) == self.CELL_VOID):
 			return [] #we can do anything in the wall, in a pit or in a exit
 		
-		prob = getProbabilitiesFromAction(worldAction)
+		prob = self.probabilitiesFromAction(worldAction)
 		result = []  
 		for a in self.actionSet:
 			result.append((a, self.transitionFunction(position, a), prob[a]))
 		return result
 	
+	def terminalReachability(self):
+		'''flood fills the grid from the exits and the pits following the moves backwards, returns a bytearray
+			with a 1 for each state from which an exit or a pit can be reached with some sequence of
+			actions (the exits and the pits included). The states with a 0 are closed in a region
+			without exits and pits: whatever we do we collect the step reward forever
+		'''
+		c, _ = self.size
+		cells = self.__cells
+		n = len(cells)
+		#the directions in which some action can move us
+		moves = { d for a in self.actionSet for d, p in self.probabilitiesFromAction(a).items() if p > 0 }
+		north, south, west, east = (d in moves for d in self.actionSet)
+		
+		reach = bytearray(n)
+		stack = [ i for t in (self.CELL_EXIT, self.CELL_PIT) for i in self.__findAll(t) ]
+		for i in stack: reach[i] = 1
+		while stack:
+			v = stack.pop()
+			x = v % c
+			#the cells from which one move ends in v: moving north from the cell below it, and so on
+			for u, ok in ((v + c, north and v + c < n), (v - c, south and v >= c),
+						  (v + 1, west and x < c - 1), (v - 1, east and x > 0)):
+				if ok and not reach[u] and cells[u] == self.CELL_VOID:
+					reach[u] = 1
+					stack.append(u)
+		return bytearray(map(reach.__getitem__, self.cellOfState))
+	
+	def __findAll(self, cellType):
+		'''the indexes of the cells of a type, in order'''
+		i = self.__cells.find(cellType)
+		while i >= 0:
+			yield i
+			i = self.__cells.find(cellType, i + 1)
+	
+	def coarsened(self, factor = 2):
+		'''returns a smaller world, each cell of it is a block of factor x factor cells of this one (on the
+			right and bottom borders the blocks can be smaller): an exit if the block has an exit, a pit if
+			it has at least as many pits as voids, a void if it has voids, otherwise a wall. A move in the
+			small world is worth factor moves in this one, so its discount factor is discFactor ** factor
+			and its step reward is the one of factor steps. See Policy.multiresolutionValueIteration
+		'''
+		if factor < 2: raise Exception("the factor must be at least 2")
+		c, r = self.size
+		columns = -(-c // factor)
+		cells = self.__cells
+		res = bytearray()
+		for y in range(0, r, factor):
+			rows = [ cells[i : i + c] for i in range(y * c, min(y + factor, r) * c, c) ]
+			for x in range(0, c, factor):
+				block = b"".join(row[x : x + factor] for row in rows)
+				voids, pits = block.count(self.CELL_VOID), block.count(self.CELL_PIT)
+				if self.CELL_EXIT in block: res.append(self.CELL_EXIT)
+				elif pits and pits >= voids: res.append(self.CELL_PIT)
+				elif voids: res.append(self.CELL_VOID)
+				else: res.append(self.CELL_WALL)
+
+		dfact = self.discFactor
+		world = GridWorld(res, dfact ** factor, columns)
+		world.setRewards(self.rew[self.CELL_VOID] * sum(dfact ** k for k in range(factor)),
+						 self.rew[self.CELL_PIT], self.rew[self.CELL_EXIT])
+		world.setProbabilities(self.prob[self.PROB_FORWARD], self.prob[self.PROB_LEFT],
+							   self.prob[self.PROB_RIGHT], self.prob[self.PROB_BACKWARD])
+		world.setAlgorithmRestrictions(self.numberOfIterations, self.timeToLive)
+		return world
+
+	def transitionModel(self):
+		'''returns the TransitionModel of the world, it is compiled only the first time
+			it is requested after the rewards or the probabilities are changed
+		'''
+		if self.__model is None: self.__model = TransitionModel(self)
+		return self.__model
+	
 	@staticmethod
 	def randomAction():
 		return GridWorld.actionSet[int(random.random() * 4)]
 	
 	def rewardAtCell(self, x, y):
-		return self.rew[self.__cells[y][x]]
+		return self.rew[self.cellAt(x, y)]
 
 	def __str__(self):
 		ris = ""
-		numRows = len(self.__cells)
-		for r in self.__cells:
-			for c in r:
+		numCols, numRows = self.size
+		for y in range(numRows):
+			for c in self.__cells[y * numCols : (y + 1) * numCols]:
 				if c == self.CELL_EXIT: ris += "E "
 				elif c == self.CELL_PIT: ris += "P "
 				elif c == self.CELL_WALL: ris += "W "
 				else: ris += "V "
-			numRows -= 1
-			if numRows > 0: ris += "\n"
+			if y < numRows - 1: ris += "\n"
 		return ris
 	
 	def newCanvasToDraw(self, master):
+		import tkinter
 		return tkinter.Canvas(master, width  = self.drawing_offset[0] 
 											 + self.size[0] * self.drawing_BoxSide 
 											 + (self.size[0] - 1) * self.drawing_BoxMargin, 
@@ -184,17 +329,194 @@ class GridWorld:
 		for x in range(self.size[0]):
 			for y in range(self.size[1]):
 				xp, yp = x*(s+m) + ox, y*(s+m) + oy
-				if self.__cells[y][x] == self.CELL_WALL:
+				cell = self.cellAt(x, y)
+				if cell == self.CELL_WALL:
 					color = "#%02x%02x%02x" % (50,50,50)
-				elif self.__cells[y][x] == self.CELL_EXIT:
+				elif cell == self.CELL_EXIT:
 					color = "#%02x%02x%02x" % (0,255,100)
-				elif self.__cells[y][x] == self.CELL_PIT:
+				elif cell == self.CELL_PIT:
 					color = "#%02x%02x%02x" % (255,0,0)
 				else:
 					color = "#%02x%02x%02x" % (255,255,255)
 				canvas.create_rectangle(xp, yp, xp + s, yp + s, fill=color)
 		
 	
+#===============================================================================
+# TransitionModel - the world compiled once in a compact integer indexed form,
+#		    used by the solvers instead of possiblePositionsFromAction
+#===============================================================================
+
+class TransitionModel:
+	
+	'''the entries of the state s with the action of index a (in GridWorld.actionSet) are
+			next[k], prob[k] for k in range(rowPtr[s*4 + a], rowPtr[s*4 + a + 1])
+		where next[k] is the index of the next state. Moves that end in the same state are merged
+		and the impossible ones are dropped, the exits and the pits have no entries at all.
+	'''
+	__slots__ = ("numStates",
+				 "rowPtr",	#(numStates * 4 + 1) offsets in next and prob
+				 "next",
+				 "prob",
+				 "reward",	#reward of every state
+				 "isVoid",	#1 for the states where we can do an action
+				 # Reachability (see GridWorld.terminalReachability): the sweeps update only the live states,
+				 # the utilities of the exits, of the pits and of the closed states don't change (see fixedUtilities)
+				 "isLive",	#1 for the void states from which an exit or a pit can be reached
+				 "liveStates",
+				 "closedStates",	#the void states that can't reach an exit or a pit
+				 "__predecessors",
+				 "__components")
+	
+	def __init__(self, world):
+		c, _ = world.size
+		stateOfCell = world.stateOfCell
+		actionProbs = [ world.probabilitiesFromAction(a) for a in GridWorld.actionSet ]
+		
+		self.numStates = world.numStates
+		self.rowPtr = array('l', [0])
+		self.next = array('l')
+		self.prob = array('d')
+		self.reward = array('d')
+		self.isVoid = bytearray(self.numStates)
+		self.__predecessors = self.__components = None
+		
+		for s, cell in enumerate(world.cellOfState):
+			x, y = cell % c, cell // c
+			cellType = world.cellAt(x, y)
+			self.reward.append(world.rew[cellType])
+			if cellType != GridWorld.CELL_VOID:
+				self.rowPtr.extend([len(self.next)] * 4)
+				continue
+			
+			self.isVoid[s] = 1
+			dest = {}
+			for d in GridWorld.actionSet:
+				nx, ny = world.transitionFunction((x, y), d)
+				dest[d] = stateOfCell[ny * c + nx]
+			for prob in actionProbs:
+				merged = {}
+				for d in GridWorld.actionSet:
+					if prob[d]: merged[dest[d]] = merged.get(dest[d], 0) + prob[d]
+				self.next.extend(merged.keys())
+				self.prob.extend(merged.values())
+				self.rowPtr.append(len(self.next))
+		
+		self.isLive = bytes(map(operator.and_, world.terminalReachability(), self.isVoid))
+		self.liveStates = array('l', itertools.compress(range(self.numStates), self.isLive))
+		self.closedStates = array('l', (s for s in range(self.numStates) if self.isVoid[s] and not self.isLive[s]))
+	
+	def fixedUtilities(self, values, discFactor):
+		'''writes in values the utilities that the sweeps don't change: the reward of the exits and of
+			the pits, and the utility of the closed states, that collect their reward forever:
+			reward / (1 - discFactor), or an infinite utility (0 if the reward is 0) when discFactor is 1
+		'''
+		isVoid, reward = self.isVoid, self.reward
+		for s in range(self.numStates):
+			if not isVoid[s]: values[s] = reward[s]
+		for s in self.closedStates:
+			r = reward[s]
+			if discFactor < 1: values[s] = r / (1 - discFactor)
+			else: values[s] = math.copysign(math.inf, r) if r else 0
+	
+	def predecessors(self):
+		'''returns the reversed graph (predPtr, pred): the states from which we can reach the state s
+			are pred[k] for k in range(predPtr[s], predPtr[s + 1]).
+			It is built the first time it is requested
+		'''
+		if self.__predecessors is None:
+			incoming = [ {} for _ in range(self.numStates) ]
+			for s in range(self.numStates):
+				for k in range(self.rowPtr[4 * s], self.rowPtr[4 * s + 4]):
+					incoming[self.next[k]][s] = True
+			predPtr, pred = array('l', [0]), array('l')
+			for d in incoming:
+				pred.extend(d.keys())
+				predPtr.append(len(pred))
+			self.__predecessors = (predPtr, pred)
+		return self.__predecessors
+	
+	def components(self):
+		'''returns (order, compPtr): the strongly connected components of the graph of the live states,
+			the states of the i-th one are order[k] for k in range(compPtr[i], compPtr[i + 1]).
+			The components are in reverse topological order: the successors of the states of a
+			component are in the components before it (or are exits, pits and closed states).
+			In each component the states are sorted by their distance (in moves) from the states
+			that leave it, so an update in this order uses the new utilities of the states nearer
+			to the exit of the component. It is built the first time it is requested
+		'''
+		if self.__components is None:
+			order, compPtr = self.__stronglyConnectedComponents()
+			self.__components = (self.__sortByDistance(order, compPtr), compPtr)
+		return self.__components
+	
+	def __stronglyConnectedComponents(self):
+		'''Tarjan's algorithm without recursion, it finds the components in reverse topological order'''
+		n, rowPtr, nextState, isLive = self.numStates, self.rowPtr, self.next, self.isLive
+		index = array('l', [-1]) * n
+		low = array('l', [0]) * n
+		onStack = bytearray(n)
+		stack, order, compPtr = [], array('l'), array('l', [0])
+		counter = 0
+		for root in self.liveStates:
+			if index[root] >= 0: continue
+			index[root] = low[root] = counter
+			counter += 1
+			stack.append(root)
+			onStack[root] = 1
+			work = [ (root, rowPtr[4 * root]) ]	#the states of the visit, with their next edge
+			while work:
+				v, k = work[-1]
+				end = rowPtr[4 * v + 4]
+				while k < end:
+					w = nextState[k]
+					k += 1
+					if not isLive[w]: continue
+					if index[w] < 0:
+						work[-1] = (v, k)
+						index[w] = low[w] = counter
+						counter += 1
+						stack.append(w)
+						onStack[w] = 1
+						work.append((w, rowPtr[4 * w]))
+						break
+					if onStack[w] and index[w] < low[v]: low[v] = index[w]
+				else:
+					#all the successors of v are visited
+					work.pop()
+					if work and low[v] < low[work[-1][0]]: low[work[-1][0]] = low[v]
+					if low[v] == index[v]:
+						while True:
+							w = stack.pop()
+							onStack[w] = 0
+							order.append(w)
+							if w == v: break
+						compPtr.append(len(order))
+		return order, compPtr
+	
+	def __sortByDistance(self, order, compPtr):
+		'''sorts the states of each component by distance from the states that have a successor out of it'''
+		rowPtr, nextState = self.rowPtr, self.next
+		predPtr, pred = self.predecessors()
+		component = array('l', [-1]) * self.numStates
+		for i in range(len(compPtr) - 1):
+			for k in range(compPtr[i], compPtr[i + 1]): component[order[k]] = i
+		
+		res = array('l')
+		for i in range(len(compPtr) - 1):
+			states = order[compPtr[i] : compPtr[i + 1]]
+			#a breadth first visit of the reversed graph, from the states that leave the component
+			queue = [ s for s in states if any(component[nextState[k]] != i for k in range(rowPtr[4 * s], rowPtr[4 * s + 4])) ]
+			seen = set(queue)
+			for s in queue:
+				for k in range(predPtr[s], predPtr[s + 1]):
+					p = pred[k]
+					if component[p] == i and p not in seen:
+						seen.add(p)
+						queue.append(p)
+			res.extend(queue)
+		return res
+	
+	
 #===========================================================================
 # TEST
 #===========================================================================
@@ -220,8 +542,33 @@ if __name__ == '__main__':
 	print(w.possiblePositionsFromAction((0,0), GridWorld.ACTION_NORTH))
 	print(w.possiblePositionsFromAction((0,0), GridWorld.ACTION_SOUTH))
 	
+	print("\nCompiled transitions of (0,0):")
+	m = w.transitionModel()
+	s = w.stateOfCell[0]
+	for i, a in enumerate(GridWorld.actionSet):
+		k0, k1 = m.rowPtr[s*4 + i], m.rowPtr[s*4 + i + 1]
+		print(a, list(zip(m.next[k0:k1], m.prob[k0:k1])))
+	
 	print("\nRewards:")
 	print("%5.2f" %w.rewardAtCell(0, 0))
 	print("%5.2f" %w.rewardAtCell(1, 1))
 	print("%5.2f" %w.rewardAtCell(3, 0))
-	print("%5.2f" %w.rewardAtCell(3, 1))
\ No newline at end of file
+	print("%5.2f" %w.rewardAtCell(3, 1))	
+	print("\nReachability of a world with a closed room:")
+	w = GridWorld([[GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_WALL, GridWorld.CELL_VOID],
+			   		[GridWorld.CELL_VOID, GridWorld.CELL_EXIT, GridWorld.CELL_WALL, GridWorld.CELL_VOID]])
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	m = w.transitionModel()
+	print("live states %s, closed states %s" % (list(m.liveStates), list(m.closedStates)))
+	
+	print("\nCoarsened world:")
+	w = GridWorld([[GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_EXIT, GridWorld.CELL_VOID],
+				   [GridWorld.CELL_WALL, GridWorld.CELL_WALL, GridWorld.CELL_PIT,  GridWorld.CELL_VOID, GridWorld.CELL_WALL],
+				   [GridWorld.CELL_WALL, GridWorld.CELL_WALL, GridWorld.CELL_PIT,  GridWorld.CELL_PIT,  GridWorld.CELL_VOID]], 0.9)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(100, 10)
+	coarse = w.coarsened(2)
+	print(coarse)
+	print("discount %.2f, step reward %.3f" % (coarse.discFactor, coarse.rew[GridWorld.CELL_VOID]))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import argparse
+import json
+import sys
+import time
+from Instrumentation import CsvSink, JsonLinesSink, ProfileSink
+from Policy import Policy
+from WorldIO import loadWorld, saveBinary
+
+#===============================================================================
+# Headless solver - solves world files without the graphical interface (this
+#		    module must never import tkinter, directly or not)
+#===============================================================================
+
+def addWorldArguments(parser):
+	'''the options that describe the rewards, the probabilities and the restrictions of a world'''
+	parser.add_argument("--step-reward", type = float, default = -0.04)
+	parser.add_argument("--pit-reward", type = float, default = -1)
+	parser.add_argument("--exit-reward", type = float, default = 1)
+	parser.add_argument("--forward", type = float, default = 0.8, help = "forward probability")
+	parser.add_argument("--left", type = float, default = 0.1, help = "left probability")
+	parser.add_argument("--right", type = float, default = 0.1, help = "right probability")
+	parser.add_argument("--backward", type = float, default = 0, help = "backward probability")
+	parser.add_argument("--discount", type = float, default = 1, help = "discount factor")
+	parser.add_argument("--iterations", type = int, default = 1000, help = "max number of iterations")
+	parser.add_argument("--time", type = float, default = 60, help = "max calculation time (secs)")
+
+def evaluationDepth(text):
+	if text in (Policy.DEPTH_FULL, Policy.DEPTH_ADAPTIVE): return text
+	try:
+		depth = int(text)
+	except ValueError:
+		depth = 0
+	if depth < 1: raise argparse.ArgumentTypeError("expected full, adaptive or a positive number of sweeps")
+	return depth
+
+def addSolverArguments(parser):
+	'''the options that choose the algorithm and its modes'''
+	parser.add_argument("-a", "--algorithm", choices = ("vi", "pi", "ps", "tvi", "mrvi"), default = "vi",
+						help = "vi for value iteration, pi for policy iteration, ps for prioritized sweeping, tvi for topological "
+							   "value iteration, mrvi for multiresolution (coarse to fine) value iteration")
+	parser.add_argument("--turbo", action = "store_true", help = "in place (Gauss-Seidel) updates")
+	parser.add_argument("--coarsest", type = int, default = 32, help = "mrvi: max side of the smallest world")
+	parser.add_argument("--backend", choices = (Policy.BACKEND_PYTHON, Policy.BACKEND_NUMPY, Policy.BACKEND_PARALLEL), default = Policy.BACKEND_PYTHON,
+						help = "parallel splits the numpy sweeps of the value iteration among processes")
+	parser.add_argument("--workers", type = int, default = None, help = "processes of the parallel backend (default: one for each core)")
+	parser.add_argument("--evaluation", choices = (Policy.EVALUATION_ITERATIVE, Policy.EVALUATION_EXACT),
+						default = Policy.EVALUATION_ITERATIVE, help = "policy evaluation of the policy iteration")
+	parser.add_argument("--depth", type = evaluationDepth, default = Policy.DEPTH_FULL,
+						help = "sweeps of each policy evaluation of the policy iteration: full, adaptive or a number "
+							   "(modified policy iteration, see Policy.setEvaluationDepth)")
+	parser.add_argument("--stop", choices = Policy.STOPPING_RULES, default = Policy.STOP_AUTO,
+						help = "when the sweeps stop (see Policy.setStoppingRule), auto is bound when the discount "
+							   "factor is less than 1 and span when it is 1")
+	parser.add_argument("--tolerance", type = float, default = 1e-6, help = "tolerance of the absolute, relative and span stopping rules")
+	parser.add_argument("--stable-sweeps", type = int, default = 5, help = "sweeps without changes of the policy of the policy stopping rule")
+
+def configureWorld(w, args):
+	w.setRewards(args.step_reward, args.pit_reward, args.exit_reward)
+	w.setProbabilities(args.forward, args.left, args.right, args.backward)
+	w.setDiscountFactor(args.discount)
+	w.setAlgorithmRestrictions(args.iterations, args.time)
+
+def newPolicy(w, args, reporter = None, sinks = None):
+	p = Policy(w, backend = args.backend, evaluation = args.evaluation, reporter = reporter,
+			   warmStart = getattr(args, "warm", False), sinks = sinks)
+	p.setStoppingRule(getattr(args, "stop", Policy.STOP_AUTO), getattr(args, "tolerance", None), getattr(args, "stable_sweeps", None))
+	p.setEvaluationDepth(getattr(args, "depth", Policy.DEPTH_FULL))
+	p.workers = getattr(args, "workers", None)
+	return p
+
+def runSolver(p, args):
+	'''runs the algorithm chosen by args, returns the number of iterations'''
+	if args.algorithm == "vi": return p.valueIteration(turbo = args.turbo)
+	if args.algorithm == "ps": return p.prioritizedSweeping()
+	if args.algorithm == "tvi": return p.topologicalValueIteration()
+	if args.algorithm == "mrvi": return p.multiresolutionValueIteration(coarsestSide = getattr(args, "coarsest", 32))
+	return p.policyIteration(turbo = args.turbo)
+
+def resultsToText(file_path, p, args):
+	return ("# %s: %s, iterations %d (%s), elapsed %.3f secs\n" % (file_path, args.algorithm, p.numOfIterations, p.stopReason, p.elapsed) +
+			"utilities:\n" + p.utilityVectorToString() + "\n" +
+			"policy:\n" + p.policyToString() + "\n")
+
+def policyResults(p):
+	'''the results of a solved policy, as a dictionary that can be written as JSON'''
+	c, r = p.world.size
+	policy = p.policyToString().split("\n")
+	return {"iterations": p.numOfIterations,
+			"stopReason": p.stopReason,
+			"sweepsSaved": p.sweepsSaved,
+			"elapsed": p.elapsed,
+			"utilities": [ [ p.utilityAt(x, y) for x in range(c) ] for y in range(r) ],
+			"policy": [ row.replace(" ", "") for row in policy ]}
+
+def resultsToDict(file_path, p, args):
+	res = {"world": file_path, "algorithm": args.algorithm}
+	res.update(policyResults(p))
+	return res
+
+def solveMain(argv):
+	'''the "solve" command, returns the exit status'''
+	parser = argparse.ArgumentParser(prog = "mdp_grid_world solve",
+									 description = "solve one or more world files without the graphical interface")
+	parser.add_argument("worlds", nargs = "+", metavar = "file", help = "world files")
+	addWorldArguments(parser)
+	addSolverArguments(parser)
+	parser.add_argument("-o", "--output", help = "output file (default: standard output)")
+	parser.add_argument("--format", choices = ("text", "json"), default = "text",
+						help = "json writes one object per line")
+	parser.add_argument("--timing", action = "store_true", help = "print the load/solve/output times on the standard error")
+	parser.add_argument("--binary", metavar = "FILE", help = "also save the world and its results in the binary format (see WorldIO.BinaryResults), "
+															"only with one world file")
+	parser.add_argument("--trace", metavar = "FILE", help = "write an event per iteration (sweep time, residual, changed states, "
+														   "evaluation and improvement of the policy iteration), as CSV if FILE "
+														   "ends with .csv, otherwise as JSON lines")
+	parser.add_argument("--profile", action = "store_true", help = "run the solves under cProfile and print the statistics on the standard error")
+	args = parser.parse_args(argv)
+	if args.binary and len(args.worlds) > 1: parser.error("--binary needs exactly one world file")
+
+	out = open(args.output, 'w') if args.output else sys.stdout
+	trace = open(args.trace, 'w', newline = "") if args.trace else None
+	sinks = []
+	if trace: sinks.append((CsvSink if args.trace.endswith(".csv") else JsonLinesSink)(trace))
+	if args.profile: sinks.append(ProfileSink())
+	try:
+		for file_path in args.worlds:
+			t0 = time.perf_counter()
+			w = loadWorld(file_path, discountFactor = args.discount)
+			configureWorld(w, args)
+			if trace: sinks[0].label = file_path
+			p = newPolicy(w, args, sinks = sinks)
+			t1 = time.perf_counter()
+			runSolver(p, args)
+			t2 = time.perf_counter()
+			if args.format == "json": out.write(json.dumps(resultsToDict(file_path, p, args)) + "\n")
+			else: out.write(resultsToText(file_path, p, args))
+			out.flush()
+			if args.binary: saveBinary(args.binary, w, p)
+			if args.timing:
+				print("%s: load %.3f secs, solve %.3f secs, output %.3f secs" % (file_path, t1 - t0, t2 - t1, time.perf_counter() - t2),
+					  file = sys.stderr)
+	finally:
+		if out is not sys.stdout: out.close()
+		if trace: trace.close()
+	if args.profile: sinks[-1].printStats()
+	return 0
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	solveMain(["world.txt", "--algorithm", "pi", "--discount", "0.9"])
+	print("tkinter loaded: %s" % ("tkinter" in sys.modules))
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import cProfile
+import csv
+import io
+import json
+import pstats
+import sys
+
+#===============================================================================
+# Instrumentation - the solvers of a Policy send an IterationEvent to its sinks
+#		    after each iteration, and call begin/end around each solve. A
+#		    Policy without sinks doesn't build the events at all
+#===============================================================================
+
+class IterationEvent:
+
+	'''what happened in one iteration of a solver, the fields that don't apply to the algorithm are None'''
+	FIELDS = ("algorithm",
+			  "iteration",
+			  "elapsed",			#wall clock seconds since the beginning of the solve
+			  "sweepTime",			#wall clock seconds of this iteration
+			  "residual",			#max norm of the change of the utilities (for ps: the biggest residual left in the queue)
+			  "changed",			#states whose utility changed
+			  "backups",			#ps: updates of single states in this iteration
+			  "evaluationSweeps",	#pi: sweeps of the policy evaluation (0 for the exact evaluation)
+			  "evaluationTime",		#pi: seconds of the policy evaluation
+			  "improvementTime",	#pi: seconds of the policy improvement
+			  "policyChanges")		#pi: states whose action changed
+	__slots__ = FIELDS
+
+	def __init__(self, algorithm, iteration, elapsed, sweepTime, residual, changed = None, **others):
+		for name in IterationEvent.FIELDS: setattr(self, name, None)
+		self.algorithm = algorithm
+		self.iteration = iteration
+		self.elapsed = elapsed
+		self.sweepTime = sweepTime
+		self.residual = residual
+		self.changed = changed
+		for name, value in others.items(): setattr(self, name, value)
+
+	def asDict(self):
+		return { name: getattr(self, name) for name in IterationEvent.FIELDS }
+
+def endRecord(policy, algorithm):
+	'''the summary of a solve, written by the sinks at its end'''
+	return {"algorithm": algorithm,
+			"iterations": policy.numOfIterations,
+			"converged": policy.converged,
+			"stopReason": policy.stopReason,
+			"elapsed": policy.elapsed,
+			"cpuElapsed": policy.cpuElapsed}
+
+#===============================================================================
+# Sinks
+#===============================================================================
+
+class Sink:
+
+	'''the base sink, it ignores everything'''
+
+	def begin(self, policy, algorithm):
+		pass
+
+	def event(self, event):
+		pass
+
+	def end(self, policy, algorithm):
+		pass
+
+class MemorySink(Sink):
+
+	'''keeps the events and the end records of the solves in two lists'''
+	events = None
+	solves = None
+
+	def __init__(self):
+		self.events = []
+		self.solves = []
+
+	def event(self, event):
+		self.events.append(event)
+
+	def end(self, policy, algorithm):
+		self.solves.append(endRecord(policy, algorithm))
+
+	def phaseTimes(self):
+		'''the total seconds of the sweeps, and of the evaluations and the improvements of the policy iteration'''
+		res = {"sweepTime": 0, "evaluationTime": 0, "improvementTime": 0}
+		for e in self.events:
+			for name in res: res[name] += getattr(e, name) or 0
+		return res
+
+class StreamSink(Sink):
+
+	'''the base of the sinks that write on a stream, label (for example the name of the world file)
+		is written in every record, to tell the solves apart
+	'''
+	stream = None
+	label = None
+
+	def __init__(self, stream, label = None):
+		self.stream = stream
+		self.label = label
+
+	def record(self, values):
+		res = {"label": self.label}
+		res.update(values)
+		return res
+
+class JsonLinesSink(StreamSink):
+
+	'''writes a JSON object per iteration, and one with "end": true at the end of each solve'''
+
+	def event(self, event):
+		self.stream.write(json.dumps(self.record(event.asDict())) + "\n")
+
+	def end(self, policy, algorithm):
+		res = self.record(endRecord(policy, algorithm))
+		res["end"] = True
+		self.stream.write(json.dumps(res) + "\n")
+		self.stream.flush()
+
+class CsvSink(StreamSink):
+
+	'''writes a row per iteration, the header is written before the first row'''
+	__writer = None
+
+	def event(self, event):
+		if self.__writer is None:
+			self.__writer = csv.DictWriter(self.stream, ("label",) + IterationEvent.FIELDS)
+			self.__writer.writeheader()
+		self.__writer.writerow(self.record(event.asDict()))
+
+	def end(self, policy, algorithm):
+		self.stream.flush()
+
+class ProfileSink(Sink):
+
+	'''runs the solves under cProfile (it is not cheap: use it to find where the time goes, not always),
+		the statistics of all the solves seen are added together
+	'''
+	profile = None
+
+	def __init__(self):
+		self.profile = cProfile.Profile()
+
+	def begin(self, policy, algorithm):
+		self.profile.enable()
+
+	def end(self, policy, algorithm):
+		self.profile.disable()
+
+	def printStats(self, stream = None, sort = "cumulative", limit = 25):
+		pstats.Stats(self.profile, stream = (stream or sys.stderr)).sort_stats(sort).print_stats(limit)
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	from GridWorld import GridWorld
+	from Policy import Policy
+
+	cells = [ [ GridWorld.CELL_VOID ] * 20 for _ in range(15) ]
+	cells[0][19] = GridWorld.CELL_EXIT
+	cells[7][10] = GridWorld.CELL_PIT
+	w = GridWorld(cells, discountFactor = 0.95)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 60)
+
+	memory, lines, table, profile = MemorySink(), io.StringIO(), io.StringIO(), ProfileSink()
+	p = Policy(w, sinks = [ memory, JsonLinesSink(lines, "test"), CsvSink(table, "test"), profile ])
+	p.valueIteration()
+	p.resetResults()
+	p.prioritizedSweeping()
+	p.resetResults()
+	p.policyIteration()
+
+	for e in memory.events[:3] + memory.events[-3:]: print(e.asDict())
+	print(memory.solves)
+	print({ name: round(t, 6) > 0 for name, t in memory.phaseTimes().items() })
+	print("jsonl lines %d, csv lines %d" % (len(lines.getvalue().splitlines()), len(table.getvalue().splitlines())))
+	out = io.StringIO()
+	profile.printStats(out, limit = 3)
+	print("profiled __bellmanSweep: %s" % ("__bellmanSweep" in out.getvalue()))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import numpy as np
+from GridWorld import GridWorld
+
+#===============================================================================
+# Stencil functions - they work on grids of shape (..., rows, columns), so the
+#		      same code can sweep one world or a stack of worlds
+#===============================================================================
+
+def shiftedPlanes(grid, blocked):
+	'''returns, in the order of GridWorld.actionSet, the value found moving north, south, west
+		and east from each cell of grid. blocked[d] is True where the move d hits a wall
+		(the border is handled by the shift itself), in these cells we stay where we are
+	'''
+	planes = (np.concatenate((grid[..., :1, :], grid[..., :-1, :]), axis = -2),
+			  np.concatenate((grid[..., 1:, :], grid[..., -1:, :]), axis = -2),
+			  np.concatenate((grid[..., :, :1], grid[..., :, :-1]), axis = -1),
+			  np.concatenate((grid[..., :, 1:], grid[..., :, -1:]), axis = -1))
+	for plane, mask in zip(planes, blocked):
+		np.copyto(plane, grid, where = mask)
+	return planes
+
+def blockedMasks(walls):
+	'''given the mask of the wall cells, returns the masks used by shiftedPlanes'''
+	return tuple((plane & ~walls) for plane in shiftedPlanes(walls, (False, False, False, False)))
+
+def actionWeights(world):
+	'''weights[a][d] is the probability to move in the direction d when we choose the action a'''
+	res = []
+	for a in GridWorld.actionSet:
+		prob = world.probabilitiesFromAction(a)
+		res.append([ prob[d] for d in GridWorld.actionSet ])
+	return res
+
+def maxExpectedUtility(grid, blocked, weights):
+	'''the max, over the actions, of the sum of the utilities of the next cells weighted by their
+		probabilities. weights is a 4x4 table (see actionWeights) or a list of 4x4 tables of
+		arrays that broadcast against grid (one for each world of a stack)
+	'''
+	planes = shiftedPlanes(grid, blocked)
+	res = None
+	for a in range(4):
+		q = expectedUtility(planes, weights[a])
+		res = q if res is None else np.maximum(res, q)
+	return res
+
+def expectedUtility(planes, weights):
+	'''the sum of the planes weighted by weights, the planes with weight 0 are skipped (0 * an infinite
+		utility, see TransitionModel.fixedUtilities, would be nan)
+	'''
+	q = None
+	for plane, weight in zip(planes, weights):
+		if np.any(weight): q = weight * plane if q is None else q + weight * plane
+	return q
+
+def changeStats(new, old):
+	'''the measures of a sweep from the grid old to the grid new that the stopping rules of Policy use:
+		the max norm of the change, its min and its max (0 when nothing changed, the exits and the pits
+		never change, like the walls), the biggest finite absolute utility of new and the number of
+		changed cells (for the sinks of Policy)
+	'''
+	top, bottom = float(new.max()), float(new.min())
+	if np.isinf(top) or np.isinf(bottom):
+		#the infinite utilities that don't change would give nan differences
+		with np.errstate(invalid = 'ignore'):
+			diff = np.where(new != old, new - old, 0)
+		top = float(np.max(np.abs(new), where = np.isfinite(new), initial = 0))
+	else:
+		#the cells that didn't change have a difference of exactly 0
+		diff = new - old
+		top = max(top, -bottom)
+	low, high = float(diff.min()), float(diff.max())
+	return max(high, -low), low, high, top, int(np.count_nonzero(diff))
+
+#===============================================================================
+# NumpyBackend - value iteration sweeps as whole array operations
+#===============================================================================
+
+class NumpyBackend:
+
+	'''holds the utilities as a 2-D array and computes the four action planes with shifted arrays
+		and wall masks, instead of visiting the states one at a time
+	'''
+	version = None	#the version of the world the backend was built for
+
+	def __init__(self, world):
+		c, r = world.size
+		self.version = world.version
+		self.shape = (r, c)
+		cells = np.frombuffer(world.cellCodes(), dtype = np.uint8).reshape(self.shape)
+
+		self.cellOfState = np.frombuffer(world.cellOfState, dtype = np.int32)
+		self.voids = cells == GridWorld.CELL_VOID
+		#the cells updated by the sweeps, see TransitionModel
+		live = np.zeros(r * c, dtype = bool)
+		live[self.cellOfState] = np.frombuffer(world.transitionModel().isLive, dtype = np.uint8).astype(bool)
+		self.live = live.reshape(self.shape)
+		self.blocked = blockedMasks(cells == GridWorld.CELL_WALL)
+		self.weights = actionWeights(world)
+		self.reward = np.choose(cells, [ world.rew[t] for t in range(4) ]).astype(float)
+		self.world = world
+
+		#red-black ordering of the cells for the turbo mode: the 4 neighbours of a cell have the other color
+		ys, xs = np.indices(self.shape)
+		red = (xs + ys) % 2 == 0
+		self.colors = (self.live & red, self.live & ~red)
+
+	def toGrid(self, values):
+		'''returns the state vector values as a 2-D array, the walls are 0'''
+		grid = np.zeros(self.shape[0] * self.shape[1])
+		grid[self.cellOfState] = np.frombuffer(values)
+		return grid.reshape(self.shape)
+
+	def expectedUtilities(self, values):
+		'''for each state and each action, the sum of the utilities of the next states weighted by their
+			probabilities, as an array of shape (numStates, 4) (see Policy.__expectedUtilityTable)
+		'''
+		planes = shiftedPlanes(self.toGrid(values), self.blocked)
+		res = np.empty((len(self.cellOfState), 4))
+		for a in range(4):
+			sums = expectedUtility(planes, self.weights[a])
+			res[:, a] = np.where(self.voids, sums, 0).ravel()[self.cellOfState]
+		return res
+
+	def sweep(self, values, newValues):
+		'''the same as Policy.__bellmanSweep: one Bellman update of the live states, from the state vector
+			values to the state vector newValues, the other states keep their utilities. If they are
+			the same vector (turbo mode) the cells are updated in red-black order, so the black cells
+			already use the new utilities of the red ones
+			
+			returns (maxNorm, minChange, maxChange, maxUtility, changed), see changeStats
+		'''
+		dfact = self.world.discFactor
+		old = self.toGrid(values)
+		if newValues is values:
+			grid = old.copy()
+			for color in self.colors:
+				new = self.reward + dfact * maxExpectedUtility(grid, self.blocked, self.weights)
+				np.copyto(grid, new, where = color)
+		else:
+			grid = np.where(self.live, self.reward + dfact * maxExpectedUtility(old, self.blocked, self.weights), old)
+
+		np.frombuffer(newValues)[:] = grid.ravel()[self.cellOfState]
+		return changeStats(grid, old)
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	from Policy import Policy
+	import random
+
+	random.seed(0)
+	cells = [ [ (GridWorld.CELL_WALL if random.random() < 0.2 else GridWorld.CELL_VOID) for _ in range(30) ] for _ in range(20) ]
+	cells[0][29] = GridWorld.CELL_EXIT
+	cells[5][12] = GridWorld.CELL_PIT
+	w = GridWorld(cells, discountFactor = 0.9)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 60)
+
+	for turbo in (False, True):
+		pp = Policy(w)
+		pn = Policy(w, backend = Policy.BACKEND_NUMPY)
+		print("turbo %s, iterations: python %d, numpy %d" % (turbo, pp.valueIteration(turbo = turbo), pn.valueIteration(turbo = turbo)))
+		#in turbo mode the two backends visit the cells in a different order, so they stop at different
+		#points within the epsilon of the fixed point
+		print("max difference: %g" % max(abs(a - b) for a, b in zip(pp.values, pn.values)))
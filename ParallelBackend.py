@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import os
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+from threading import BrokenBarrierError
+import numpy as np
+from NumpyBackend import NumpyBackend, blockedMasks, maxExpectedUtility, changeStats
+
+#===============================================================================
+# ParallelBackend - the sweeps of NumpyBackend split among processes: the grid
+#		    is cut in horizontal strips, one for each worker, and the
+#		    utilities are in shared memory, so the rows at the border of a
+#		    strip are read by the workers of the strips next to it
+#===============================================================================
+
+#commands of the workers, LOAD can be added to SWEEP and TURBO
+SWEEP  = 1
+TURBO  = 2
+LOAD   = 4	#the utilities of the sweep are in the shared state vector, not in the grid
+STOP   = 8
+
+def _sharedArray(shape, dtype, name = None):
+	'''a numpy array in a shared memory block, a new one if name is None. Returns (block, array)'''
+	size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+	block = shared_memory.SharedMemory(name = name, create = name is None, size = size)
+	return block, np.ndarray(shape, dtype = dtype, buffer = block.buf)
+
+def _work(spec, strip, start, done, strips):
+	'''the main function of a worker, it attaches the shared arrays and runs _sweepLoop'''
+	blocks, arrays = [], {}
+	for key, (name, shape, dtype) in spec["arrays"].items():
+		block, arrays[key] = _sharedArray(shape, dtype, name)
+		blocks.append(block)
+	try:
+		_sweepLoop(arrays, spec, strip, start, done, strips)
+	except BrokenBarrierError:
+		pass
+	except BaseException:
+		#the main process must not wait forever
+		for barrier in (start, done, strips): barrier.abort()
+		raise
+	finally:
+		arrays.clear()
+		for block in blocks: block.close()
+
+def _sweepLoop(arrays, spec, strip, start, done, strips):
+	'''the loop of a worker: at each start it copies the utilities of its states in the grid (if they
+		aren't already there), waits the other workers (so the rows around its strip are ready),
+		sweeps the strip, writes the new utilities of its states and its changeStats, and at last, when
+		the other workers don't read its rows anymore, it leaves them in the grid for the next sweep
+	'''
+	index, y0, y1, s0, s1 = strip
+	r, c = spec["shape"]
+	dfact, weights = spec["discFactor"], spec["weights"]
+	#the strip with a row of halo above and below (where there are rows), only the strip is updated
+	top, bottom = max(0, y0 - 1), min(r, y1 + 1)
+	inner = slice(y0 - top, y1 - top)
+	cells = arrays["cells"][top:bottom]
+	blocked = blockedMasks(cells == spec["wall"])
+	reward = np.asarray(spec["rewards"])[cells]
+	live = arrays["live"][top:bottom].astype(bool)
+	live[:y0 - top] = live[y1 - top:] = False
+	ys, xs = np.indices(cells.shape)
+	red = (xs + ys + top) % 2 == 0
+	colors = (live & red, live & ~red)
+	grid, flat = arrays["grid"][top:bottom], arrays["grid"].reshape(-1)
+	states = arrays["cellOfState"][s0:s1]
+	local = states - y0 * c
+	vin, vout, stats, command = arrays["in"], arrays["out"], arrays["stats"], arrays["command"]
+	done.wait()	#ready
+	while True:
+		start.wait()
+		if command[0] == STOP: return
+		if command[0] & LOAD:
+			flat[states] = vin[s0:s1]
+			strips.wait()
+		old = grid[inner].copy()
+		if command[0] & TURBO:
+			for color in colors:
+				new = reward + dfact * maxExpectedUtility(grid, blocked, weights)
+				np.copyto(grid, new, where = color)
+				strips.wait()
+			new = grid[inner]
+		else:
+			new = np.where(live, reward + dfact * maxExpectedUtility(grid, blocked, weights), grid)[inner]
+		vout[s0:s1] = new.reshape(-1)[local]
+		stats[index] = changeStats(new, old)
+		if not command[0] & TURBO:
+			strips.wait()
+			grid[inner] = new
+		done.wait()
+
+def _shutdown(processes, start, command, blocks):
+	'''stops the workers and frees the shared memory, it runs when the backend is garbage collected'''
+	if any(p.is_alive() for p in processes):
+		np.ndarray((1,), dtype = np.int64, buffer = command.buf)[0] = STOP
+		try:
+			start.wait(timeout = 10)
+		except BrokenBarrierError:
+			pass
+	for p in processes:
+		p.join(timeout = 10)
+		if p.is_alive(): p.terminate()
+	for block in blocks:
+		#the arrays of a backend closed by hand still use the block, it goes away with them
+		try:
+			block.close()
+		except BufferError:
+			pass
+		block.unlink()
+
+class ParallelBackend(NumpyBackend):
+
+	'''the same sweeps of NumpyBackend (the same floating point operations, so the same results) done by
+		workers processes, each one on a strip of rows. The strips have about the same number of void
+		cells. The workers start with the backend and stay alive until it is garbage collected (or
+		close is called). The grid in shared memory keeps the utilities of the last sweep, so the state
+		vector is copied there only when it isn't the one given back by the last sweep (it must not be
+		changed between the sweeps); the rest is done by the workers, in the turbo mode they wait each
+		other between the red and the black cells
+	'''
+
+	def __init__(self, world, workers = None):
+		super().__init__(world)
+		r, c = self.shape
+		n = len(self.cellOfState)
+		self.requestedWorkers = workers
+		workers = max(1, min(workers or os.cpu_count() or 1, r))
+
+		#the strips, cut where the cumulative number of void cells reaches i / workers of them
+		voidsPerRow = np.cumsum(self.voids.sum(axis = 1))
+		cuts = np.searchsorted(voidsPerRow, np.arange(1, workers) * voidsPerRow[-1] / workers, side = 'right') + 1
+		bounds = np.unique(np.concatenate(([0], np.clip(cuts, 1, r - 1), [r])))
+		states = np.searchsorted(self.cellOfState, bounds * c)
+		self.workers = len(bounds) - 1
+
+		self.__blocks = []
+		spec = {"arrays": {}, "shape": self.shape, "discFactor": world.discFactor, "weights": self.weights,
+				"rewards": [ world.rew[t] for t in range(4) ], "wall": world.CELL_WALL}
+		def shared(key, shape, dtype):
+			block, array = _sharedArray(shape, dtype)
+			self.__blocks.append(block)
+			spec["arrays"][key] = (block.name, shape, dtype)
+			return array
+		shared("cells", self.shape, np.uint8)[:] = np.frombuffer(world.cellCodes(), dtype = np.uint8).reshape(self.shape)
+		shared("live", self.shape, np.uint8)[:] = self.live
+		shared("cellOfState", (n,), np.int32)[:] = self.cellOfState
+		shared("grid", self.shape, np.float64)[:] = 0
+		self.__in = shared("in", (n,), np.float64)
+		self.__out = shared("out", (n,), np.float64)
+		self.__stats = shared("stats", (self.workers, 5), np.float64)
+		self.__command = shared("command", (1,), np.int64)
+		commandBlock = self.__blocks[-1]
+
+		#the barriers must live as long as the workers: with the spawn start method they read them after start
+		self.__start = multiprocessing.Barrier(self.workers + 1)
+		self.__done = multiprocessing.Barrier(self.workers + 1)
+		self.__strips = multiprocessing.Barrier(self.workers)
+		self.__processes = []
+		for i in range(self.workers):
+			strip = (i, int(bounds[i]), int(bounds[i + 1]), int(states[i]), int(states[i + 1]))
+			p = multiprocessing.Process(target = _work, args = (spec, strip, self.__start, self.__done, self.__strips), daemon = True)
+			p.start()
+			self.__processes.append(p)
+		self.__last = None	#weak reference to the state vector written by the last sweep
+		self.close = weakref.finalize(self, _shutdown, self.__processes, self.__start, commandBlock, self.__blocks)
+		try:
+			self.__done.wait(timeout = 60)
+		except BrokenBarrierError:
+			self.close()
+			raise Exception("the workers of the parallel backend didn't start")
+
+	def sweep(self, values, newValues):
+		'''the same as NumpyBackend.sweep'''
+		command = TURBO if newValues is values else SWEEP
+		if self.__last is None or self.__last() is not values:
+			self.__in[:] = np.frombuffer(values)
+			command |= LOAD
+		self.__command[0] = command
+		self.__last = None
+		try:
+			self.__start.wait()
+			self.__done.wait()
+		except BrokenBarrierError:
+			raise Exception("a worker of the parallel backend failed")
+		np.frombuffer(newValues)[:] = self.__out
+		self.__last = weakref.ref(newValues)
+		stats = self.__stats
+		return (float(stats[:, 0].max()), float(stats[:, 1].min()), float(stats[:, 2].max()), float(stats[:, 3].max()),
+				int(stats[:, 4].sum()))
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	import time
+	import random
+	from GridWorld import GridWorld
+	from Policy import Policy
+
+	random.seed(0)
+	cells = [ [ (GridWorld.CELL_WALL if random.random() < 0.2 else GridWorld.CELL_VOID) for _ in range(200) ] for _ in range(150) ]
+	cells[0][199] = GridWorld.CELL_EXIT
+	for _ in range(15): cells[random.randrange(150)][random.randrange(200)] = GridWorld.CELL_PIT
+	#a closed room, its utilities are pinned and not swept
+	for x in range(5): cells[70][x] = cells[74][x] = GridWorld.CELL_WALL
+	for y in range(70, 75): cells[y][5] = GridWorld.CELL_WALL
+	w = GridWorld(cells, discountFactor = 0.99)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(100000, 600)
+	w.transitionModel()	#compiled once, out of the measures
+
+	for turbo, dfact in ((False, 0.99), (True, 0.99), (False, 1)):
+		w.setDiscountFactor(dfact)
+		pn = Policy(w, backend = Policy.BACKEND_NUMPY)
+		start = time.perf_counter()
+		pn.valueIteration(turbo = turbo)
+		numpyTime = time.perf_counter() - start
+		for workers in (1, 4):
+			pp = Policy(w, backend = Policy.BACKEND_PARALLEL)
+			pp.workers = workers
+			start = time.perf_counter()
+			pp.valueIteration(turbo = turbo)
+			print("discount %g, turbo %s, %d workers: %d iterations (numpy %d), %.2f secs (numpy %.2f), same utilities %s, same policy %s" %
+				  (dfact, turbo, workers, pp.numOfIterations, pn.numOfIterations, time.perf_counter() - start, numpyTime,
+				   pp.values == pn.values, pp.policyCodes() == pn.policyCodes()))
@@ -9,39 +9,288 @@
 ###########################################
 
 from GridWorld import GridWorld
-from tkinter import *
-from tkinter import messagebox
+from Reporter import Reporter, ConsoleReporter
+from Instrumentation import IterationEvent
+from array import array
+import heapq
 import math
+import operator
 import time
 
 class Policy:
-	valueIterationEpsilon = 0.1
-	maxNumberOfIterations = 0		#for example the maps that have no exits
-	timeToLive = 0			#number of seconds to iterate before exiting (if algorithm stucks)
-	_pe_maxk = 50	#for policy evaluation, max number of iteration
-		
-	world = None
+	# Defaults of the configuration of each policy (see the slots with the same names in lower case)
+	VALUE_ITERATION_EPSILON = 0.1
+	PE_MAXK = 50
+	IMPROVEMENT_TOLERANCE = 1e-12
+	
+	# Backends of the value iteration
+	BACKEND_PYTHON = 'python'	#loops over the compiled TransitionModel
+	BACKEND_NUMPY  = 'numpy'	#whole array operations, see NumpyBackend
+	BACKEND_PARALLEL = 'parallel'	#the numpy sweeps split among processes, see ParallelBackend
+	
+	# Policy evaluation modes of the policy iteration
+	EVALUATION_ITERATIVE = 'iterative'	#at most _pe_maxk sweeps
+	EVALUATION_EXACT     = 'exact'		#sparse linear solve, see ExactEvaluation
+	# Depth of the iterative policy evaluation, see setEvaluationDepth
+	DEPTH_FULL     = 'full'			#until the stopping rule, at most _pe_maxk sweeps
+	DEPTH_ADAPTIVE = 'adaptive'		#until the residual is adaptiveRatio times the one of the first sweep
+	
+	NO_ACTION = 255	#the action code of the exits and the pits in the policy vectors
+	
+	# Stopping rules of the sweeps, see setStoppingRule
+	STOP_AUTO     = 'auto'		#bound when discFactor < 1, span when it is 1
+	STOP_BOUND    = 'bound'		#max norm <= valueIterationEpsilon * (1 - discFactor) / discFactor (AIMA pag. 654)
+	STOP_ABSOLUTE = 'absolute'	#max norm <= stopTolerance
+	STOP_RELATIVE = 'relative'	#max norm <= stopTolerance * the biggest absolute utility
+	STOP_SPAN     = 'span'		#max - min of the change of the utilities <= stopTolerance (undiscounted problems)
+	STOP_POLICY   = 'policy'	#the greedy policy didn't change for stableSweeps sweeps
+	STOPPING_RULES = (STOP_AUTO, STOP_BOUND, STOP_ABSOLUTE, STOP_RELATIVE, STOP_SPAN, STOP_POLICY)
+	
+	# Reasons of the end of a solve (stopReason)
+	REASON_CONVERGED  = 'converged'
+	REASON_ITERATIONS = 'iterations'	#maxNumberOfIterations reached
+	REASON_TIME       = 'time'			#timeToLive reached
+	REASON_STOPPED    = 'stopped'		#the debugCallback returned False
 	
-	numOfIterations = 0
-	elapsed = 0
-	utilities = None #memorized as the world grid [y][x]
-	policy = None #created 
+	__slots__ = ("world",
+				 # Configuration: every policy has its own, so many of them can be solved at the same time
+				 "valueIterationEpsilon",	#max error of the utilities of the bound stopping rule
+				 "maxNumberOfIterations",	#for example the maps that have no exits, see setLimits
+				 "timeToLive",				#number of seconds to iterate before exiting (if algorithm stucks)
+				 "_pe_maxk",				#for policy evaluation, max number of iteration
+				 "improvementTolerance",	#smaller improvements are rounding errors, they don't change the policy
+				 "backend",
+				 "workers",				#processes of the parallel backend, None for one for each core
+				 "evaluation",
+				 "evaluationDepth",		#see setEvaluationDepth
+				 "adaptiveRatio",
+				 "reporter",			#where the warnings go, see Reporter
+				 "stoppingRule",		#see setStoppingRule
+				 "stopTolerance",
+				 "stableSweeps",
+				 "sinks",				#where the events of the iterations go, see Instrumentation
+				 "__vectorBackend",
+				 "__exactSolver",
+				 # Warm start: resetResults keeps the results of the last converged solve as starting point
+				 "warmStart",
+				 "sweepsSaved",			#iterations saved by the last warm started solve
+				 "__solution",			#(utilities, policy) of the last converged solve
+				 "__coldIterations",	#iterations of the last solve from scratch of each algorithm
+				 "__seeded",
+				 "__seedPolicy",
+				 # Results
+				 "values",				#the utility of each state (see GridWorld.stateOfCell), array of doubles
+				 "policy",				#the action code (index in GridWorld.actionSet) of each state, array of bytes
+				 "numOfIterations",
+				 "numOfBackups",		#updates of single states done by the prioritizedSweeping
+				 "levels",				#(columns, rows, iterations) of each world solved by the multiresolutionValueIteration
+				 "converged",			#if the last solve reached its fixed point (and wasn't stopped by the limits)
+				 "stopReason",			#why the last solve ended, one of the REASON_ constants
+				 "elapsed",				#wall clock seconds of the last solve, the time limit of the world is checked on it
+				 "cpuElapsed",			#processor seconds of the last solve
+				 "__clockStart",
+				 # Cache of the queries, see __expectedUtilityTable
+				 "__valuesVersion",		#incremented by utilitiesChanged
+				 "__table",
+				 "__tableStamp")
 	
-	def __init__(self, world):
+	def __init__(self, world, backend = BACKEND_PYTHON, evaluation = EVALUATION_ITERATIVE, reporter = None, warmStart = False, sinks = None):
+		if backend not in (Policy.BACKEND_PYTHON, Policy.BACKEND_NUMPY, Policy.BACKEND_PARALLEL):
+			raise Exception("unknown backend")
+		if evaluation not in (Policy.EVALUATION_ITERATIVE, Policy.EVALUATION_EXACT):
+			raise Exception("unknown evaluation mode")
 		self.world = world
+		self.valueIterationEpsilon = Policy.VALUE_ITERATION_EPSILON
+		self._pe_maxk = Policy.PE_MAXK
+		self.improvementTolerance = Policy.IMPROVEMENT_TOLERANCE
+		self.setLimits(world.numberOfIterations, world.timeToLive)
+		self.backend = backend
+		self.workers = None
+		self.evaluation = evaluation
+		self.reporter = reporter if reporter else ConsoleReporter()
+		self.sinks = list(sinks) if sinks else []
+		self.setStoppingRule(Policy.STOP_AUTO, 1e-6, 5)
+		self.setEvaluationDepth(Policy.DEPTH_FULL, 0.1)
+		self.__vectorBackend = None
+		self.__exactSolver = None
+		self.warmStart = warmStart
+		self.__solution = None
+		self.__coldIterations = {}
+		self.numOfBackups = 0
+		self.levels = []
+		self.elapsed = self.cpuElapsed = 0
+		self.__clockStart = None
+		self.__valuesVersion = 0
+		self.__table = self.__tableStamp = None
 		self.resetResults()
-
-		Policy.maxNumberOfIterations = self.world.numberOfIterations
-		Policy.timeToLive = self.world.timeToLive
-		
-	def __createEmptyUtilityVector(self):
-		'''creates an empty utility vector (that in this case is a matrix), with all number to 0'''
-		c, r = self.world.size 
-		return [ [ 0 for _ in range(c) ] for _ in range(r) ]
-				
+	
+	def __createEmptyStateVector(self):
+		'''creates a vector with a 0 for each state of the world (see GridWorld.stateOfCell)'''
+		return array('d', bytes(8 * self.world.numStates))
+	
+	def utilityAt(self, x, y):
+		'''the utility of the cell (x, y), 0 for the walls'''
+		s = self.world.stateOfCell[y * self.world.size[0] + x]
+		return 0 if s < 0 else self.values[s]
+	
 	def resetResults(self):
+		'''prepares the policy for a new solve. In the warm start mode, if the last solve converged,
+			the next one starts from its utilities and policy instead of the zeros: after a small
+			change of the rewards, of the probabilities or of the discount factor it needs few iterations
+		'''
 		self.numOfIterations = 0
-		self.utilities = self.__createEmptyUtilityVector()
+		self.sweepsSaved = 0
+		self.converged = False
+		self.stopReason = None
+		self.policy = None
+		self.utilitiesChanged()
+		self.__seeded = bool(self.warmStart and self.__solution and len(self.__solution[0]) == self.world.numStates)
+		if self.__seeded:
+			#infinite utilities (the improper states of the exact evaluation) would never converge
+			self.values = array('d', [ (u if math.isfinite(u) else 0) for u in self.__solution[0] ])
+			self.__seedPolicy = self.__solution[1]
+		else:
+			self.values = self.__createEmptyStateVector()
+			self.__seedPolicy = None
+	
+	def __solved(self, algorithm, converged, policy = None):
+		'''remembers the results of a converged solve for the warm start, and how many iterations the
+			warm start saved with respect to the last solve from scratch of the same algorithm
+		'''
+		self.converged = converged
+		self.utilitiesChanged()
+		if not converged: return
+		if self.__seeded:
+			self.sweepsSaved = max(0, self.__coldIterations.get(algorithm, 0) - self.numOfIterations)
+		else:
+			self.__coldIterations[algorithm] = self.numOfIterations
+		self.__solution = (array('d', self.values), array('B', policy) if policy else None)
+
+	def __startClock(self):
+		'''all the algorithms measure both the wall clock time and the processor time'''
+		self.__clockStart = (time.perf_counter(), time.process_time())
+		self.elapsed = self.cpuElapsed = 0
+
+	def __readClock(self):
+		'''updates elapsed and cpuElapsed, returns elapsed'''
+		wall, cpu = self.__clockStart
+		self.elapsed = time.perf_counter() - wall
+		self.cpuElapsed = time.process_time() - cpu
+		return self.elapsed
+
+	def setLimits(self, maxNumberOfIterations = None, timeToLive = None):
+		'''the max number of iterations and seconds of each solve, a new policy takes them from
+			GridWorld.setAlgorithmRestrictions
+		'''
+		if maxNumberOfIterations is not None: self.maxNumberOfIterations = maxNumberOfIterations
+		if timeToLive is not None: self.timeToLive = timeToLive
+
+	def setStoppingRule(self, rule, tolerance = None, stableSweeps = None):
+		'''chooses when the sweeps stop (see the STOP_ constants). The bound rule is the one of AIMA, but
+			with a discount factor of 1 it becomes max norm <= 0, so the auto rule uses the span
+			seminorm instead: the utilities of the undiscounted maps can move all together (the
+			maps without exits) while the policy is already the final one. The states closed in a
+			region without exits and pits never converge with discount 1 (their utilities decrease
+			forever), the policy rule stops these maps when their greedy policy doesn't change anymore.
+			tolerance is used by the absolute, relative and span rules, stableSweeps by the policy rule
+		'''
+		if rule not in Policy.STOPPING_RULES: raise Exception("unknown stopping rule")
+		if tolerance is not None and tolerance < 0: raise Exception("the tolerance can't be negative")
+		if stableSweeps is not None and stableSweeps < 1: raise Exception("stableSweeps must be at least 1")
+		self.stoppingRule = rule
+		if tolerance is not None: self.stopTolerance = tolerance
+		if stableSweeps is not None: self.stableSweeps = stableSweeps
+	
+	def setEvaluationDepth(self, depth, adaptiveRatio = None):
+		'''the number of sweeps of each iterative policy evaluation of the policyIteration (modified policy
+			iteration, see Puterman, Markov Decision Processes, sec. 6.5):
+				DEPTH_FULL: sweeps until the stopping rule, at most _pe_maxk (the classic policy iteration)
+				DEPTH_ADAPTIVE: stops earlier, when the residual of a sweep is adaptiveRatio times the one
+					of the first sweep of the evaluation: the first evaluations of a policy that is still
+					bad are short, the last ones (when the policy is almost right) longer
+				a number m: at most m sweeps, 1 is almost the valueIteration
+			a truncated evaluation leaves the utilities far from the ones of the policy, so the solve
+			converges only when the policy doesn't change and its evaluation reached the stopping rule
+		'''
+		if depth not in (Policy.DEPTH_FULL, Policy.DEPTH_ADAPTIVE) and not (isinstance(depth, int) and depth >= 1):
+			raise Exception("the evaluation depth must be full, adaptive or a number of sweeps")
+		if adaptiveRatio is not None and not 0 < adaptiveRatio < 1: raise Exception("the adaptive ratio must be between 0 and 1")
+		self.evaluationDepth = depth
+		if adaptiveRatio is not None: self.adaptiveRatio = adaptiveRatio
+	
+	def __residualRule(self):
+		'''the stopping rule of the sweeps, with the auto rule resolved, and the policy rule (that is
+			checked apart) replaced by the rule the sweeps would use without it
+		'''
+		rule = self.stoppingRule
+		if rule in (Policy.STOP_AUTO, Policy.STOP_POLICY):
+			rule = Policy.STOP_BOUND if self.world.discFactor < 1 else Policy.STOP_SPAN
+		return rule
+	
+	def __sweepConverged(self, rule, maxNorm, old, new, stats = None):
+		'''the stopping test after a sweep that changed the utilities from old to new. The vector backends
+			measure their sweeps (see NumpyBackend.changeStats), their stats (minChange, maxChange,
+			maxUtility) are used instead of old and new, that are read only by the python backend
+		'''
+		if rule == Policy.STOP_BOUND:
+			dfact = self.world.discFactor
+			return maxNorm <= self.valueIterationEpsilon * (1 - dfact)/dfact
+		if rule == Policy.STOP_ABSOLUTE:
+			return maxNorm <= self.stopTolerance
+		#the infinite utilities of the closed states of the undiscounted worlds don't change
+		if rule == Policy.STOP_RELATIVE:
+			if stats: return maxNorm <= self.stopTolerance * stats[2]
+			return maxNorm <= self.stopTolerance * max((abs(u) for u in new if math.isfinite(u)), default = 0)
+		if stats: return stats[1] - stats[0] <= self.stopTolerance
+		diffs = [ (b - a) if a != b else 0 for a, b in zip(old, new) ]
+		return max(diffs, default = 0) - min(diffs, default = 0) <= self.stopTolerance
+	
+	def __stopThreshold(self):
+		'''the residual under which a single state counts as converged, for the prioritized sweeping
+			that has no sweeps: with the rules but bound it is the stopTolerance
+		'''
+		if self.__residualRule() != Policy.STOP_BOUND: return self.stopTolerance
+		dfact = self.world.discFactor
+		return self.valueIterationEpsilon * (1 - dfact)/dfact
+	
+	def __endOfIteration(self, converged, reiterate):
+		'''decides if the solve goes on after an iteration, and why it stops (see stopReason)'''
+		self.__readClock()
+		if converged:
+			self.stopReason = Policy.REASON_CONVERGED
+			return False
+		if self.numOfIterations >= self.maxNumberOfIterations: self.stopReason = Policy.REASON_ITERATIONS
+		elif self.elapsed > self.timeToLive: self.stopReason = Policy.REASON_TIME
+		elif not reiterate: self.stopReason = Policy.REASON_STOPPED
+		else: return True
+		if self.stopReason != Policy.REASON_STOPPED:
+			self.reporter.warning("Warning", "max number of iterations exceeded")
+		return False
+	
+	def __pinUtilities(self):
+		'''gives their final utility to the states that the sweeps don't update: the exits, the pits and
+			the states that can't reach them (see TransitionModel.fixedUtilities)
+		'''
+		self.world.transitionModel().fixedUtilities(self.values, self.world.discFactor)
+		self.utilitiesChanged()
+	
+	def __begin(self, algorithm):
+		self.__startClock()
+		for sink in self.sinks: sink.begin(self, algorithm)
+
+	def __end(self, algorithm):
+		for sink in self.sinks: sink.end(self, algorithm)
+
+	def __emit(self, event):
+		for sink in self.sinks: sink.event(event)
+
+	def residual(self):
+		'''the max norm of the difference between the utilities and one Bellman update of them,
+			the error of the utilities is at most residual * discFactor / (1 - discFactor)
+		'''
+		maxNorm = self.__sweepFunction()(self.values, array('d', self.values))
+		#the vector backends give the stats of the sweep too, see NumpyBackend.sweep
+		return maxNorm if self.backend == Policy.BACKEND_PYTHON else maxNorm[0]
 	
 	#===========================================================================
 	# Value Iteration 
@@ -66,71 +315,491 @@ class Policy:
 		   
 		   returns the number of iterations it needs for converge
 		'''
-		eps = Policy.valueIterationEpsilon
-		dfact = self.world.discFactor
-		c, r = self.world.size
-		if turbo: newUv = self.utilities
+		return self.__valueIteration("vi", debugCallback, turbo)
+
+	def __valueIteration(self, algorithm, debugCallback, turbo, order = None):
+		'''the loop of the valueIteration, it starts from the utilities in self.values. algorithm is the
+			name given to the sinks and to the warm start, order (if given) are the live states in the
+			order of the in place sweeps of the python backend
+		'''
+		if order is None: sweep = self.__sweepFunction()
+		else: sweep, turbo = (lambda values, newValues: self.__bellmanSweep(values, newValues, order)), True
+		#the vector backends measure the changes of their sweeps (for the sinks too), the python one
+		#needs the old utilities
+		vector = order is None and self.backend != Policy.BACKEND_PYTHON
+		#the policy rule doesn't test the residual of the sweeps
+		policyRule = self.stoppingRule == Policy.STOP_POLICY
+		rule = self.__residualRule()
+		keepOld = not vector and (self.sinks or (not policyRule and rule == Policy.STOP_SPAN))
+		stats = None
+		stablePolicy, stable = None, 0
 		
 		reiterate = True
-		start = time.process_time()
+		converged = False
+		self.policy = None #the greedy policy of the new utilities is computed by policyCodes
+		self.__pinUtilities()
+		self.__begin(algorithm)
 		while(reiterate):
 			self.numOfIterations += 1
-			maxNorm = 0 #see the max norm definition in AI: A Modern Approach (Third ed.) pag. 654
-			
-			if not turbo: newUv = self.__createEmptyUtilityVector()
+			self.utilitiesChanged()
 			
-			for x in range(c):
-				for y in range(r):
-					v = self.__cellUtility(x, y) #calculate using the self.utilities (i.e. the previous step)
-					if not v is None: maxNorm = max(maxNorm, abs(self.utilities[y][x] - v))
-					newUv[y][x] = v #update the new utility vector that we are creating
-					
-			if not turbo: self.utilities = newUv
+			#see the max norm definition in AI: A Modern Approach (Third ed.) pag. 654
+			newUv = self.values if turbo else array('d', self.values)
+			start = time.perf_counter()
+			if keepOld: old = array('d', self.values) if turbo else self.values
+			if vector: maxNorm, *stats, changed = sweep(self.values, newUv)
+			else: maxNorm = sweep(self.values, newUv)
+			self.values = newUv
+			if self.sinks:
+				end = time.perf_counter()
+				if not vector: changed = sum(map(operator.ne, old, newUv))
+				self.__emit(IterationEvent(algorithm, self.numOfIterations, end - self.__clockStart[0], end - start, maxNorm, changed))
 			
-			if debugCallback: reiterate = debugCallback(self, False)
+			if debugCallback:
+				reiterate = debugCallback(self, False)
 			
-			if maxNorm <= eps * (1 - dfact)/dfact: reiterate = False
-
-			end = time.process_time()
-			self.elapsed = end - start
-			if self.numOfIterations >= Policy.maxNumberOfIterations or self.elapsed > Policy.timeToLive:
-				reiterate = False
-				print("warning: max number of iterations exceeded")
-				messagebox.showwarning("Warning", "max number of iterations exceeded")
+			if policyRule:
+				greedy = self.__greedyPolicy()
+				stable = stable + 1 if greedy == stablePolicy else 0
+				stablePolicy = greedy
+				converged = maxNorm == 0 or stable >= self.stableSweeps
+			else:
+				converged = self.__sweepConverged(rule, maxNorm, old if keepOld else None, newUv, stats)
+			reiterate = self.__endOfIteration(converged, reiterate)
 		
+		self.__solved(algorithm, converged)
+		self.__end(algorithm)
 		if debugCallback: reiterate = debugCallback(self, True)
 					
 		return self.numOfIterations
 	
-	def __cellUtility(self, x, y):
-		'''calculate the utility of a function using an utilities that is less precise (i.e. using the 
-			utility vector of the previous step. In the turbo mode it use the current step, 
-			it leads the computation to end soon)
+	def __getExactSolver(self):
+		'''returns the ExactSolver of the current TransitionModel of the world'''
+		model = self.world.transitionModel()
+		if self.__exactSolver is None or self.__exactSolver.model is not model:
+			from ExactEvaluation import ExactSolver
+			self.__exactSolver = ExactSolver(model)
+		return self.__exactSolver
+	
+	def __sweepFunction(self):
+		'''returns the function that does a sweep of the value iteration with the backend of the policy,
+			the one of the vector backends returns the stats of the sweep too (see NumpyBackend.sweep)
+		'''
+		if self.backend == Policy.BACKEND_PYTHON: return self.__bellmanSweep
+		
+		#-1 for the numpy backend, that has no workers
+		workers = self.workers if self.backend == Policy.BACKEND_PARALLEL else -1
+		if self.__vectorBackend is None or self.__vectorBackend.version != self.world.version or \
+		   getattr(self.__vectorBackend, "requestedWorkers", -1) != workers:
+			self.__vectorBackend = None	#the workers of a parallel backend stop before the new ones start
+			if self.backend == Policy.BACKEND_PARALLEL:
+				from ParallelBackend import ParallelBackend
+				self.__vectorBackend = ParallelBackend(self.world, self.workers)
+			else:
+				from NumpyBackend import NumpyBackend
+				self.__vectorBackend = NumpyBackend(self.world)
+		return self.__vectorBackend.sweep
+	
+	def __bellmanSweep(self, values, newValues, states = None):
+		'''applies the Bellman update (see AI: A Modern Approach (Third ed.) pag. 652) to every live state
+			(see TransitionModel), reading the utilities of the previous step from values and writing the
+			new ones in newValues. The other states keep the utilities given by __pinUtilities, newValues
+			must already have them. In the turbo mode values and newValues are the same vector, so we
+			use the utilities of the current step as soon as they are computed.
+			states, if given, are the live states to update, in this order
 			
-			this is the Bellman update (see AI: A Modern Approach (Third ed.) pag. 652)
+			returns the max norm of the difference between the two steps
 		'''
-		if self.world.cellAt(x,y) == GridWorld.CELL_VOID:
+		model = self.world.transitionModel()
+		rowPtr, nextState, prob, reward = model.rowPtr, model.next, model.prob, model.reward
+		dfact = self.world.discFactor
+		
+		#an infinite utility that doesn't change gives a nan difference, that max ignores
+		maxNorm = 0
+		for s in (model.liveStates if states is None else states):
+			old = values[s]
 			maxSum = None
-			for action in GridWorld.actionSet:
+			k = rowPtr[4 * s]
+			for end in rowPtr[4 * s + 1 : 4 * s + 5]:
 				summ = 0
-				possibilities = self.world.possiblePositionsFromAction((x,y), action) 
-				for _, nextPos, prob in possibilities:
-					summ += prob * self.utilities[nextPos[1]][nextPos[0]]
+				while k < end:
+					summ += prob[k] * values[nextState[k]]
+					k += 1
 				if (maxSum is None) or (summ > maxSum): maxSum = summ
-			res = self.world.rewardAtCell(x, y) + self.world.discFactor * maxSum
-		else:
-			#we don't have any action to do, we have only own reward (i.w. V*(s) = R(s) + 0)
-			res = self.world.rewardAtCell(x, y) 
+			v = reward[s] + dfact * maxSum
+			newValues[s] = v
+			maxNorm = max(maxNorm, abs(old - v))
+		return maxNorm
+	
+	def __expectedUtilities(self, s):
+		'''returns, for each action (in the order of GridWorld.actionSet), the sum of the utilities
+			of the next states of the state s weighted by their probabilities
+		'''
+		model = self.world.transitionModel()
+		rowPtr, nextState, prob, values = model.rowPtr, model.next, model.prob, self.values
+		res = []
+		for a in range(4):
+			summ = 0
+			for k in range(rowPtr[4 * s + a], rowPtr[4 * s + a + 1]):
+				summ += prob[k] * values[nextState[k]]
+			res.append(summ)
 		return res
 	
 	#===========================================================================
-	# Policy Iteration 
+	# Multiresolution Value Iteration
 	#===========================================================================
-	
-	def __createEmptyPolicy(self):
-		'''we create a partial function that is undefined in all points'''
+
+	def multiresolutionValueIteration(self, debugCallback = None, factor = 2, coarsestSide = 32):
+		'''the valueIteration from coarse to fine: the world is coarsened (see GridWorld.coarsened) until
+		   its sides are at most coarsestSide cells, the smallest world is solved from 0 and the utilities of
+		   each world, interpolated, are the starting point of the value iteration of the next bigger one,
+		   up to this world. The sweeps of the big world don't have to carry the rewards of the exits
+		   across the whole map, the small worlds already did it with sweeps that cost a lot less.
+
+		   the sweeps are in place (python backend), in the order of TransitionModel.components: from the
+		   exits outwards, the way the utilities flow. With the order of the cells (or the copy of the
+		   classic value iteration) an error of the starting point moves one cell per sweep, and it
+		   takes as many sweeps to leave the map as starting from 0.
+		   It gains where the blocks keep the shape of the map: on a maze with walls one cell thick the
+		   small worlds open passages through the walls, and their utilities don't help.
+
+		   all the worlds use the stopping rule of this policy and share its timeToLive, counted from the
+		   start of the call. The debugCallback sees only this world: during the sweeps of the small worlds
+		   it gets this policy (with the utilities it had at the start) and it can stop them, then the
+		   solve stops after the first sweep of this world. levels has the size and the iterations of
+		   each world (the smallest first), numOfIterations are the ones of this world, elapsed and
+		   cpuElapsed include the small worlds.
+
+		   returns the number of iterations of this world
+		'''
+		wall, cpu = time.perf_counter(), time.process_time()
+		worlds = [ self.world ]
+		while max(worlds[-1].size) > coarsestSide: worlds.append(worlds[-1].coarsened(factor))
+
+		def coarseCallback(policy, isEnded):
+			return isEnded or debugCallback(self, False)
+
+		self.levels = []
+		coarse = None
+		for level in range(len(worlds) - 1, 0, -1):
+			world = worlds[level]
+			left = self.timeToLive - (time.perf_counter() - wall)
+			if left <= 0: break
+			p = Policy(world, reporter = Reporter())
+			p.setLimits(self.maxNumberOfIterations, left)
+			p.valueIterationEpsilon = self.valueIterationEpsilon
+			p.setStoppingRule(self.stoppingRule, self.stopTolerance, self.stableSweeps)
+			if coarse: p.values = p.__interpolate(coarse.world, coarse.values, factor ** (coarseLevel - level))
+			p.__valueIteration("mrvi", coarseCallback if debugCallback else None, True, world.transitionModel().components()[0])
+			self.levels.append(world.size + (p.numOfIterations,))
+			coarse, coarseLevel = p, level
+			#stopped or out of time: the rest of the budget goes to this world
+			if p.stopReason in (Policy.REASON_STOPPED, Policy.REASON_TIME): break
+
+		if coarse: self.values = self.__interpolate(coarse.world, coarse.values, factor ** coarseLevel)
+		order = self.world.transitionModel().components()[0]
+		wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+		timeToLive = self.timeToLive
+		try:
+			self.timeToLive = max(0, timeToLive - wall)
+			self.__valueIteration("mrvi", debugCallback, True, order)
+		finally:
+			self.timeToLive = timeToLive
+		self.levels.append(self.world.size + (self.numOfIterations,))
+		self.elapsed += wall
+		self.cpuElapsed += cpu
+		return self.numOfIterations
+
+	def __interpolate(self, coarse, coarseValues, factor):
+		'''returns the utilities of the world of the policy interpolated from the ones of coarse, the world it
+			is coarsened to: bilinear interpolation between the centers of the 4 nearest cells of coarse,
+			leaving out the walls and the infinite utilities
+		'''
+		def nearest(n, coarseN):
+			#for each coordinate of the big world, the 2 nearest coordinates of the small one and the weight of the second
+			res = []
+			for i in range(n):
+				t = (i + 0.5) / factor - 0.5
+				i0 = math.floor(t)
+				res.append((min(max(i0, 0), coarseN - 1), min(i0 + 1, coarseN - 1), t - i0))
+			return res
+
 		c, r = self.world.size
-		return [ [ (None if self.world.cellAt(x,y) == GridWorld.CELL_VOID else GridWorld.randomAction()) for x in range(c) ] for y in range(r) ]
+		cc, rc = coarse.size
+		columns, rows = nearest(c, cc), nearest(r, rc)
+		stateOfCell = coarse.stateOfCell
+		res = self.__createEmptyStateVector()
+		for s, cell in enumerate(self.world.cellOfState):
+			y, x = divmod(cell, c)
+			x0, x1, tx = columns[x]
+			y0, y1, ty = rows[y]
+			summ = weight = 0
+			for X, Y, w in ((x0, y0, (1 - tx) * (1 - ty)), (x1, y0, tx * (1 - ty)), (x0, y1, (1 - tx) * ty), (x1, y1, tx * ty)):
+				t = stateOfCell[Y * cc + X]
+				if w > 0 and t >= 0 and math.isfinite(coarseValues[t]):
+					summ += w * coarseValues[t]
+					weight += w
+			if weight > 0: res[s] = summ / weight
+		return res
+
+	#===========================================================================
+	# Topological Value Iteration
+	#===========================================================================
+
+	def topologicalValueIteration(self, debugCallback = None):
+		'''the value iteration done one strongly connected component at a time (see TransitionModel.components,
+		   and Dai, Goldsmith, Topological Value Iteration Algorithm for Markov Decision Processes, 2007):
+		   the components are solved in reverse topological order, so when we solve one the utilities of
+		   all its successors are already the final ones, and each one is swept (in place, from the
+		   states nearest to its exits) until it converges, before moving to the next one.
+		   The sweeps of a component don't visit the rest of the world.
+
+		   on the grid worlds every move can be undone, so the components are the regions divided by the
+		   walls, the exits and the pits, and they have cycles. A value iteration that starts from 0 needs
+		   a sweep for each step reward the utilities lose, whatever the order, so the first sweep of a
+		   component gives each state (from its exits) the utility it has if the moves to the states
+		   not reached yet leave it where it is (see __estimateUtilities): along a corridor that is already
+		   the fixed point, elsewhere it is near it.
+
+		   the debugCallback is the same of the valueIteration, it is called every numStates updates
+		   (like the prioritizedSweeping), and numOfIterations counts these groups. numOfBackups is the
+		   number of updates. It always uses the python backend.
+
+		   a component converges when a sweep changes its utilities less than the stop threshold of the
+		   prioritizedSweeping, returns the number of iterations
+		'''
+		model = self.world.transitionModel()
+		order, compPtr = model.components()
+		numComponents = len(compPtr) - 1
+		threshold = self.__stopThreshold()
+		n = max(len(model.liveStates), 1)
+		self.__pinUtilities()
+		values = self.values
+
+		self.numOfBackups = 0
+		component = 0
+		states = order[compPtr[0] : compPtr[1]] if numComponents else None
+		estimated = bytearray(len(values))	#the states with a utility from a solved component or an estimate
+		for s in range(len(values)):
+			if not model.isLive[s]: estimated[s] = 1
+		estimate = True
+		reiterate = True
+		converged = False
+		self.policy = None #the greedy policy of the new utilities is computed by policyCodes
+		self.__begin("tvi")
+		while(reiterate):
+			self.numOfIterations += 1
+			self.utilitiesChanged()
+			start = time.perf_counter()
+			backups = self.numOfBackups
+			maxNorm = 0
+
+			while component < numComponents and self.numOfBackups - backups < n:
+				self.numOfBackups += len(states)
+				if estimate:
+					self.__estimateUtilities(states, estimated)
+					estimate = False
+				else:
+					maxNorm = self.__bellmanSweep(values, values, states)
+					if maxNorm <= threshold:
+						component += 1
+						estimate = True
+						if component < numComponents: states = order[compPtr[component] : compPtr[component + 1]]
+
+			if self.sinks:
+				end = time.perf_counter()
+				self.__emit(IterationEvent("tvi", self.numOfIterations, end - self.__clockStart[0], end - start,
+										   maxNorm, backups = self.numOfBackups - backups))
+
+			if debugCallback:
+				reiterate = debugCallback(self, False)
+
+			converged = component == numComponents
+			reiterate = self.__endOfIteration(converged, reiterate)
+
+		self.__solved("tvi", converged)
+		self.__end("tvi")
+		if debugCallback: reiterate = debugCallback(self, True)
+
+		return self.numOfIterations
+
+	def __estimateUtilities(self, states, estimated):
+		'''the first sweep of a component of the topologicalValueIteration: in the order of states, each
+			state gets the best utility it has if the moves to the states without an estimate leave it
+			where it is, U = (R + discFactor * sum of p * U of the others) / (1 - discFactor * p of staying),
+			then it has an estimate too
+		'''
+		model = self.world.transitionModel()
+		rowPtr, nextState, prob, reward, values = model.rowPtr, model.next, model.prob, model.reward, self.values
+		dfact = self.world.discFactor
+		for s in states:
+			best = None
+			k = rowPtr[4 * s]
+			for end in rowPtr[4 * s + 1 : 4 * s + 5]:
+				summ = stay = 0
+				while k < end:
+					t = nextState[k]
+					if t == s or not estimated[t]: stay += prob[k]
+					else: summ += prob[k] * values[t]
+					k += 1
+				if dfact * stay < 1:
+					v = (reward[s] + dfact * summ) / (1 - dfact * stay)
+					if (best is None) or (v > best): best = v
+			if best is not None: values[s] = best
+			estimated[s] = 1
+
+	#===========================================================================
+	# Prioritized Sweeping
+	#===========================================================================
+
+	def prioritizedSweeping(self, debugCallback = None):
+		'''an asynchronous value iteration that, instead of sweeping all the states in a fixed order,
+		   always updates the state with the biggest Bellman residual (kept in a priority queue).
+		   When the utility of a state changes, the residuals of its predecessors (see
+		   TransitionModel.predecessors) are computed again, so only the states whose successors
+		   changed meaningfully go back in the queue.
+
+		   the debugCallback is the same of the valueIteration, it is called every numStates updates
+		   (that is what a sweep of the valueIteration does), and numOfIterations counts these groups.
+		   numOfBackups is the number of updates.
+
+		   it converges when no state has a residual bigger than the stop threshold of the valueIteration
+		   returns the number of iterations
+		'''
+		dfact = self.world.discFactor
+		threshold = self.__stopThreshold()
+		model = self.world.transitionModel()
+		rowPtr, nextState, prob, reward, isLive = model.rowPtr, model.next, model.prob, model.reward, model.isLive
+		predPtr, pred = model.predecessors()
+		self.__pinUtilities()
+		values = self.values
+		n = model.numStates
+
+		#only the live states are updated, see TransitionModel
+		def backup(s):
+			maxSum = None
+			k = rowPtr[4 * s]
+			for end in rowPtr[4 * s + 1 : 4 * s + 5]:
+				summ = 0
+				while k < end:
+					summ += prob[k] * values[nextState[k]]
+					k += 1
+				if (maxSum is None) or (summ > maxSum): maxSum = summ
+			return reward[s] + dfact * maxSum
+
+		#at the beginning the priorities are the real residuals
+		priority = self.__createEmptyStateVector()
+		for s in model.liveStates: priority[s] = abs(backup(s) - values[s])
+		queue = [ (-priority[s], s) for s in model.liveStates if priority[s] > threshold ]
+		heapq.heapify(queue)
+
+		self.numOfBackups = 0
+		reiterate = True
+		converged = False
+		self.policy = None #the greedy policy of the new utilities is computed by policyCodes
+		self.__begin("ps")
+		while(reiterate):
+			self.numOfIterations += 1
+			self.utilitiesChanged()
+			start = time.perf_counter()
+			backups = self.numOfBackups
+			changed = 0
+
+			for _ in range(max(n, 1)):
+				if not queue: break
+				p, s = heapq.heappop(queue)
+				if -p != priority[s]: continue #an old entry, the state was pushed again
+
+				v = backup(s)
+				delta = abs(v - values[s])
+				values[s] = v
+				priority[s] = 0
+				self.numOfBackups += 1
+
+				#the predecessors include s itself when it can stay where it is
+				if delta == 0: continue
+				changed += 1
+				for k in range(predPtr[s], predPtr[s + 1]):
+					ps = pred[k]
+					if not isLive[ps]: continue
+					r = abs(backup(ps) - values[ps])
+					if r != priority[ps]:
+						priority[ps] = r
+						if r > threshold: heapq.heappush(queue, (-r, ps))
+
+			if self.sinks:
+				end = time.perf_counter()
+				#the top of the queue can be an old entry, so the residual is an upper bound
+				self.__emit(IterationEvent("ps", self.numOfIterations, end - self.__clockStart[0], end - start,
+										   -queue[0][0] if queue else 0, changed, backups = self.numOfBackups - backups))
+
+			if debugCallback:
+				reiterate = debugCallback(self, False)
+
+			converged = not queue
+			reiterate = self.__endOfIteration(converged, reiterate)
+
+		self.__solved("ps", converged)
+		self.__end("ps")
+		if debugCallback: reiterate = debugCallback(self, True)
+
+		return self.numOfIterations
+
+	#===========================================================================
+	# Policy Iteration
+	#===========================================================================
+
+	def __createEmptyPolicy(self):
+		'''we create a partial function that is undefined in all points,
+			the policy is a vector that for each state contains the index of an action in GridWorld.actionSet
+			(the undefined actions behave as the last one, like possiblePositionsFromAction does with None)
+			and NO_ACTION for the exits and the pits
+		'''
+		isVoid = self.world.transitionModel().isVoid
+		#isVoid has a 1 where we can do an action, translate maps 0 to NO_ACTION and 1 to the last action
+		table = bytes([Policy.NO_ACTION, len(GridWorld.actionSet) - 1]) + bytes(254)
+		return array('B', bytes(isVoid).translate(table))
+	
+	def __properPolicy(self):
+		'''a policy that reaches an exit or a pit with probability 1 from every live state: each one does an
+			action that, with a positive probability, moves to a state nearer (in moves) to the exits and
+			the pits, found with a breadth first visit of TransitionModel.predecessors that starts from them.
+			With a discount factor of 1 the exact evaluation gives -inf to the states of an improper policy,
+			and the improvement can't compare -inf with -inf, so the exact policy iteration starts from here
+		'''
+		model = self.world.transitionModel()
+		rowPtr, nextState, prob, isVoid = model.rowPtr, model.next, model.prob, model.isVoid
+		predPtr, pred = model.predecessors()
+		policy = self.__createEmptyPolicy()
+		reached = bytearray(1 - v for v in isVoid)
+		queue = [ s for s in range(self.world.numStates) if not isVoid[s] ]
+		for s in queue:
+			for k in range(predPtr[s], predPtr[s + 1]):
+				p = pred[k]
+				if reached[p]: continue
+				reached[p] = 1
+				queue.append(p)
+				policy[p] = next(a for a in range(4)
+								 if any(nextState[j] == s and prob[j] > 0 for j in range(rowPtr[4 * p + a], rowPtr[4 * p + a + 1])))
+		return policy
+	
+	def __greedyPolicy(self):
+		'''the policy that, in each state, does the action with the best expected utility'''
+		isVoid = self.world.transitionModel().isVoid
+		table = self.__expectedUtilityTable()
+		policy = array('B', bytes([Policy.NO_ACTION])) * self.world.numStates
+		for s in range(self.world.numStates):
+			if isVoid[s]:
+				sums = table[4 * s : 4 * s + 4]
+				policy[s] = sums.index(max(sums))
+		return policy
+	
+	def policyCodes(self):
+		'''the action code of each state (NO_ACTION for the exits and the pits): the policy found by
+			the policy iteration, or the greedy policy of the utilities for the other algorithms
+		'''
+		if self.policy is None: self.policy = self.__greedyPolicy()
+		return self.policy
 	
 	def policyIteration(self, debugCallback = None, turbo = False):
 		'''Policy iteration algorithm (see AI: A Modern Approach (Third ed.) pag. 656)
@@ -143,51 +812,59 @@ class Policy:
 		   returns the number of iterations it needs to find the fixed point
 		'''
 		
-		c, r = self.world.size
-		policy = self.__createEmptyPolicy()
+		liveStates = self.world.transitionModel().liveStates
+		if self.__seedPolicy: policy = array('B', self.__seedPolicy)
+		elif self.__seeded: policy = self.__greedyPolicy()
+		elif self.evaluation == Policy.EVALUATION_EXACT and self.world.discFactor == 1: policy = self.__properPolicy()
+		else: policy = self.__createEmptyPolicy()
+		self.policy = policy
 		
 		reiterate = True
-		start = time.time()
+		converged = False
+		self.__pinUtilities()
+		self.__begin("pi")
 		while(reiterate):
 			self.numOfIterations += 1
+			self.utilitiesChanged()
 			
-			self.policyEvaluation(policy, turbo)
+			start = time.perf_counter()
+			sweeps, maxNorm, evaluated = self.policyEvaluation(policy, turbo)
+			evaluationEnd = time.perf_counter()
 			
-			someChanges = False
-			for x in range(c):
-				for y in range(r):
-					if self.world.cellAt(x,y) == GridWorld.CELL_VOID:
-						newMax = None
-						argMax = None
-						for action in GridWorld.actionSet:
-							summ = 0
-							possibilities = self.world.possiblePositionsFromAction((x,y), action) 
-							for _, nextPos, prob in possibilities:
-								summ += prob * self.utilities[nextPos[1]][nextPos[0]]
-							if (newMax is None) or (summ > newMax):
-								argMax = action
-								newMax = summ
-						
-						summ = 0
-						possibilities = self.world.possiblePositionsFromAction((x,y), policy[y][x]) 
-						for _, nextPos, prob in possibilities:
-							summ += prob * self.utilities[nextPos[1]][nextPos[0]]
-						if newMax > summ:
-							policy[y][x] = argMax
-							someChanges = True
+			changes = 0
+			if self.evaluation == Policy.EVALUATION_EXACT:
+				changes = self.__getExactSolver().improve(policy, self.values, self.improvementTolerance)
+			else:
+				#the action of the closed states doesn't matter, they can't reach an exit or a pit
+				for s in liveStates:
+					sums = self.__expectedUtilities(s)
+					newMax = None
+					argMax = None
+					for a in range(4):
+						if (newMax is None) or (sums[a] > newMax):
+							argMax = a
+							newMax = sums[a]
+					
+					if newMax > sums[policy[s]] + self.improvementTolerance:
+						policy[s] = argMax
+						changes += 1
+			someChanges = changes > 0
+			
+			if self.sinks:
+				end = time.perf_counter()
+				self.__emit(IterationEvent("pi", self.numOfIterations, end - self.__clockStart[0], end - start, maxNorm,
+										   evaluationSweeps = sweeps, evaluationTime = evaluationEnd - start,
+										   improvementTime = end - evaluationEnd, policyChanges = changes))
 			
 			if debugCallback:
 				reiterate = debugCallback(self, False)
 			
-			reiterate = someChanges
-			
-			end = time.time()
-			self.elapsed = end - start
-			if self.numOfIterations >= Policy.maxNumberOfIterations or self.elapsed > Policy.timeToLive:
-				reiterate = False
-				print("warning: newMax number of iterations exceeded")
-				messagebox.showwarning("Warning", "max number of iterations exceeded")
+			#with the policy stopping rule a stable policy is enough
+			converged = not someChanges and (evaluated or self.stoppingRule == Policy.STOP_POLICY)
+			reiterate = self.__endOfIteration(converged, reiterate)
 		
+		self.__solved("pi", converged, policy)
+		self.__end("pi")
 		if debugCallback:
 					reiterate = debugCallback(self, True)
 					
@@ -195,67 +872,149 @@ class Policy:
 	
 	def policyEvaluation(self, policy, turbo = False):
 		'''Policy Evaluation (see AI: A Modern Approach (Third ed.) pag. 656)
-			used by the policy iteration
+			used by the policy iteration, the policy is a vector of action indexes (see __createEmptyPolicy)
+			
+			with the exact evaluation mode the utilities are the solution of the linear system
+			U = R + discFactor * P U (when the iterative solver of the big systems doesn't converge it
+			warns and falls back to the sweeps), otherwise they are approximated with the sweeps chosen by
+			setEvaluationDepth. In the turbo mode the sweeps update the utilities in place (Gauss-Seidel)
+			
+			returns the number of sweeps, the max norm of the change of the utilities in the last one
+			(0 and None for the exact evaluation), and False if the evaluation was truncated by the
+			depth before the stopping rule (the full and adaptive evaluations count as done also when
+			they reach _pe_maxk, like the classic policy iteration)
 		'''
-		eps = Policy.valueIterationEpsilon
-		dfact = self.world.discFactor
-		c, r = self.world.size
+		self.utilitiesChanged()
+		if self.evaluation == Policy.EVALUATION_EXACT:
+			if self.__getExactSolver().evaluate(policy, self.world.discFactor, self.values) is not None: return 0, None, True
+			#GMRES didn't converge, the sweeps evaluate the policy instead
+			self.reporter.warning("Warning", "the exact evaluation didn't converge, the policy is evaluated with the sweeps")
 		
-		turbo = False
-		if turbo: newUv = self.utilities
+		dfact = self.world.discFactor
+		model = self.world.transitionModel()
+		rowPtr, nextState, prob, reward = model.rowPtr, model.next, model.prob, model.reward
+		rule = self.__residualRule()
+		depth = self.evaluationDepth
+		maxk = depth if isinstance(depth, int) else self._pe_maxk
 		
 		numOfIterations = 0
-		reiterate = True
-		while(reiterate):
+		firstNorm = None
+		while True:
 			maxNorm = 0
 			numOfIterations += 1
 			
-			if not turbo: newUv = self.__createEmptyUtilityVector()
+			values = self.values
+			newUv = values if turbo else array('d', values)
+			#the span rule needs the utilities before the sweep
+			old = array('d', values) if turbo and rule == Policy.STOP_SPAN else values
 			
-			for x in range(c):
-				for y in range(r):
-					newUv[y][x] = self.world.rewardAtCell(x,y)
-					if self.world.cellAt(x,y) == GridWorld.CELL_VOID:
-						action = policy[y][x]
-						#if action is None: action = policy[y][x] = GridWorld.randomAction()
-						
-						possibilities = self.world.possiblePositionsFromAction((x,y), action) 
-						for _, nextPos, prob in possibilities:
-							newUv[y][x] += prob * self.utilities[nextPos[1]][nextPos[0]]
-						newUv[y][x] *= self.world.discFactor
-					maxNorm = max(maxNorm, abs(self.utilities[y][x] - newUv[y][x]))
+			#the other states have the utilities given by __pinUtilities
+			for s in model.liveStates:
+				row = 4 * s + policy[s]
+				summ = 0
+				for k in range(rowPtr[row], rowPtr[row + 1]):
+					summ += prob[k] * values[nextState[k]]
+				v = reward[s] + dfact * summ
+				maxNorm = max(maxNorm, abs(values[s] - v))
+				newUv[s] = v
 					
-			if not turbo: self.utilities = newUv
+			self.values = newUv
+			
+			if firstNorm is None: firstNorm = maxNorm
 			
-			if maxNorm <= eps * (1 - dfact)/dfact: reiterate = False
-			elif numOfIterations >= Policy._pe_maxk: reiterate = False
-				
-		# print(numOfIterations)
+			if self.__sweepConverged(rule, maxNorm, old, newUv): return numOfIterations, maxNorm, True
+			#the full and the adaptive depths had all the sweeps of the classic policy iteration
+			if numOfIterations >= maxk: return numOfIterations, maxNorm, not isinstance(depth, int)
+			if depth == Policy.DEPTH_ADAPTIVE and maxNorm <= self.adaptiveRatio * firstNorm: return numOfIterations, maxNorm, False
 			
 	#===========================================================================
 	# Other functions
 	#===========================================================================
-	
+
+	def loadResults(self, values, policy = None):
+		'''restores the results of a solve done before (for example read from a binary file, see WorldIO):
+			values are the utilities of the states and policy their action codes. The results count as
+			converged, so a warm started solve starts from them
+		'''
+		if len(values) != self.world.numStates or (policy is not None and len(policy) != self.world.numStates):
+			raise Exception("the results don't match the states of the world")
+		self.resetResults()
+		self.values = array('d', values)
+		self.utilitiesChanged()
+		self.policy = None if policy is None else array('B', policy)
+		self.converged = True
+		self.__solution = (array('d', self.values), self.policy)
+
+	def utilitiesChanged(self):
+		'''must be called after changing the utilities (values) from outside the Policy, the cached
+			tables of the queries are computed again when they are used
+		'''
+		self.__valuesVersion += 1
+
+	def __expectedUtilityTable(self):
+		'''returns the table E of the expected utilities of the next states, E[4 * s + a] is the sum of the
+			utilities of the next states of s weighted by their probabilities, doing the action of index a
+			(so Q(s, a) = R(s) + discFactor * E[4 * s + a]). It is computed once for the current utilities
+			and parameters of the world (it is 0 for the exits and the pits)
+		'''
+		stamp = (self.world.version, self.__valuesVersion, self.world.numStates)
+		if self.__table is not None and self.__tableStamp == stamp: return self.__table
+
+		if self.backend != Policy.BACKEND_PYTHON:
+			self.__sweepFunction()	#builds the vector backend for the current world
+			table = array('d')
+			table.frombytes(self.__vectorBackend.expectedUtilities(self.values).tobytes())
+		else:
+			model = self.world.transitionModel()
+			rowPtr, nextState, prob, isVoid, values = model.rowPtr, model.next, model.prob, model.isVoid, self.values
+			table = array('d', bytes(32 * model.numStates))
+			for s in range(model.numStates):
+				if not isVoid[s]: continue
+				k = rowPtr[4 * s]
+				for row in range(4 * s, 4 * s + 4):
+					summ = 0
+					end = rowPtr[row + 1]
+					while k < end:
+						summ += prob[k] * values[nextState[k]]
+						k += 1
+					table[row] = summ
+		self.__table, self.__tableStamp = table, stamp
+		return table
+
+	def qValueTable(self):
+		'''the q-values of all the states, Q(s, a) is at the index 4 * s + a (a is the index of the
+			action in GridWorld.actionSet), they are NaN for the exits and the pits
+		'''
+		model = self.world.transitionModel()
+		table, reward, isVoid, dfact = self.__expectedUtilityTable(), model.reward, model.isVoid, self.world.discFactor
+		res = array('d', [math.nan]) * (4 * model.numStates)
+		for s in range(model.numStates):
+			if isVoid[s]:
+				for row in range(4 * s, 4 * s + 4): res[row] = reward[s] + dfact * table[row]
+		return res
+
+	def __stateAt(self, x, y):
+		'''the state of the cell (x, y) if it is a void cell, None otherwise'''
+		if self.world.cellAt(x, y) != GridWorld.CELL_VOID: return None
+		return self.world.stateOfCell[y * self.world.size[0] + x]
+
 	def getQValues(self, s, action = None):
 		'''calculate the q-value Q(s, a). It is the utility of the state s if we perform the action a 
 			if action is None it returns a list with the possible q-value for the state s 
 			for all possible actions.
 		'''
 		x,y = s
+		state = self.__stateAt(x, y)
+		if state is None: return None
 		
-		if self.world.cellAt(x,y) != GridWorld.CELL_VOID: return None
-		
+		table = self.__expectedUtilityTable()
+		r = self.world.rewardAtCell(x, y)
 		if action is None:
 			res = {}
-			for action in GridWorld.actionSet:
-				res[action] = self.getQValues(s, action) 
+			for i, action in enumerate(GridWorld.actionSet):
+				res[action] = r + self.world.discFactor * table[4 * state + i]
 		else:
-			
-			summ = 0
-			possibilities = self.world.possiblePositionsFromAction((x,y), action) 
-			for _, nextPos, prob in possibilities:
-				summ += prob * self.utilities[nextPos[1]][nextPos[0]]
-			res = self.world.rewardAtCell(x, y) + self.world.discFactor * summ
+			res = r + self.world.discFactor * table[4 * state + GridWorld.actionSet.index(action)]
 		
 		return res
 		
@@ -263,26 +1022,18 @@ class Policy:
 		'''calculate the policy of the state s
 			the policy for the state s is the best action to do if you want to have the best possible reward
 		'''
-		def argmaxQValues(s):
-			qv = self.getQValues(s)
-			return (max(qv.items(), key = lambda c: c[1])[0] if qv else None) 
-		return argmaxQValues(s)
+		qv = self.getQValues(s)
+		return (max(qv.items(), key = lambda c: c[1])[0] if qv else None) 
 	
 	def getPolicyFromUtilityVector(self, s):
 		'''calculate the policy of the state s
 			the policy for the state s is the best action to do if you want to have the best possible reward
 		'''
 		x,y = s
-		if self.world.cellAt(x,y) != GridWorld.CELL_VOID: return None
-		def argmaxValues(s):
-			res = {}
-			for action in GridWorld.actionSet:
-				res[action] = 0
-				possibilities = self.world.possiblePositionsFromAction((x,y), action) 
-				for _, nextPos, prob in possibilities:
-					res[action] += prob * self.utilities[nextPos[1]][nextPos[0]]
-			return (max(res.items(), key = lambda c: c[1])[0] if res else None) 
-		return argmaxValues(s)
+		state = self.__stateAt(x, y)
+		if state is None: return None
+		sums = self.__expectedUtilityTable()[4 * state : 4 * state + 4]
+		return GridWorld.actionSet[sums.index(max(sums))]
 		
 	#===========================================================================
 	# String representation 
@@ -294,7 +1045,7 @@ class Policy:
 		ris = ""		
 		for y in range(r):
 			for x in range(c):
-				u = self.utilities[y][x]
+				u = self.utilityAt(x, y)
 				ris += "       " if u is None else "% 2.3f " % u
 			if y < r - 1: ris += "\n"
 		return ris
@@ -328,7 +1079,8 @@ class Policy:
 	# Graphical representation 
 	#===========================================================================
 	
-	def __getColorFromValue(self, v):
+	def getColorFromValue(self, v):
+		'''the color of a utility: from white to green for the positive ones, to red for the negative ones'''
 		if v > 0:
 			u = 255 * min(v, self.world.rew[GridWorld.CELL_EXIT]) / self.world.rew[GridWorld.CELL_EXIT]			
 			return "#%02x%02x%02x" % (255 - int(u), 255, 255 - int(u))
@@ -338,10 +1090,11 @@ class Policy:
 		
 	def drawUtilities(self, canvas):
 		'''draw only the utilities, you must call the other draw methods to draw the other things'''
-		m = GridWorld.drawing_BoxMargin
-		s = GridWorld.drawing_BoxSide
+		from tkinter import CENTER
+		m = self.world.drawing_BoxMargin
+		s = self.world.drawing_BoxSide
 		s2 = math.ceil(s/2)
-		ox, oy = GridWorld.drawing_offset
+		ox, oy = self.world.drawing_offset
 		for x in range(self.world.size[0]):
 			for y in range(self.world.size[1]):
 				if self.world.cellAt(x,y) == GridWorld.CELL_WALL: continue
@@ -349,22 +1102,23 @@ class Policy:
 					color = "#00ff64"
 				elif self.world.cellAt(x,y) == GridWorld.CELL_PIT: 
 					color = "#ff0000" 
-				elif (self.world.cellAt(x,y) == GridWorld.CELL_VOID) and self.utilities[y][x]:
-					color = self.__getColorFromValue(self.utilities[y][x])
+				elif (self.world.cellAt(x,y) == GridWorld.CELL_VOID) and self.utilityAt(x, y):
+					color = self.getColorFromValue(self.utilityAt(x, y))
 				else:
 					color = "#ffffff"
 				xp, yp = x*(s+m) + ox, y*(s+m) + oy
 				canvas.create_rectangle(xp, yp, xp + s, yp + s, fill=color)
 				canvas.create_text(xp + s2, yp + s2, anchor = CENTER, font = ("AgencyFB", "20", "bold"),
-													 text = ("%2.3f" % self.utilities[y][x]))
+													 text = ("%2.3f" % self.utilityAt(x, y)))
 
 	def drawQValues(self, canvas):
 		'''draw only the q-values, you must call the other draw methods to draw the other things'''
-		m = GridWorld.drawing_BoxMargin
+		from tkinter import N, S, W, E
+		m = self.world.drawing_BoxMargin
 		tm = 4 #text margin from the border
-		s = GridWorld.drawing_BoxSide
+		s = self.world.drawing_BoxSide
 		s2 = math.ceil(s/2)
-		ox, oy = GridWorld.drawing_offset
+		ox, oy = self.world.drawing_offset
 		for x in range(self.world.size[0]):
 			for y in range(self.world.size[1]):
 				qvalues = self.getQValues((x, y))
@@ -373,7 +1127,7 @@ class Policy:
 				xc, yc = xp + s2, yp + s2
 
 				for q in (qvalues).items():
-					color = self.__getColorFromValue(q[1])
+					color = self.getColorFromValue(q[1])
 					if q[0] == GridWorld.ACTION_EAST:
 						points = [xp + s, yp, xp + s, y*(s+m) + oy + s, xc, yc]
 					elif q[0] == GridWorld.ACTION_WEST:
@@ -438,13 +1192,13 @@ class Policy:
 	def drawPolicy(self, canvas):
 		'''draw only the policy, you must call the other draw methods to draw the other things'''
 		#commented lines are part of an alternative way to draw the arrows
-		m = GridWorld.drawing_BoxMargin
-		arrs = int(GridWorld.drawing_BoxSide/4) #arrow base size
-		arrh = int(GridWorld.drawing_BoxSide/5) #arrow height
-		s = GridWorld.drawing_BoxSide
+		m = self.world.drawing_BoxMargin
+		arrs = int(self.world.drawing_BoxSide/4) #arrow base size
+		arrh = int(self.world.drawing_BoxSide/5) #arrow height
+		s = self.world.drawing_BoxSide
 		s2 = math.ceil(s/2)
 		#s4 = math.ceil(s/4)
-		ox, oy = GridWorld.drawing_offset
+		ox, oy = self.world.drawing_offset
 		for x in range(self.world.size[0]):
 			for y in range(self.world.size[1]):
 				xp, yp = x*(s+m) + ox, y*(s+m) + oy
@@ -468,6 +1222,7 @@ class Policy:
 		
 	def draw(self, canvas):
 		'''a method to draw all in the right order'''
+		from tkinter import ALL
 		canvas.delete(ALL)
 		self.world.draw(canvas)
 		self.drawUtilities(canvas)
@@ -485,6 +1240,7 @@ if __name__ == '__main__':
 			   [GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID]], discountFactor = 1 )
 	w.setRewards(-0.04, -1, 1)
 	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 3)
 	print("GridWorld-----------")
 	print(w)
 	print("----------------")
@@ -507,4 +1263,56 @@ if __name__ == '__main__':
 	print(p.policyToString())
 	print("----------------")
 	
-	print(p.getQValues((0, 1)))
\ No newline at end of file
+	print(p.getQValues((0, 1)))
+	
+	p.resetResults()
+	print("Prioritized sweeping iterations: %d (%d state updates)" % (p.prioritizedSweeping(), p.numOfBackups))
+	print(p.utilityVectorToString())
+	
+	p.resetResults()
+	print("Topological value iteration iterations: %d (%d state updates)" % (p.topologicalValueIteration(), p.numOfBackups))
+	print(p.utilityVectorToString())
+	
+	cells = [ [ GridWorld.CELL_VOID ] * 48 for _ in range(48) ]
+	cells[0][0] = GridWorld.CELL_EXIT
+	cells[30][20] = GridWorld.CELL_PIT
+	w = GridWorld(cells, discountFactor = 0.99)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 60)
+	pv, pm = Policy(w), Policy(w)
+	pv.valueIteration(turbo = True)
+	pm.multiresolutionValueIteration(coarsestSide = 12)
+	print("\nMultiresolution value iteration on %dx%d: iterations %d (value iteration %d), levels %s" % (w.size + (pm.numOfIterations, pv.numOfIterations, pm.levels)))
+	print("max difference: %.4f" % max(abs(a - b) for a, b in zip(pv.values, pm.values)))
+	
+	#many policies with different limits solved at the same time must give the results they give one at a time
+	from concurrent.futures import ThreadPoolExecutor
+	import random
+	
+	def stressWorld(i):
+		rnd = random.Random(i)
+		side = 6 + i % 10
+		cells = [ [ (GridWorld.CELL_WALL if rnd.random() < 0.15 else GridWorld.CELL_VOID) for _ in range(side) ] for _ in range(side) ]
+		cells[0][side - 1] = GridWorld.CELL_EXIT
+		cells[side // 2][side // 2] = GridWorld.CELL_PIT
+		w = GridWorld(cells, discountFactor = 0.9 + i % 10 / 100)
+		w.setRewards(-0.04, -1, 1)
+		w.setProbabilities(0.8, 0.1, 0.1, 0)
+		w.setAlgorithmRestrictions(5 + i % 7 * 20, 60)	#some of them stop for the iterations
+		return w
+	
+	def stressSolve(i):
+		p = Policy(stressWorld(i), reporter = Reporter())
+		p.valueIterationEpsilon = 0.001 * (1 + i % 3)
+		(p.valueIteration, p.policyIteration, p.topologicalValueIteration)[i % 3]()
+		return (p.numOfIterations, p.stopReason, tuple(p.values))
+	
+	expected = [ stressSolve(i) for i in range(48) ]
+	sides = [ w.drawing_BoxSide for w in map(stressWorld, range(48)) ]
+	with ThreadPoolExecutor(8) as pool:
+		for _ in range(3):
+			results = list(pool.map(stressSolve, range(48)))
+			if results != expected: raise Exception("the concurrent solves don't match the sequential ones")
+	print("\nConcurrent solves: %d match, stop reasons %s, drawing sides kept: %s" % (len(results), sorted(set(r[1] for r in results)),
+		  sides == [ w.drawing_BoxSide for w in map(stressWorld, range(48)) ]))
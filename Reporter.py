@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import sys
+
+#===============================================================================
+# Reporters - where the solvers send their warnings, so that the Policy doesn't
+#	      depend on the graphical interface
+#===============================================================================
+
+class Reporter:
+	
+	'''the base reporter, it ignores all the warnings'''
+	
+	def warning(self, title, message):
+		pass
+
+class ConsoleReporter(Reporter):
+	
+	'''writes the warnings on a stream, by default the standard error'''
+	stream = None
+	
+	def __init__(self, stream = None):
+		self.stream = stream
+	
+	def warning(self, title, message):
+		print("warning: %s" % message, file = (self.stream or sys.stderr))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import numpy as np
+from GridWorld import GridWorld
+
+#===============================================================================
+# Simulator - Monte Carlo rollouts of a policy: many agents move at the same
+#	      time, one step of all of them is a few whole array operations on
+#	      the compiled TransitionModel of the world
+#===============================================================================
+
+class Rollouts:
+
+	'''the episodes simulated by Simulator.run, the arrays have one element for each episode: the state
+		where it started, its discounted return (the rewards of all the states it visited, the first and
+		the last included, like the utilities of Policy), its number of steps and how it ended
+	'''
+	OUTCOME_TRUNCATED = 0	#maxSteps reached (for example in a room without exits)
+	OUTCOME_EXIT      = 1
+	OUTCOME_PIT       = 2
+
+	__slots__ = ("world", "starts", "returns", "lengths", "outcomes")
+
+	def __init__(self, world, starts, returns, lengths, outcomes):
+		self.world = world
+		self.starts = starts
+		self.returns = returns
+		self.lengths = lengths
+		self.outcomes = outcomes
+
+	def perStart(self):
+		'''the statistics of the episodes of each start state, as a dictionary of arrays with an element
+			for each start state (in the order of the state indexes, see GridWorld.stateOfCell)
+		'''
+		states, index, episodes = np.unique(self.starts, return_inverse = True, return_counts = True)
+		def mean(values):
+			return np.bincount(index, weights = values, minlength = len(states)) / episodes
+		meanReturn = mean(self.returns)
+		res = {"state": states,
+			   "episodes": episodes,
+			   "meanReturn": meanReturn,
+			   "stdReturn": np.sqrt(np.maximum(mean(self.returns ** 2) - meanReturn ** 2, 0)),
+			   "meanLength": mean(self.lengths)}
+		for name, outcome in (("exitRate", Rollouts.OUTCOME_EXIT), ("pitRate", Rollouts.OUTCOME_PIT),
+							  ("truncatedRate", Rollouts.OUTCOME_TRUNCATED)):
+			res[name] = mean(self.outcomes == outcome)
+		return res
+
+	def returnsFrom(self, x, y):
+		'''the returns of the episodes started in the cell (x, y), their distribution'''
+		return self.returns[self.starts == self.world.stateOfCell[y * self.world.size[0] + x]]
+
+	def quantiles(self, x, y, q = (0.05, 0.25, 0.5, 0.75, 0.95)):
+		return np.quantile(self.returnsFrom(x, y), q)
+
+	def rates(self):
+		'''the fractions of all the episodes that ended in an exit, in a pit and that were truncated'''
+		n = max(len(self.outcomes), 1)
+		return tuple(np.count_nonzero(self.outcomes == o) / n
+					 for o in (Rollouts.OUTCOME_EXIT, Rollouts.OUTCOME_PIT, Rollouts.OUTCOME_TRUNCATED))
+
+class Simulator:
+
+	'''simulates the episodes of a policy (a Policy, or the action code of each state like Policy.policyCodes)
+		on its world. The rows of the TransitionModel of the actions of the policy (one for each state)
+		have at most 4 entries, so they are copied in tables with 4 columns: the next states, and the
+		thresholds of a uniform number u to choose each one (the probabilities of the entries before it).
+		The exits and the pits lead to themselves, with probability 1
+	'''
+
+	def __init__(self, world, policy, seed = None):
+		model = world.transitionModel()
+		self.world = world
+		self.rng = np.random.default_rng(seed)
+		codes = policy.policyCodes() if hasattr(policy, "policyCodes") else policy
+		actions = np.frombuffer(bytes(codes), dtype = np.uint8).astype(np.int64)
+		actions[actions > 3] = 0	#the NO_ACTION of the exits and the pits, they have no entries anyway
+		self.reward = np.frombuffer(model.reward)
+
+		#the entries of the row of the action of each state
+		n = world.numStates
+		rowPtr = np.frombuffer(model.rowPtr, dtype = model.rowPtr.typecode)
+		begin = rowPtr[np.arange(n) * 4 + actions]
+		counts = rowPtr[np.arange(n) * 4 + actions + 1] - begin
+		states = np.repeat(np.arange(n), counts)
+		column = np.arange(len(states)) - np.repeat(np.cumsum(counts) - counts, counts)
+		entries = begin[states] + column
+		self.next = np.repeat(np.arange(n), 4).reshape(n, 4)
+		self.next[states, column] = np.frombuffer(model.next, dtype = model.next.typecode)[entries]
+		self.next = self.next.ravel()
+		#u moves past the column j if it is at least the sum of the probabilities of the columns up to j,
+		#the last entry of a row has no threshold: it takes all the rest (and the rounding errors)
+		prob = np.frombuffer(model.prob)[entries]
+		cumulative = np.cumsum(prob)
+		inRow = cumulative - (cumulative - prob)[np.repeat(np.cumsum(counts) - counts, counts)]
+		notLast = column < counts[states] - 1
+		thresholds = np.full((3, n), 2.0)
+		thresholds[column[notLast], states[notLast]] = inRow[notLast]
+		self.thresholds = tuple(thresholds)
+
+		cells = np.frombuffer(world.cellCodes(), dtype = np.uint8)[np.frombuffer(world.cellOfState, dtype = np.int32)]
+		self.outcomeOf = np.full(world.numStates, Rollouts.OUTCOME_TRUNCATED, dtype = np.uint8)
+		self.outcomeOf[cells == GridWorld.CELL_EXIT] = Rollouts.OUTCOME_EXIT
+		self.outcomeOf[cells == GridWorld.CELL_PIT] = Rollouts.OUTCOME_PIT
+		self.voidStates = np.flatnonzero(cells == GridWorld.CELL_VOID)
+
+	def run(self, episodes, starts = None, maxSteps = 10000):
+		'''simulates the given number of episodes from each start, starts are cells (x, y) or, if None,
+			all the void cells. An episode ends in an exit, in a pit or after maxSteps steps, returns
+			the Rollouts
+		'''
+		c = self.world.size[0]
+		if starts is None: startStates = self.voidStates
+		else: startStates = np.array([ self.world.stateOfCell[y * c + x] for x, y in starts ], dtype = np.int64)
+		if np.any(startStates < 0): raise Exception("the walls can't be starting cells")
+		dfact = self.world.discFactor
+
+		first = np.repeat(startStates, episodes)
+		n = len(first)
+		returns = self.reward[first].copy()
+		lengths = np.zeros(n, dtype = np.int64)
+		outcomes = self.outcomeOf[first].copy()
+
+		#the agents of the episodes that didn't end yet: their episode, state, return and discount.
+		#The agents that end stay in their exit or pit with discount 0 (and walking False), they are
+		#removed from the arrays only when they are half of them
+		agents = np.flatnonzero(outcomes == Rollouts.OUTCOME_TRUNCATED)
+		state = first[agents]
+		gain = returns[agents]
+		discount = np.full(len(agents), float(dfact))
+		walking = np.ones(len(agents), dtype = bool)
+		numWalking = len(agents)
+		step = 0
+		while numWalking and step < maxSteps:
+			step += 1
+			u = self.rng.random(len(state))
+			t0, t1, t2 = self.thresholds
+			column = (u >= t0[state]).view(np.uint8) + (u >= t1[state]).view(np.uint8) + (u >= t2[state]).view(np.uint8)
+			state = self.next[state * 4 + column]
+			gain += discount * self.reward[state]
+			discount *= dfact
+
+			ended = self.outcomeOf[state] != Rollouts.OUTCOME_TRUNCATED
+			ended &= walking
+			numEnded = np.count_nonzero(ended)
+			if numEnded:
+				done = agents[ended]
+				lengths[done] = step
+				outcomes[done] = self.outcomeOf[state[ended]]
+				discount[ended] = 0
+				walking[ended] = False
+				numWalking -= numEnded
+				if numWalking <= len(agents) // 2:
+					returns[agents] = gain
+					agents, state, gain, discount = agents[walking], state[walking], gain[walking], discount[walking]
+					walking = np.ones(len(agents), dtype = bool)
+		returns[agents] = gain
+		lengths[agents[walking]] = maxSteps
+		return Rollouts(self.world, first, returns, lengths, outcomes)
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	from Policy import Policy
+	import time
+
+	w = GridWorld([[GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_EXIT],
+				   [GridWorld.CELL_VOID, GridWorld.CELL_WALL, GridWorld.CELL_VOID, GridWorld.CELL_PIT],
+				   [GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID, GridWorld.CELL_VOID]], discountFactor = 1)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(1000, 10)
+	p = Policy(w)
+	p.policyIteration()
+	r = Simulator(w, p, seed = 1).run(20000)
+	stats = r.perStart()
+	print("start  utility  mean return  exit rate  pit rate  mean length")
+	for i, s in enumerate(stats["state"]):
+		y, x = divmod(w.cellOfState[s], w.size[0])
+		print("(%d,%d)  %7.3f  %11.3f  %9.3f  %8.3f  %11.2f" % (x, y, p.values[s], stats["meanReturn"][i], stats["exitRate"][i],
+																 stats["pitRate"][i], stats["meanLength"][i]))
+	print("quantiles of the returns from (0,2): %s" % np.round(r.quantiles(0, 2), 3))
+
+	#a million episodes on a 200x200 map
+	cells = [ [ GridWorld.CELL_VOID ] * 200 for _ in range(200) ]
+	cells[0][199] = GridWorld.CELL_EXIT
+	for i in range(20, 180, 20): cells[i][i] = GridWorld.CELL_PIT
+	w = GridWorld(cells, discountFactor = 0.999)
+	w.setRewards(-0.002, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(10000, 600)
+	p = Policy(w, backend = Policy.BACKEND_NUMPY)
+	p.valueIteration()
+	sim = Simulator(w, p, seed = 0)
+	start = time.perf_counter()
+	r = sim.run(25)
+	exits, pits, truncated = r.rates()
+	print("\n%d episodes on 200x200 in %.2f secs: exit rate %.3f, pit rate %.3f, truncated %.3f, mean length %.1f" %
+		  (len(r.returns), time.perf_counter() - start, exits, pits, truncated, r.lengths.mean()))
+	stats = r.perStart()
+	#25 episodes for each start: the mean returns are near the utilities, not equal to them
+	print("mean difference between mean return and utility: %.4f" %
+		  np.mean(np.abs(stats["meanReturn"] - np.frombuffer(p.values)[stats["state"]])))
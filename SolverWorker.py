@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import queue
+import threading
+import time
+from array import array
+from Reporter import Reporter
+
+#===============================================================================
+# SolverWorker - runs an algorithm of a Policy in a background thread, and
+#		 publishes snapshots of its progress through a queue, so that
+#		 an interface can show them without waiting for the solve
+#===============================================================================
+
+class Snapshot:
+
+	'''the progress of a solve at one moment, values is a copy of the utilities of the states'''
+	__slots__ = ("iteration", "elapsed", "values", "ended", "converged", "stopReason", "sweepsSaved")
+
+	def __init__(self, policy, ended):
+		self.iteration = policy.numOfIterations
+		self.elapsed = policy.elapsed
+		self.values = array('d', policy.values)
+		self.ended = ended
+		self.converged = policy.converged if ended else False
+		self.stopReason = policy.stopReason if ended else None
+		self.sweepsSaved = policy.sweepsSaved if ended else 0
+
+class QueueReporter(Reporter):
+
+	'''sends the warnings of the solver to the queue of the worker, the interface shows them'''
+	def __init__(self, messages):
+		self.messages = messages
+
+	def warning(self, title, message):
+		self.messages.put(("warning", (title, message)))
+
+class SolverWorker(threading.Thread):
+
+	'''the messages of the queue are ("snapshot", Snapshot) and ("warning", (title, message)), the last
+		one is always the snapshot with ended = True (also when the solve is stopped)
+	'''
+	publishInterval = 0.05	#min seconds between two snapshots, the solver doesn't wait for them
+
+	def __init__(self, policy, algorithm, turbo = False):
+		threading.Thread.__init__(self, daemon = True)
+		if algorithm not in ("vi", "pi", "ps", "tvi", "mrvi"): raise Exception("unknown algorithm")
+		self.policy = policy
+		self.algorithm = algorithm
+		self.turbo = turbo
+		self.messages = queue.Queue()
+		self.__stop = threading.Event()
+		self.__lastPublish = 0
+
+	def stop(self):
+		'''asks the solver to stop at the end of its current iteration'''
+		self.__stop.set()
+
+	def stopping(self):
+		return self.__stop.is_set()
+
+	def __callback(self, policy, isEnded):
+		if isEnded: return False
+		now = time.perf_counter()
+		if now - self.__lastPublish >= self.publishInterval:
+			self.__lastPublish = now
+			self.messages.put(("snapshot", Snapshot(policy, False)))
+		return not self.__stop.is_set()
+
+	def run(self):
+		p = self.policy
+		reporter, p.reporter = p.reporter, QueueReporter(self.messages)
+		try:
+			if self.algorithm == "vi": p.valueIteration(self.__callback, self.turbo)
+			elif self.algorithm == "ps": p.prioritizedSweeping(self.__callback)
+			elif self.algorithm == "tvi": p.topologicalValueIteration(self.__callback)
+			elif self.algorithm == "mrvi": p.multiresolutionValueIteration(self.__callback)
+			else: p.policyIteration(self.__callback, self.turbo)
+		finally:
+			p.reporter = reporter
+			self.messages.put(("snapshot", Snapshot(p, True)))
+
+	def pending(self):
+		'''returns all the messages that are in the queue now, without waiting'''
+		res = []
+		while True:
+			try:
+				res.append(self.messages.get_nowait())
+			except queue.Empty:
+				return res
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	from GridWorld import GridWorld
+	from Policy import Policy
+
+	cells = [ [ GridWorld.CELL_VOID ] * 60 for _ in range(60) ]
+	cells[0][59] = GridWorld.CELL_EXIT
+	w = GridWorld(cells, discountFactor = 0.999)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(100000, 60)
+
+	for algorithm, stopAfter in (("vi", None), ("pi", 0.3), ("ps", 0.3), ("tvi", None), ("mrvi", 0.1)):
+		worker = SolverWorker(Policy(w), algorithm)
+		start = time.perf_counter()
+		worker.start()
+		snapshots, last = 0, None
+		while last is None or not last.ended:
+			time.sleep(0.1)
+			if stopAfter and time.perf_counter() - start > stopAfter: worker.stop()
+			for kind, payload in worker.pending():
+				if kind == "snapshot": snapshots, last = snapshots + 1, payload
+				else: print("warning: %s" % payload[1])
+		worker.join()
+		print("%s: %d snapshots, %d iterations, %s" % (algorithm, snapshots, last.iteration, last.stopReason))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import sys
+from GridWorld import GridWorld
+from Policy import Policy
+from WorldIO import readWorld
+import Headless
+
+#===============================================================================
+# Parameter sweep - solves the same world for every combination of step reward,
+#		    discount factor and forward/left/right probability, in a pool
+#		    of processes
+#===============================================================================
+
+def parseRange(text):
+	'''"a:b:step" is the range from a to b (included) with the given step,
+		"a,b,c" is a list of values and "a" a single value
+	'''
+	if ':' in text:
+		start, stop, step = (float(v) for v in text.split(':'))
+		if step <= 0: raise ValueError("the step of a range must be positive")
+		n = int(round((stop - start) / step + 1e-9))
+		return [ round(start + i * step, 12) for i in range(n + 1) ]
+	return [ float(v) for v in text.split(',') ]
+
+def parameterGrid(stepRewards, discounts, forwards, lefts, rights):
+	'''all the combinations of the parameters, the backward probability is what remains to reach 1
+		(the combinations whose probabilities are more than 1 are skipped)
+	'''
+	res = []
+	for stepReward, discount, forward, left, right in itertools.product(stepRewards, discounts, forwards, lefts, rights):
+		backward = 1 - forward - left - right
+		if backward < -1e-9: continue
+		res.append({"stepReward": stepReward, "discount": discount,
+					"forward": forward, "left": left, "right": right, "backward": max(0, backward)})
+	return res
+
+#each worker process builds its world only once, from the cells parsed by the parent
+_worker = {}
+
+def _initWorker(world, options):
+	cells, columns = world
+	_worker["world"] = GridWorld(cells, columns = columns)
+	_worker["options"] = options
+	_worker["policy"] = None
+
+def _solve(params):
+	'''solves the world of the worker with the given parameters'''
+	w, args = _worker["world"], _worker["options"]
+	w.setRewards(params["stepReward"], args.pit_reward, args.exit_reward)
+	w.setProbabilities(params["forward"], params["left"], params["right"], params["backward"])
+	w.setDiscountFactor(params["discount"])
+	w.setAlgorithmRestrictions(args.iterations, args.time)
+	if args.warm and _worker["policy"]:
+		#the policy of the worker starts from the results of its previous parameters
+		p = _worker["policy"]
+		p.resetResults()
+	else:
+		p = _worker["policy"] = Headless.newPolicy(w, args)
+	Headless.runSolver(p, args)
+	res = {"params": params}
+	res.update(Headless.policyResults(p))
+	return res
+
+def runSweep(world, params, options, out, processes = None):
+	'''solves the world for every set of parameters in a pool of processes, the results are written
+		on out as JSON lines as soon as they are ready (so not in the order of params).
+		world is the pair (cells, columns) returned by WorldIO.readWorld
+
+		returns the number of solved sets
+	'''
+	count = 0
+	chunksize = 1
+	if options.warm:
+		#consecutive parameters are close to each other, they go to the same worker
+		chunksize = max(1, len(params) // (4 * (processes or multiprocessing.cpu_count())))
+	with multiprocessing.Pool(processes, initializer = _initWorker, initargs = (world, options)) as pool:
+		for res in pool.imap_unordered(_solve, params, chunksize):
+			out.write(json.dumps(res) + "\n")
+			out.flush()
+			count += 1
+	return count
+
+def runBatch(world, params, options, out):
+	'''the same as runSweep, with all the parameters stacked in one BatchSolver, the results are written
+		at the end in the order of params. Returns the number of solved sets
+	'''
+	from BatchSolver import BatchSolver
+	cells, columns = world
+	w = GridWorld(cells, columns = columns)
+	w.setRewards(-0.04, options.pit_reward, options.exit_reward)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(options.iterations, options.time)
+	batch = BatchSolver(BatchSolver.parameterVariants(w, params))
+	batch.solve()
+	for b, p in enumerate(params):
+		res = {"params": p}
+		res.update(Headless.policyResults(batch.policy(b)))
+		out.write(json.dumps(res) + "\n")
+	out.flush()
+	return len(params)
+
+def sweepMain(argv):
+	'''the "sweep" command, returns the exit status'''
+	parser = argparse.ArgumentParser(prog = "mdp_grid_world sweep",
+									 description = "solve a world file for every combination of the parameters. "
+												   "The values are ranges \"start:stop:step\" or lists \"a,b,c\", "
+												   "write negative values as --step-reward=-0.04,-0.01")
+	parser.add_argument("world", metavar = "file", help = "world file")
+	parser.add_argument("--step-reward", type = parseRange, default = [-0.04])
+	parser.add_argument("--discount", type = parseRange, default = [1.0], help = "discount factor")
+	parser.add_argument("--forward", type = parseRange, default = [0.8], help = "forward probability")
+	parser.add_argument("--left", type = parseRange, default = [0.1], help = "left probability")
+	parser.add_argument("--right", type = parseRange, default = [0.1], help = "right probability")
+	parser.add_argument("--pit-reward", type = float, default = -1)
+	parser.add_argument("--exit-reward", type = float, default = 1)
+	parser.add_argument("--iterations", type = int, default = 1000, help = "max number of iterations")
+	parser.add_argument("--time", type = float, default = 60, help = "max calculation time (secs)")
+	Headless.addSolverArguments(parser)
+	parser.add_argument("--warm", action = "store_true", help = "each worker starts from the results of its previous parameters")
+	parser.add_argument("--batch", action = "store_true",
+						help = "solve all the parameters at once in this process with the value iteration of BatchSolver "
+							   "(requires numpy, the algorithm options are ignored)")
+	parser.add_argument("-j", "--processes", type = int, default = None, help = "number of processes (default: one for each core)")
+	parser.add_argument("-o", "--output", help = "output file (default: standard output)")
+	args = parser.parse_args(argv)
+	if args.backend == Policy.BACKEND_PARALLEL and not args.batch:
+		parser.error("the parallel backend is for one big world, the sweeps already solve a world in each process")
+
+	params = parameterGrid(args.step_reward, args.discount, args.forward, args.left, args.right)
+	world = readWorld(args.world)
+	out = open(args.output, 'w') if args.output else sys.stdout
+	try:
+		if args.batch: runBatch(world, params, args, out)
+		else: runSweep(world, params, args, out, args.processes)
+	finally:
+		if out is not sys.stdout: out.close()
+	return 0
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	sweepMain(["world.txt", "--step-reward=-0.04,-0.5", "--discount", "0.8:1:0.1", "--forward", "0.8,0.9", "--left", "0.1", "--right", "0,0.1", "-j", "2", "--backend", "numpy"])
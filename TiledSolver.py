@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import os
+import json
+import math
+import time
+import numpy as np
+from scipy import ndimage
+from GridWorld import GridWorld
+from NumpyBackend import blockedMasks, actionWeights, maxExpectedUtility
+from Policy import Policy
+import WorldIO
+
+#===============================================================================
+# TiledSolver - the value iteration of the worlds that don't fit in memory: the
+#		cells and the utilities are memory mapped files split in square
+#		tiles, the sweeps load one tile at a time with a border of one
+#		cell (the halo) taken from the tiles around it
+#===============================================================================
+
+class TiledSolver:
+
+	'''the tiles are stored one after the other (tile-major), so each one is a contiguous block of the
+		files, and the last row and column of tiles are filled up with walls: a wall stops the moves
+		like the border of the world, the results are the same. A visit of a tile sweeps it a few times
+		with the halo fixed, then writes it back, so the tiles visited later in a pass already use its
+		new utilities. A tile stays active while its utilities change more than the stopping threshold,
+		and it wakes up the tiles next to it when its own border changes: the tiles that converged are
+		skipped, the solve ends when no tile is active.
+		The void cells that can't reach an exit or a pit (see reachability) are pinned like the closed
+		states of TransitionModel, the sweeps don't update them.
+		The rewards, the probabilities, the discount factor and the limits are the ones of the GridWorld
+		parameters (its cells don't matter)
+	'''
+	CELLS_FILE     = "cells.bin"
+	REACH_FILE     = "reach.bin"
+	UTILITIES_FILE = "utilities.bin"
+	LAYOUT_FILE    = "layout.json"
+	TILE_SIZE      = 1024
+
+	__slots__ = ("directory",
+				 "columns",
+				 "rows",
+				 "tileSize",
+				 "tiles",				#(rows, columns) of tiles
+				 "cells",				#memory mapped, shape (tile rows, tile columns, tileSize, tileSize)
+				 "values",				#the same for the utilities
+				 "reach",				#the same, 1 for the exits, the pits and the void cells that reach them (see reachability)
+				 "parameters",
+				 "valueIterationEpsilon",	#of the bound stopping rule, see Policy
+				 "stopTolerance",			#absolute, with discount 1
+				 "localSweeps",			#max sweeps of a tile at each visit
+				 "numOfIterations",		#passes over the active tiles
+				 "tileVisits",
+				 "tileSweeps",
+				 "converged",
+				 "stopReason",			#one of the Policy.REASON_ constants
+				 "elapsed")
+
+	def __init__(self, directory, parameters, localSweeps = 4):
+		'''opens the tiled world written by create, fromWorldFile or fromCells in directory'''
+		with open(os.path.join(directory, TiledSolver.LAYOUT_FILE)) as file:
+			layout = json.load(file)
+		self.directory = directory
+		self.columns, self.rows, self.tileSize = layout["columns"], layout["rows"], layout["tileSize"]
+		self.tiles = (-(-self.rows // self.tileSize), -(-self.columns // self.tileSize))
+		shape = self.tiles + (self.tileSize, self.tileSize)
+		self.cells = np.memmap(os.path.join(directory, TiledSolver.CELLS_FILE), dtype = np.uint8, mode = 'r', shape = shape)
+		self.values = np.memmap(os.path.join(directory, TiledSolver.UTILITIES_FILE), dtype = np.float64, mode = 'r+', shape = shape)
+		self.reach = None
+		self.parameters = parameters
+		self.valueIterationEpsilon = Policy.VALUE_ITERATION_EPSILON
+		self.stopTolerance = 1e-6
+		if localSweeps < 1: raise Exception("localSweeps must be at least 1")
+		self.localSweeps = localSweeps
+		self.numOfIterations = self.tileVisits = self.tileSweeps = 0
+		self.converged = False
+		self.stopReason = None
+		self.elapsed = 0
+
+	#===========================================================================
+	# Tiled worlds
+	#===========================================================================
+
+	@staticmethod
+	def create(directory, rows, columns, numRows, tileSize = TILE_SIZE):
+		'''writes a tiled world in directory, rows yields the cell codes of each row (numRows of them,
+			columns cells each), so the whole world is never in memory. The utilities start from 0
+		'''
+		if tileSize < 2: raise Exception("the tiles must be at least 2x2")
+		os.makedirs(directory, exist_ok = True)
+		tiles = (-(-numRows // tileSize), -(-columns // tileSize))
+		shape = tiles + (tileSize, tileSize)
+		cells = np.memmap(os.path.join(directory, TiledSolver.CELLS_FILE), dtype = np.uint8, mode = 'w+', shape = shape)
+		line = np.full(tiles[1] * tileSize, GridWorld.CELL_WALL, dtype = np.uint8)
+		y = -1
+		for y, row in enumerate(rows):
+			if y >= numRows or len(row) != columns: raise Exception("the rows don't match the size of the world")
+			line[:columns] = np.frombuffer(bytes(row), dtype = np.uint8)
+			ty, oy = divmod(y, tileSize)
+			cells[ty, :, oy, :] = line.reshape(tiles[1], tileSize)
+		if y != numRows - 1: raise Exception("the rows don't match the size of the world")
+		#the rows of the last tiles after the end of the world
+		cells[-1, :, numRows - (tiles[0] - 1) * tileSize:, :] = GridWorld.CELL_WALL
+		cells.flush()
+		del cells
+		#a file of zeros, sparse where the file system allows it
+		with open(os.path.join(directory, TiledSolver.UTILITIES_FILE), "wb") as file:
+			file.truncate(int(np.prod(shape)) * 8)
+		with open(os.path.join(directory, TiledSolver.LAYOUT_FILE), "w") as file:
+			json.dump({"columns": columns, "rows": numRows, "tileSize": tileSize}, file)
+
+	@staticmethod
+	def fromWorldFile(file_path, directory, parameters, tileSize = TILE_SIZE, localSweeps = 4):
+		'''the TiledSolver of a world file (see WorldIO.readRows), read twice one row at a time: the
+			first time for its size, the second time to write the tiles
+		'''
+		numRows, columns = 0, None
+		for row in WorldIO.readRows(file_path):
+			numRows += 1
+			columns = len(row)
+		TiledSolver.create(directory, WorldIO.readRows(file_path), columns, numRows, tileSize)
+		return TiledSolver(directory, parameters, localSweeps)
+
+	@staticmethod
+	def fromCells(cells, columns, directory, parameters, tileSize = TILE_SIZE, localSweeps = 4):
+		'''the TiledSolver of the cell codes of a world in memory (see GridWorld.cellCodes)'''
+		numRows = len(cells) // columns
+		rows = (cells[y * columns:(y + 1) * columns] for y in range(numRows))
+		TiledSolver.create(directory, rows, columns, numRows, tileSize)
+		return TiledSolver(directory, parameters, localSweeps)
+
+	def __load(self, source, ty, tx, border):
+		'''the tile (ty, tx) of source with its halo, border fills the halo outside the world'''
+		T = self.tileSize
+		res = np.full((T + 2, T + 2), border, dtype = source.dtype)
+		res[1:-1, 1:-1] = source[ty, tx]
+		if ty > 0: res[0, 1:-1] = source[ty - 1, tx, -1, :]
+		if ty < self.tiles[0] - 1: res[-1, 1:-1] = source[ty + 1, tx, 0, :]
+		if tx > 0: res[1:-1, 0] = source[ty, tx - 1, :, -1]
+		if tx < self.tiles[1] - 1: res[1:-1, -1] = source[ty, tx + 1, :, 0]
+		return res
+
+	#===========================================================================
+	# Reachability
+	#===========================================================================
+
+	def reachability(self):
+		'''the mask of the cells that can reach an exit or a pit, written in REACH_FILE the first time. Every
+			action has a positive probability to go in some direction and the moves between two void
+			cells go both ways, so they are the void cells connected to an exit or a pit, and the mask
+			grows backwards from them one tile at a time: the void regions of a tile (ndimage.label)
+			that touch a reached cell, of the tile or of its halo, are reached, and the tiles next to a
+			border that changed are visited again, until no tile changes
+		'''
+		path = os.path.join(self.directory, TiledSolver.REACH_FILE)
+		shape = self.cells.shape
+		if os.path.exists(path):
+			self.reach = np.memmap(path, dtype = np.uint8, mode = 'r', shape = shape)
+			return self.reach
+
+		reach = np.memmap(path + ".tmp", dtype = np.uint8, mode = 'w+', shape = shape)
+		for ty in range(self.tiles[0]):
+			for tx in range(self.tiles[1]):
+				cells = np.asarray(self.cells[ty, tx])
+				reach[ty, tx] = (cells == GridWorld.CELL_EXIT) | (cells == GridWorld.CELL_PIT)
+		active = np.ones(self.tiles, dtype = bool)
+		while active.any():
+			awake = np.zeros(self.tiles, dtype = bool)
+			for ty, tx in np.argwhere(active):
+				self.__reachTile(reach, ty, tx, awake)
+			active = awake
+		reach.flush()
+		del reach
+		os.replace(path + ".tmp", path)
+		self.reach = np.memmap(path, dtype = np.uint8, mode = 'r', shape = shape)
+		return self.reach
+
+	def __reachTile(self, reach, ty, tx, awake):
+		'''grows the reached cells of the tile (ty, tx) from the ones of the tile and of its halo, marks in
+			awake the tiles next to a border that changed
+		'''
+		voids = np.asarray(self.cells[ty, tx]) == GridWorld.CELL_VOID
+		seeds = self.__load(reach, ty, tx, 0).astype(bool)
+		before = seeds[1:-1, 1:-1].copy()
+		touched = (seeds[:-2, 1:-1] | seeds[2:, 1:-1] | seeds[1:-1, :-2] | seeds[1:-1, 2:]) & voids
+		if not (touched & ~before).any(): return
+		labels, _ = ndimage.label(voids)
+		reached = np.isin(labels, np.unique(labels[touched])) & voids
+		now = before | reached
+		reach[ty, tx] = now
+
+		grown = now & ~before
+		if ty > 0 and grown[0, :].any(): awake[ty - 1, tx] = True
+		if ty < self.tiles[0] - 1 and grown[-1, :].any(): awake[ty + 1, tx] = True
+		if tx > 0 and grown[:, 0].any(): awake[ty, tx - 1] = True
+		if tx < self.tiles[1] - 1 and grown[:, -1].any(): awake[ty, tx + 1] = True
+
+	#===========================================================================
+	# Solve
+	#===========================================================================
+
+	def __threshold(self):
+		dfact = self.parameters.discFactor
+		if dfact == 1: return self.stopTolerance
+		return self.valueIterationEpsilon * (1 - dfact)/dfact
+
+	def solve(self):
+		'''runs the tiled value iteration, starting from the utilities in the file (so a solve that was
+			stopped goes on from where it was), returns the number of passes
+		'''
+		start = time.perf_counter()
+		world = self.parameters
+		dfact, weights = world.discFactor, actionWeights(world)
+		rewards = np.array([ world.rew[t] for t in range(4) ], dtype = float)
+		threshold = self.__threshold()
+		self.numOfIterations = self.tileVisits = self.tileSweeps = 0
+		self.converged = False
+
+		#the exits and the pits have their reward, the void cells that can't reach them collect the step
+		#reward forever, like the closed states of TransitionModel.fixedUtilities
+		reach = self.reachability()
+		r = world.rew[GridWorld.CELL_VOID]
+		if dfact < 1: forever = r / (1 - dfact)
+		else: forever = math.copysign(math.inf, r) if r else 0
+		for ty in range(self.tiles[0]):
+			for tx in range(self.tiles[1]):
+				cells = np.asarray(self.cells[ty, tx])
+				terminal = (cells == GridWorld.CELL_EXIT) | (cells == GridWorld.CELL_PIT)
+				if terminal.any(): np.copyto(self.values[ty, tx], rewards[cells], where = terminal)
+				closed = (cells == GridWorld.CELL_VOID) & (reach[ty, tx] == 0)
+				if closed.any(): np.copyto(self.values[ty, tx], forever, where = closed)
+
+		active = np.ones(self.tiles, dtype = bool)
+		while True:
+			awake = np.zeros(self.tiles, dtype = bool)
+			for ty, tx in np.argwhere(active):
+				self.__visit(ty, tx, dfact, weights, rewards, threshold, awake)
+			self.values.flush()
+			self.numOfIterations += 1
+			active = awake
+			self.elapsed = time.perf_counter() - start
+			if not active.any():
+				self.converged = True
+				self.stopReason = Policy.REASON_CONVERGED
+				break
+			if self.numOfIterations >= world.numberOfIterations:
+				self.stopReason = Policy.REASON_ITERATIONS
+				break
+			if self.elapsed > world.timeToLive:
+				self.stopReason = Policy.REASON_TIME
+				break
+		return self.numOfIterations
+
+	def __visit(self, ty, tx, dfact, weights, rewards, threshold, awake):
+		'''sweeps the tile (ty, tx) with its halo fixed, until it converges or localSweeps, and marks in
+			awake the tiles to visit in the next pass
+		'''
+		cells = self.__load(self.cells, ty, tx, GridWorld.CELL_WALL)
+		grid = self.__load(self.values, ty, tx, 0.0)
+		blocked = blockedMasks(cells == GridWorld.CELL_WALL)
+		#only the live cells of the tile are updated, the halo belongs to the tiles around it
+		voids = np.zeros(cells.shape, dtype = bool)
+		voids[1:-1, 1:-1] = (cells[1:-1, 1:-1] == GridWorld.CELL_VOID) & (self.reach[ty, tx] != 0)
+		if not voids.any(): return
+		reward = rewards[cells]
+		first = grid.copy()
+
+		self.tileVisits += 1
+		for _ in range(self.localSweeps):
+			#the pinned infinite utilities give nan where they are not used
+			with np.errstate(invalid = 'ignore'):
+				new = np.where(voids, reward + dfact * maxExpectedUtility(grid, blocked, weights), grid)
+				change = float(np.abs(new - grid).max(where = voids, initial = 0))
+			grid = new
+			self.tileSweeps += 1
+			if change <= threshold: break
+		else:
+			awake[ty, tx] = True
+		self.values[ty, tx] = grid[1:-1, 1:-1]
+
+		#the halos of the tiles around it changed
+		with np.errstate(invalid = 'ignore'):
+			moved = np.where(voids, np.abs(grid - first), 0)
+		if ty > 0 and moved[1, 1:-1].max() > threshold: awake[ty - 1, tx] = True
+		if ty < self.tiles[0] - 1 and moved[-2, 1:-1].max() > threshold: awake[ty + 1, tx] = True
+		if tx > 0 and moved[1:-1, 1].max() > threshold: awake[ty, tx - 1] = True
+		if tx < self.tiles[1] - 1 and moved[1:-1, -2].max() > threshold: awake[ty, tx + 1] = True
+
+	#===========================================================================
+	# Results
+	#===========================================================================
+
+	def utilities(self, x0 = 0, y0 = 0, x1 = None, y1 = None):
+		'''the utilities of the cells from (x0, y0) to (x1, y1) excluded as a 2-D array (the whole world
+			by default, only for the worlds that fit in memory), the walls are 0
+		'''
+		x1 = self.columns if x1 is None else x1
+		y1 = self.rows if y1 is None else y1
+		if not (0 <= x0 < x1 <= self.columns and 0 <= y0 < y1 <= self.rows): raise Exception("the window is outside the world")
+		T = self.tileSize
+		res = np.empty((y1 - y0, x1 - x0))
+		for ty in range(y0 // T, (y1 - 1) // T + 1):
+			for tx in range(x0 // T, (x1 - 1) // T + 1):
+				ya, yb = max(y0, ty * T), min(y1, (ty + 1) * T)
+				xa, xb = max(x0, tx * T), min(x1, (tx + 1) * T)
+				res[ya - y0:yb - y0, xa - x0:xb - x0] = self.values[ty, tx, ya - ty * T:yb - ty * T, xa - tx * T:xb - tx * T]
+		return res
+
+	def utilityAt(self, x, y):
+		T = self.tileSize
+		return float(self.values[y // T, x // T, y % T, x % T])
+
+	def policy(self):
+		'''a Policy of the whole world with the utilities of the solve (its greedy policy), for the worlds
+			that fit in memory
+		'''
+		T = self.tileSize
+		cells = self.cells.transpose(0, 2, 1, 3).reshape(self.tiles[0] * T, self.tiles[1] * T)[:self.rows, :self.columns]
+		world = GridWorld(bytearray(np.ascontiguousarray(cells).tobytes()), self.parameters.discFactor, self.columns)
+		world.setRewards(*(self.parameters.rew[t] for t in (GridWorld.CELL_VOID, GridWorld.CELL_PIT, GridWorld.CELL_EXIT)))
+		world.setProbabilities(*(self.parameters.prob[i] for i in (GridWorld.PROB_FORWARD, GridWorld.PROB_LEFT,
+																	GridWorld.PROB_RIGHT, GridWorld.PROB_BACKWARD)))
+		world.setAlgorithmRestrictions(self.parameters.numberOfIterations, self.parameters.timeToLive)
+		p = Policy(world)
+		values = self.utilities().ravel()[np.frombuffer(world.cellOfState, dtype = np.int32)]
+		p.loadResults(values)
+		p.numOfIterations = self.numOfIterations
+		p.converged = self.converged
+		p.stopReason = self.stopReason
+		p.elapsed = self.elapsed
+		return p
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	import random
+	import tempfile
+
+	random.seed(2)
+	cells = [ [ (GridWorld.CELL_WALL if random.random() < 0.2 else GridWorld.CELL_VOID) for _ in range(300) ] for _ in range(200) ]
+	cells[0][299] = GridWorld.CELL_EXIT
+	for _ in range(20): cells[random.randrange(200)][random.randrange(300)] = GridWorld.CELL_PIT
+	w = GridWorld(cells, discountFactor = 0.99)
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setAlgorithmRestrictions(100000, 600)
+
+	p = Policy(w, backend = Policy.BACKEND_NUMPY)
+	start = time.perf_counter()
+	p.valueIteration()
+	print("numpy: %d sweeps of %d cells in %.2f secs" % (p.numOfIterations, 300 * 200, time.perf_counter() - start))
+
+	with tempfile.TemporaryDirectory() as directory:
+		#the world goes through a file, one row at a time
+		path = os.path.join(directory, "world.txt")
+		WorldIO.writeWorld(path, w)
+		tiled = TiledSolver.fromWorldFile(path, os.path.join(directory, "tiles"), w, tileSize = 64)
+		tiled.solve()
+		print("tiled: %d passes, %d tile visits of %d tiles (the others skipped), %d tile sweeps (%.1f sweeps of the world) in %.2f secs, %s" %
+			  (tiled.numOfIterations, tiled.tileVisits, tiled.numOfIterations * tiled.tiles[0] * tiled.tiles[1], tiled.tileSweeps,
+			   tiled.tileSweeps / (tiled.tiles[0] * tiled.tiles[1]), tiled.elapsed, tiled.stopReason))
+		q = tiled.policy()
+		#both stop within epsilon of the fixed point, not at the same point: a few almost equal actions differ
+		print("max difference %.4f (epsilon %g), different actions: %d of %d states" %
+			  (max(abs(a - b) for a, b in zip(p.values, q.values)), p.valueIterationEpsilon,
+			   sum(a != b for a, b in zip(p.policyCodes(), q.policyCodes())), w.numStates))
+		print("utility of (298,0): %.4f, window %s" % (tiled.utilityAt(298, 0), np.round(tiled.utilities(297, 0, 300, 2), 3).tolist()))
+		#the solve goes on from the utilities in the file
+		print("solved again: %d pass" % tiled.solve())
+
+		#with discount 1 a closed room (here across the border of four tiles) never converges, it is pinned
+		cells = [ [ GridWorld.CELL_VOID ] * 40 for _ in range(40) ]
+		cells[0][39], cells[39][0] = GridWorld.CELL_EXIT, GridWorld.CELL_PIT
+		for i in range(12, 21): cells[12][i] = cells[20][i] = cells[i][12] = cells[i][20] = GridWorld.CELL_WALL
+		w = GridWorld(cells, discountFactor = 1)
+		w.setRewards(-0.04, -1, 1)
+		w.setProbabilities(0.8, 0.1, 0.1, 0)
+		w.setAlgorithmRestrictions(100000, 60)
+		p = Policy(w, backend = Policy.BACKEND_NUMPY)
+		p.valueIteration()
+		tiled = TiledSolver.fromCells(w.cellCodes(), 40, os.path.join(directory, "room"), w, tileSize = 16)
+		tiled.solve()
+		q = tiled.policy()
+		print("discount 1, closed room: %s after %d passes, %d unreachable cells, utility in the room %s, max difference %.4f" %
+			  (tiled.stopReason, tiled.numOfIterations, int(np.count_nonzero((np.asarray(tiled.reach) == 0) & (np.asarray(tiled.cells) == GridWorld.CELL_VOID))),
+			   tiled.utilityAt(16, 16), max((abs(a - b) for a, b in zip(p.values, q.values) if a != b), default = 0)))
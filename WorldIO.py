@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+###########################################
+# @author:	AbdAlMoniem AlHifnawy			#
+#														#
+# @email:	hifnawy_moniem@hotmail.com 	#
+#														#
+# @date:		Thu Dec 1 5:28:03 PM 			#
+###########################################
+
+import gzip
+import math
+import mmap
+import struct
+from array import array
+from GridWorld import GridWorld
+
+#===============================================================================
+# World files - rows of letters (v void, w wall, e exit, p pit), separated by
+#		spaces ("v v w e") or not ("vvwe"), optionally compressed with gzip
+#===============================================================================
+
+BAD_CELL = 0xff
+LETTERS = {b'v': GridWorld.CELL_VOID, b'w': GridWorld.CELL_WALL, b'e': GridWorld.CELL_EXIT, b'p': GridWorld.CELL_PIT}
+
+def _decodingTable():
+	'''the table of bytes.translate that maps the letters (in both cases) to the cell codes and
+		all the other characters to BAD_CELL
+	'''
+	table = bytearray([BAD_CELL]) * 256
+	for letter, code in LETTERS.items():
+		table[letter[0]] = table[letter.upper()[0]] = code
+	return bytes(table)
+
+DECODING_TABLE = _decodingTable()
+SEPARATORS = b" \t"
+
+def openWorldFile(file_path, mode = 'rb'):
+	'''opens a world file in binary mode, the gzip files are recognized by their first bytes'''
+	if 'r' in mode:
+		with open(file_path, 'rb') as f: compressed = f.read(2) == b'\x1f\x8b'
+	else:
+		compressed = file_path.endswith(".gz")
+	return gzip.open(file_path, mode) if compressed else open(file_path, mode)
+
+def readRows(file_path):
+	'''reads a world file one line at a time and yields the cell codes of each row (bytes), so the
+		worlds bigger than the memory can be copied somewhere else (see TiledSolver).
+		The blank lines are skipped, all the rows must have the same number of cells
+	'''
+	columns = None
+	with openWorldFile(file_path) as file:
+		for lineNumber, line in enumerate(file, 1):
+			line = line.rstrip()
+			if not line: continue
+			row = line.translate(DECODING_TABLE, SEPARATORS)
+			if BAD_CELL in row:
+				column = next(i for i, c in enumerate(line) if DECODING_TABLE[c] == BAD_CELL and c not in SEPARATORS)
+				raise Exception("%s:%d:%d: unknown cell %r" % (file_path, lineNumber, column + 1, chr(line[column])))
+			if columns is None:
+				columns = len(row)
+			elif len(row) != columns:
+				raise Exception("%s:%d: the row has %d cells, the previous rows have %d" % (file_path, lineNumber, len(row), columns))
+			yield row
+	if columns is None: raise Exception("%s: the world is empty" % file_path)
+
+def readWorld(file_path):
+	'''reads a world file one line at a time, decoding each line directly into a buffer of cell codes
+		(see readRows)
+
+		returns (cells, columns), cells is a bytearray with the rows one after the other
+	'''
+	cells = bytearray()
+	columns = None
+	for row in readRows(file_path):
+		if columns is None: columns = len(row)
+		cells += row
+	return cells, columns
+
+def loadWorld(file_path, discountFactor = 1):
+	'''reads a world file and returns its GridWorld'''
+	cells, columns = readWorld(file_path)
+	return GridWorld(cells, discountFactor = discountFactor, columns = columns)
+
+def parseWorld(file_path):
+	'''reads a world file and returns the matrix of the cells (a list of rows)'''
+	cells, columns = readWorld(file_path)
+	return [ list(cells[i : i + columns]) for i in range(0, len(cells), columns) ]
+
+def writeWorld(file_path, world, compact = True):
+	'''writes the cells of a world, without separators if compact is True (gzip compressed if the name
+		ends with .gz)
+	'''
+	letters = bytearray(256)
+	for letter, code in LETTERS.items(): letters[code] = letter[0]
+	c, r = world.size
+	cells = world.cellCodes()
+	with openWorldFile(file_path, 'wb') as file:
+		for y in range(r):
+			row = bytes(cells[y * c : (y + 1) * c]).translate(letters)
+			file.write((row if compact else b" ".join(row[i : i + 1] for i in range(c))) + b"\n")
+
+
+#===============================================================================
+# Binary files - the cells, the parameters and the results of a world, every
+#		 section is an array with one item for each cell (row major) that
+#		 is read through a memory map, only the pages that are used
+#===============================================================================
+
+BINARY_MAGIC = b"MDPGRID\0"
+BINARY_VERSION = 1
+#magic, version, has results, columns, rows, void/pit/exit rewards, forward/left/right/backward probabilities,
+#discount factor, max iterations, time to live, iterations, converged, then the offsets of the sections
+#cells (bytes), utilities (doubles), q-values (4 doubles), policy (bytes)
+BINARY_HEADER = struct.Struct("<8sIIII3d4ddIdI?3x4Q")
+
+def _align(offset):
+	return (offset + 7) & ~7
+
+def saveBinary(file_path, world, policy = None):
+	'''writes the world (its cells and its parameters) in the binary format, with the utilities,
+		the q-values and the policy of the solved Policy policy if it is given
+	'''
+	if world.rew is None or world.prob is None: raise Exception("the rewards and the probabilities of the world must be set")
+	c, r = world.size
+	n = c * r
+	offsets = [ BINARY_HEADER.size, 0, 0, 0 ]
+	if policy is not None:
+		offsets[1] = _align(offsets[0] + n)
+		offsets[2] = offsets[1] + 8 * n
+		offsets[3] = offsets[2] + 32 * n
+	p = world.prob
+	header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, policy is not None, c, r,
+								world.rew[GridWorld.CELL_VOID], world.rew[GridWorld.CELL_PIT], world.rew[GridWorld.CELL_EXIT],
+								p[GridWorld.PROB_FORWARD], p[GridWorld.PROB_LEFT], p[GridWorld.PROB_RIGHT], p[GridWorld.PROB_BACKWARD],
+								world.discFactor, getattr(world, "numberOfIterations", 0), getattr(world, "timeToLive", 0),
+								policy.numOfIterations if policy else 0, policy.converged if policy else False, *offsets)
+	with open(file_path, 'wb') as file:
+		file.write(header)
+		file.write(world.cellCodes())
+		if policy is None: return
+
+		utilities = array('d', bytes(8 * n))
+		qvalues = array('d', [math.nan]) * (4 * n)
+		actions = bytearray([policy.NO_ACTION]) * n
+		table = policy.qValueTable()
+		codes = policy.policyCodes()
+		for s, cell in enumerate(world.cellOfState):
+			utilities[cell] = policy.values[s]
+			qvalues[4 * cell : 4 * cell + 4] = table[4 * s : 4 * s + 4]
+			actions[cell] = codes[s]
+		file.write(bytes(offsets[1] - offsets[0] - n))
+		utilities.tofile(file)
+		qvalues.tofile(file)
+		file.write(actions)
+
+class BinaryResults:
+
+	'''a world saved with saveBinary, opened with a memory map: the queries of single cells or of
+		regions read only the pages they need. Use it with "with", or call close
+	'''
+	def __init__(self, file_path):
+		with open(file_path, 'rb') as file:
+			self.__map = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+		fields = BINARY_HEADER.unpack_from(self.__map)
+		if fields[0] != BINARY_MAGIC or fields[1] != BINARY_VERSION:
+			self.__map.close()
+			raise Exception("%s is not a binary world file of version %d" % (file_path, BINARY_VERSION))
+		self.hasResults = fields[2]
+		self.size = (fields[3], fields[4])
+		self.rewards = fields[5:8]			#void, pit, exit
+		self.probabilities = fields[8:12]	#forward, left, right, backward
+		self.discountFactor = fields[12]
+		self.restrictions = fields[13:15]	#max number of iterations, time to live
+		self.numOfIterations = fields[15]
+		self.converged = fields[16]
+
+		n = self.size[0] * self.size[1]
+		view = memoryview(self.__map)
+		self.__views = [ view[fields[17] : fields[17] + n] ]
+		self.cells = self.__views[0]
+		self.utilities = self.qvalues = self.actions = None
+		if self.hasResults:
+			self.__views += [ view[fields[18] : fields[18] + 8 * n].cast('d'),
+							  view[fields[19] : fields[19] + 32 * n].cast('d'),
+							  view[fields[20] : fields[20] + n] ]
+			_, self.utilities, self.qvalues, self.actions = self.__views
+		self.__views.append(view)
+
+	def close(self):
+		for view in reversed(self.__views): view.release()
+		self.__views = []
+		self.__map.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def __index(self, x, y):
+		c, r = self.size
+		if not (0 <= x < c and 0 <= y < r): raise Exception("the cell (%d, %d) is out of the world" % (x, y))
+		return y * c + x
+
+	def __results(self):
+		if not self.hasResults: raise Exception("the file has no results")
+
+	def cellAt(self, x, y):
+		return self.cells[self.__index(x, y)]
+
+	def utilityAt(self, x, y):
+		self.__results()
+		return self.utilities[self.__index(x, y)]
+
+	def actionAt(self, x, y):
+		'''the action of the policy in the cell (x, y), None if there is no action'''
+		self.__results()
+		a = self.actions[self.__index(x, y)]
+		return GridWorld.actionSet[a] if a < len(GridWorld.actionSet) else None
+
+	def qValuesAt(self, x, y):
+		'''the q-values of the cell (x, y) as a dictionary action -> value, None if there is no action'''
+		self.__results()
+		i = 4 * self.__index(x, y)
+		if math.isnan(self.qvalues[i]): return None
+		return dict(zip(GridWorld.actionSet, self.qvalues[i : i + 4]))
+
+	def region(self, x0, y0, x1, y1):
+		'''the rows of the cells from (x0, y0) to (x1, y1) excluded, each row a list of tuples
+			(cell, utility, action)
+		'''
+		self.__results()
+		c, _ = self.size
+		res = []
+		for y in range(y0, y1):
+			start, end = self.__index(x0, y), self.__index(x1 - 1, y) + 1
+			res.append([ (cell, u, (GridWorld.actionSet[a] if a < 4 else None))
+						 for cell, u, a in zip(self.cells[start:end], self.utilities[start:end], self.actions[start:end]) ])
+		return res
+
+	def toWorld(self):
+		'''the GridWorld of the file, with its parameters'''
+		w = GridWorld(self.cells, discountFactor = self.discountFactor, columns = self.size[0])
+		w.setRewards(*self.rewards)
+		w.setProbabilities(*self.probabilities)
+		w.setAlgorithmRestrictions(*self.restrictions)
+		return w
+
+	def toPolicy(self, world = None, **options):
+		'''a Policy of the world of the file (or of world, that must have the same cells) with the saved
+			results, the options are the ones of the Policy constructor
+		'''
+		from Policy import Policy
+		self.__results()
+		w = world if world is not None else self.toWorld()
+		p = Policy(w, **options)
+		cellOfState = w.cellOfState
+		p.loadResults(array('d', [ self.utilities[cell] for cell in cellOfState ]),
+					  array('B', [ self.actions[cell] for cell in cellOfState ]))
+		p.numOfIterations = self.numOfIterations
+		p.converged = self.converged
+		return p
+
+
+#===========================================================================
+# TEST
+#===========================================================================
+if __name__ == '__main__':
+
+	import os
+	import shutil
+	import tempfile
+	import time
+
+	w = loadWorld("world.txt")
+	print(w)
+	folder = tempfile.mkdtemp()
+	for name, compact in (("world.txt", False), ("world-compact.txt", True), ("world.txt.gz", True)):
+		path = os.path.join(folder, name)
+		writeWorld(path, w, compact)
+		print("%s: %d bytes, same cells: %s" % (name, os.path.getsize(path), str(loadWorld(path)) == str(w)))
+
+	for text in ("vvw\nvxe\n", "vvw\nve\n"):
+		path = os.path.join(folder, "bad.txt")
+		with open(path, 'w') as f: f.write(text)
+		try:
+			readWorld(path)
+		except Exception as e:
+			print(os.path.basename(str(e)))
+
+	n = 5000
+	path = os.path.join(folder, "big.txt")
+	with open(path, 'w') as f:
+		for _ in range(n): f.write("v" * (n - 1) + "e\n")
+	t = time.perf_counter()
+	cells, columns = readWorld(path)
+	print("%dx%d read in %.3f secs" % (columns, len(cells) // columns, time.perf_counter() - t))
+
+	from Policy import Policy
+	w.setRewards(-0.04, -1, 1)
+	w.setProbabilities(0.8, 0.1, 0.1, 0)
+	w.setDiscountFactor(0.9)
+	w.setAlgorithmRestrictions(1000, 10)
+	p = Policy(w)
+	p.policyIteration()
+	path = os.path.join(folder, "world.mdp")
+	saveBinary(path, w, p)
+	with BinaryResults(path) as f:
+		print("%s: %d bytes, %dx%d, discount %g" % (os.path.basename(path), os.path.getsize(path), f.size[0], f.size[1], f.discountFactor))
+		print(f.utilityAt(1, 0), f.actionAt(1, 0), f.qValuesAt(1, 0), f.actionAt(0, 0))
+		print(f.region(0, 0, 3, 2))
+		q = f.toPolicy()
+		print("same results: %s" % (q.utilityVectorToString() == p.utilityVectorToString() and q.policyToString() == p.policyToString()))
+	shutil.rmtree(folder)